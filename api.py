@@ -0,0 +1,379 @@
+import asyncio
+import json
+import math
+import weakref
+from datetime import date, timedelta
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+
+import data_handler as dh
+import data_store
+import metrics
+import periods
+import utils
+
+# A small JSON API over HTTP/1.1 for logging from phones, widgets or automations.
+# It serves the same shared stores as the app (see data_store), and check-ins arriving
+# together are saved as one write. Every route takes an optional ?user= like the app:
+#
+#   GET  /habits                  the user's habits
+#   GET  /streaks                 {habit_id: {current, longest, unit}}
+#   GET  /stats?days=30           streaks and completion rate per habit
+#                                 both take ?as_of=YYYY-MM-DD for how things stood on a past day
+#   POST /checkins                {"habit": name or id, "date": "YYYY-MM-DD", "completed": true}
+#                                 or a list of those; date defaults to today, completed to true.
+#                                 Measured habits take "value": 25 too; completed then defaults
+#                                 to whether the value reaches the habit's target
+#   GET  /metrics                 this process's metrics in the Prometheus text format
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class ApiError(Exception):
+    """
+    An error reported to the client as {"error": message} with an HTTP status
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class CheckinBatcher:
+    """
+    Collects the check-ins of one user and saves each batch with a single upsert
+    While a batch is being written new check-ins queue up, so under load a write
+    covers many requests. Once the queue is empty the batcher calls on_idle and stops
+    """
+
+    def __init__(self, user, on_idle):
+        self.user = user
+        self.on_idle = on_idle
+        self.handle = None
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def submit(self, rows):
+        """
+        Queue log rows and wait until they are saved; returns the change seq of the write
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((rows, future))
+        return await future
+
+    async def _run(self):
+        while not self.queue.empty():
+            batch = [self.queue.get_nowait()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            rows = [row for batch_rows, _ in batch for row in batch_rows]
+            try:
+                # Later check-ins for the same day win, as if written one by one
+                _, seq = await asyncio.to_thread(self._write, pd.DataFrame(rows, columns=dh.LOG_COLUMNS + [dh.LOG_VALUE_COLUMN]))
+            except Exception as e:
+                print(f"Error saving check-ins: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(ApiError(HTTPStatus.INTERNAL_SERVER_ERROR, "Could not save check-ins"))
+                continue
+
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(seq)
+
+        self.on_idle(self)
+
+    def _write(self, logs_df):
+        # Hold the store while this user is checking in, so it is not evicted between batches
+        if self.handle is None:
+            self.handle = data_store.acquire(self.user)
+        return self.handle.store.upsert_logs(logs_df)
+
+
+class HabitApi:
+    """
+    Routes requests to the shared stores; one instance per server
+    """
+
+    def __init__(self):
+        # Batchers of users with check-ins in flight, and habit lookups per store
+        self.batchers = {}
+        self.habit_lookups = weakref.WeakKeyDictionary()
+
+    async def submit_checkins(self, user, rows):
+        """
+        Save log rows through the user's batcher; returns the change seq of the write
+        """
+        batcher = self.batchers.get(user)
+        if batcher is None:
+            batcher = self.batchers[user] = CheckinBatcher(user, self.batcher_idle)
+        return await batcher.submit(rows)
+
+    def batcher_idle(self, batcher):
+        if self.batchers.get(batcher.user) is batcher:
+            del self.batchers[batcher.user]
+
+    async def dispatch(self, method, target, body):
+        """
+        Handle one request; returns (status, payload)
+        """
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        routes = {
+            ('GET', '/habits'): self.habits,
+            ('GET', '/streaks'): self.streaks,
+            ('GET', '/stats'): self.stats,
+            ('POST', '/checkins'): self.checkins,
+            ('GET', '/metrics'): self.metrics_text
+        }
+
+        route = routes.get((method, url.path.rstrip('/') or '/'))
+        if route is None:
+            if any(path == url.path for _, path in routes):
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not supported on {url.path}")
+            raise ApiError(HTTPStatus.NOT_FOUND, f"No route for {url.path}")
+
+        user = query.get('user')
+        try:
+            dh.user_dir(user)
+        except ValueError as e:
+            raise ApiError(HTTPStatus.BAD_REQUEST, str(e))
+
+        return HTTPStatus.OK, await route(user, query, body)
+
+    async def _store(self, user, refresh=True):
+        """
+        The user's shared store, loaded and refreshed off the event loop
+        """
+        def open_store():
+            handle = data_store.acquire(user)
+            if refresh:
+                handle.store.refresh()
+            return handle
+
+        handle = await asyncio.to_thread(open_store)
+        return handle.store
+
+    def habit_lookup(self, store):
+        """
+        {habit id or lower-cased name: habit id} for the store's current habits
+        Rebuilt only when the store's habits frame was replaced
+        """
+        habits_df, lookup = self.habit_lookups.get(store, (None, None))
+        if habits_df is not store.habits:
+            habits_df = store.habits
+            lookup = {name.lower(): habit_id for habit_id, name in zip(habits_df['id'], habits_df['name'])}
+            lookup.update({habit_id: habit_id for habit_id in habits_df['id']})
+            self.habit_lookups[store] = (habits_df, lookup)
+        return lookup
+
+    def as_of(self, query):
+        """
+        The ?as_of= day of a query as a date, or None
+        """
+        if not query.get('as_of'):
+            return None
+        try:
+            return date.fromisoformat(query['as_of'])
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "as_of must be a date (YYYY-MM-DD)")
+
+    async def habits(self, user, query, body):
+        store = await self._store(user)
+        return json.loads(store.habits.to_json(orient='records'))
+
+    async def streaks(self, user, query, body):
+        as_of = self.as_of(query)
+        store = await self._store(user)
+
+        def compute():
+            if as_of is None:
+                longest_streaks = periods.longest_streaks(store.habits, user)
+                current_streaks = store.current_streaks()
+            else:
+                table = utils.get_streaks(store.habits, store.logs, as_of, store.history_index())
+                longest_streaks, current_streaks = table['longest_streak'], table['current_streak']
+            return {
+                habit_id: {
+                    'current': int(current_streaks.get(habit_id, 0)),
+                    'longest': int(longest_streaks.get(habit_id, 0)),
+                    'unit': periods.streak_unit(frequency)
+                }
+                for habit_id, frequency in zip(store.habits['id'], store.habits['frequency'])
+            }
+
+        return await asyncio.to_thread(compute)
+
+    async def stats(self, user, query, body):
+        try:
+            days = int(query.get('days', 30))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "days must be a whole number")
+        if days < 1:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "days must be at least 1")
+        as_of = self.as_of(query)
+
+        store = await self._store(user)
+
+        def compute():
+            if as_of is not None:
+                return utils.get_habit_stats(store.habits, store.logs, days=days, as_of=as_of,
+                                             index=store.history_index())
+            store.ensure_logs_loaded(date.today() - timedelta(days=days - 1))
+            return utils.get_habit_stats(store.habits, store.logs, periods.longest_streaks(store.habits, user), days,
+                                         current_streaks=store.current_streaks())
+
+        return await asyncio.to_thread(compute)
+
+    async def checkins(self, user, query, body):
+        try:
+            checkins = json.loads(body or b'null')
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+        if isinstance(checkins, dict):
+            checkins = [checkins]
+        if not isinstance(checkins, list) or not checkins:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Body must be a check-in or a list of check-ins")
+
+        # Refreshing waits for a write in progress, so it is skipped unless a habit is
+        # missing (e.g. just added in the app); check-ins then queue up during writes
+        store = await self._store(user, refresh=False)
+        habit_lookup = self.habit_lookup(store)
+        wanted = [str(c.get('habit', c.get('habit_id', ''))) for c in checkins if isinstance(c, dict)]
+        if any(habit not in habit_lookup and habit.lower() not in habit_lookup for habit in wanted):
+            store = await self._store(user)
+            habit_lookup = self.habit_lookup(store)
+
+        targets = None
+        rows = []
+        for checkin in checkins:
+            if not isinstance(checkin, dict):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Each check-in must be an object")
+
+            habit = str(checkin.get('habit', checkin.get('habit_id', '')))
+            habit_id = habit_lookup.get(habit, habit_lookup.get(habit.lower()))
+            if habit_id is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"No habit named {habit!r}")
+
+            try:
+                day = date.fromisoformat(checkin.get('date') or date.today().isoformat()).isoformat()
+            except (TypeError, ValueError):
+                raise ApiError(HTTPStatus.BAD_REQUEST, f"Invalid date: {checkin.get('date')!r}")
+
+            value = checkin.get('value')
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                      or not math.isfinite(value)):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "value must be a number")
+
+            if 'completed' in checkin or value is None:
+                completed = checkin.get('completed', True)
+            else:
+                if targets is None:
+                    targets = dict(zip(store.habits['id'], utils.habit_targets(store.habits)))
+                completed = bool(utils.target_met([value], [targets[habit_id]])[0])
+            if not isinstance(completed, bool):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "completed must be true or false")
+
+            rows.append({'habit_id': habit_id, 'date': day, 'completed': completed, 'value': value})
+
+        seq = await self.submit_checkins(user, rows)
+        return {'saved': len(rows), 'seq': seq}
+
+    async def metrics_text(self, user, query, body):
+        # A str payload is sent as text rather than JSON
+        return metrics.render()
+
+
+async def read_request(reader):
+    """
+    Read one HTTP request; returns (method, target, headers, body) or None at end of stream
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+
+    method, target, version = request_line.decode('latin-1').split()
+    headers = {'version': version}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+def format_response(status, payload, keep_alive):
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), 'text/plain; version=0.0.4; charset=utf-8'
+    else:
+        body, content_type = json.dumps(payload).encode(), 'application/json'
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode('latin-1') + body
+
+
+async def handle_connection(api, reader, writer):
+    """
+    Serve requests on one connection, keeping it open between requests (HTTP/1.1)
+    """
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+
+                method, target, headers, body = request
+                keep_alive = headers['version'] == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, payload = await api.dispatch(method, target, body)
+            except ApiError as e:
+                status, payload = HTTPStatus(e.status), {'error': str(e)}
+            except ValueError:
+                status, payload = HTTPStatus.BAD_REQUEST, {'error': "Malformed request"}
+            except Exception as e:
+                print(f"Error handling request: {e}")
+                status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal error"}
+
+            writer.write(format_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host='127.0.0.1', port=8765):
+    """
+    Start serving on host:port and return the asyncio server
+    """
+    api = HabitApi()
+    return await asyncio.start_server(lambda r, w: handle_connection(api, r, w), host, port)
+
+
+async def serve(host='127.0.0.1', port=8765):
+    """
+    Serve until cancelled
+    """
+    server = await start_server(host, port)
+    data_store.start_rollover_job()
+    address = server.sockets[0].getsockname()
+    print(f"Serving the habit API on http://{address[0]}:{address[1]}")
+    async with server:
+        await server.serve_forever()
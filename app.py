@@ -1,12 +1,16 @@
+import time
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 import data_handler as dh
-import visualizations as vis
+import data_store
+import metrics
+import periods
+import profiling
 import utils
-import base64
-from PIL import Image
-import io
+
+# visualizations (and with it plotly) is imported where a chart is first rendered, so runs
+# that draw no chart never pay for it
 
 # Page configuration
 st.set_page_config(
@@ -16,6 +20,25 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Opt-in profiling (?profile=1, or HABIT_TRACKER_PROFILE=1 for every session): time this
+# session's reruns and show them in a Performance panel at the bottom of the sidebar.
+# Memory diagnostics (?memory=1 or HABIT_TRACKER_MEMORY=1) add allocations and sizes
+memory_diagnostics = st.query_params.get('memory') == '1' or profiling.MEMORY_ENABLED
+if 'profiler' not in st.session_state and (
+        memory_diagnostics or st.query_params.get('profile') == '1' or profiling.ENABLED):
+    st.session_state.profiler = profiling.Profiler(memory=memory_diagnostics)
+profiler = st.session_state.get('profiler')
+if profiler is not None:
+    profiler.activate()
+
+# Rerun durations for the metrics, which are written to HABIT_TRACKER_METRICS_FILE if set
+RERUN_SECONDS = metrics.histogram('habit_tracker_rerun_seconds', "Duration of full app reruns", ['page'])
+rerun_started = time.perf_counter()
+metrics.start_file_writer()
+
+# Precompute the cached stores' streaks after midnight, so the day's first render is warm
+data_store.start_rollover_job()
+
 
 # Custom CSS styles
 def local_css():
@@ -209,22 +232,82 @@ def local_css():
 # Apply custom CSS
 local_css()
 
-# Initialize session state if needed
-if 'habits' not in st.session_state:
-    # Try to load existing habits or create an empty DataFrame
+# Every session shares one process-wide copy of its user's data; the session holds only a
+# handle to it plus its own view state. The user comes from the ?user= query parameter;
+# without one the single-user data in the working directory is used
+if 'store_handle' not in st.session_state:
     try:
-        st.session_state.habits = dh.load_habits()
-    except:
-        st.session_state.habits = pd.DataFrame(columns=['id', 'name', 'category', 'frequency', 'created_at'])
-        dh.save_habits(st.session_state.habits)
+        st.session_state.store_handle = data_store.acquire(st.query_params.get('user'))
+    except ValueError as e:
+        st.error(f"Error opening habit data: {e}")
+        st.stop()
+    st.session_state.data_version = st.session_state.store_handle.store.version
 
-if 'logs' not in st.session_state:
-    # Try to load existing logs or create an empty DataFrame
-    try:
-        st.session_state.logs = dh.load_logs()
-    except:
-        st.session_state.logs = pd.DataFrame(columns=['habit_id', 'date', 'completed'])
-        dh.save_logs(st.session_state.logs)
+store = st.session_state.store_handle.store
+
+
+def record_write(versions):
+    """
+    Remember the data version after one of this session's writes
+    versions is the (previous_seq, seq) pair returned by the store; if another session
+    wrote in between, the old version is kept so this session is told about the change
+    """
+    previous_seq, seq = versions
+    if previous_seq == st.session_state.data_version:
+        st.session_state.data_version = seq
+
+
+def toggle_habit(habit_id, date):
+    """
+    Save a completion checkbox change
+    """
+    # Callbacks run before the script, so the rerun is recorded from here
+    if 'profiler' in st.session_state:
+        st.session_state.profiler.activate()
+
+    completed = st.session_state[f"check_{habit_id}"]
+    new_log = pd.DataFrame({'habit_id': [habit_id], 'date': [date], 'completed': [completed]})
+    record_write(st.session_state.store_handle.store.upsert_logs(new_log))
+
+
+def record_value(habit_id, date, target):
+    """
+    Save a measured habit's value; it counts as completed once it reaches the target
+    """
+    if 'profiler' in st.session_state:
+        st.session_state.profiler.activate()
+
+    value = st.session_state[f"value_{habit_id}"]
+    new_log = pd.DataFrame({
+        'habit_id': [habit_id],
+        'date': [date],
+        'completed': [bool(utils.target_met([value], [target])[0])],
+        'value': [value]
+    })
+    record_write(st.session_state.store_handle.store.upsert_logs(new_log))
+
+
+def is_measured(habit):
+    """
+    Whether a habit record is logged with a value rather than a yes/no checkbox
+    """
+    measure = habit.get('measure')
+    return not pd.isna(habit.get('target')) or (isinstance(measure, str) and measure != '')
+
+
+@st.fragment(run_every="5s")
+def watch_for_changes():
+    """
+    Rerun the app when another session saves changes
+    """
+    if dh.get_change_seq(st.session_state.store_handle.store.key) != st.session_state.data_version:
+        st.rerun()
+
+
+# Pick up changes saved by other sessions or processes
+if store.refresh() != st.session_state.data_version:
+    st.session_state.data_version = store.version
+    st.toast("Loaded changes saved in another session")
 
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = "Dashboard"
@@ -236,7 +319,7 @@ def get_icon_html(icon, size=24, color="#8BC34A"):
 
 
 # Sidebar for navigation with enhanced UI
-with st.sidebar:
+with st.sidebar, profiling.section('app: sidebar'):
     # Logo and title
     st.markdown(
         f'<div style="display: flex; align-items: center; margin-bottom: 20px;">'
@@ -276,14 +359,17 @@ with st.sidebar:
     st.markdown('<hr style="margin: 20px 0; border: none; height: 1px; background-color: #eee;">',
                 unsafe_allow_html=True)
 
+    # Poll for changes saved by other sessions
+    watch_for_changes()
+
     # Display basic stats in sidebar with enhanced UI
-    if not st.session_state.habits.empty:
+    if not store.habits.empty:
         st.markdown('<h3 style="color: #333; margin-bottom: 15px;">Quick Stats</h3>', unsafe_allow_html=True)
 
-        total_habits = len(st.session_state.habits)
-        if not st.session_state.logs.empty:
+        total_habits = len(store.habits)
+        if not store.logs.empty:
             today = datetime.now().strftime('%Y-%m-%d')
-            today_logs = st.session_state.logs[st.session_state.logs['date'] == today]
+            today_logs = store.logs[store.logs['date'] == today]
             completed_today = len(today_logs[today_logs['completed'] == True])
 
             # Custom metrics with nicer styling
@@ -311,13 +397,15 @@ with st.sidebar:
                     unsafe_allow_html=True
                 )
 
-            # Calculate and display longest streak
-            longest_streak = utils.get_longest_streak(st.session_state.habits, st.session_state.logs)
+            # Calculate and display longest streak from the saved per-month summaries
+            longest_streak = utils.get_longest_streak_from_summary(store.habits,
+                                                                   periods.longest_streaks(store.habits, store.key))
+            longest_unit = dict(zip(store.habits['name'], store.habits['frequency'])).get(longest_streak[0])
             if longest_streak[0] != "":
                 st.markdown(
                     f'<div class="stat-card">'
                     f'<div style="font-size: 0.9rem; color: #666;">Longest Streak</div>'
-                    f'<div style="font-size: 1.2rem; font-weight: bold; color: #333;">{longest_streak[1]} days</div>'
+                    f'<div style="font-size: 1.2rem; font-weight: bold; color: #333;">{periods.format_streak(longest_streak[1], periods.streak_unit(longest_unit))}</div>'
                     f'<div style="font-size: 0.9rem; color: #666;">{longest_streak[0]}</div>'
                     f'</div>',
                     unsafe_allow_html=True
@@ -340,7 +428,7 @@ if st.session_state.active_tab == "Dashboard":
         unsafe_allow_html=True
     )
 
-    if st.session_state.habits.empty:
+    if store.habits.empty:
         # Improved empty state
         st.markdown(
             '<div style="text-align: center; padding: 40px 20px; background-color: #F5F5F5; border-radius: 10px; margin: 20px 0;">'
@@ -356,9 +444,11 @@ if st.session_state.active_tab == "Dashboard":
 
         # Get habits
         habits_per_row = 3
-        all_habits = st.session_state.habits.to_dict('records')
+        current_streaks = store.current_streaks()
+        risk_scores = store.risk_scores()
+        all_habits = store.habits.set_index('id', drop=False).loc[risk_scores.index].to_dict('records')
 
-        # Group habits by category
+        # Group habits by category, riskiest first
         habits_by_category = {}
         for habit in all_habits:
             category = habit['category']
@@ -368,7 +458,7 @@ if st.session_state.active_tab == "Dashboard":
 
         # Habit stats summary
         total_habits = len(all_habits)
-        today_logs = st.session_state.logs[st.session_state.logs['date'] == today_str]
+        today_logs = store.logs[store.logs['date'] == today_str]
         completed_today = len(today_logs[today_logs['completed'] == True])
         completion_pct = int((completed_today / total_habits) * 100) if total_habits > 0 else 0
 
@@ -400,65 +490,63 @@ if st.session_state.active_tab == "Dashboard":
 
                         # Check if habit was completed today
                         completed = False
-                        existing_log = st.session_state.logs[
-                            (st.session_state.logs['habit_id'] == habit['id']) &
-                            (st.session_state.logs['date'] == today_str)
+                        existing_log = store.logs[
+                            (store.logs['habit_id'] == habit['id']) &
+                            (store.logs['date'] == today_str)
                             ]
 
+                        value = None
                         if not existing_log.empty:
                             completed = existing_log.iloc[0]['completed']
-
-                        with cols[j]:
-                            # Get streak information
-                            current_streak = utils.get_current_streak(habit['id'], st.session_state.logs)
+                            if 'value' in existing_log.columns and not pd.isna(existing_log.iloc[0]['value']):
+                                value = float(existing_log.iloc[0]['value'])
+
+                        with cols[j], profiling.section('app: dashboard habit card'):
+                            # Get streak and risk information
+                            current_streak = current_streaks.get(habit['id'], 0)
+                            risk = risk_scores.at[habit['id'], 'risk']
+                            risk_html = (
+                                f'<div style="font-size: 0.85rem; color: #E65100; margin-top: 5px;">'
+                                f'⚠️ {risk:.0%} risk of missing</div>'
+                                if risk >= utils.RISK_ALERT else ''
+                            )
 
                             # Create a card for each habit
                             st.markdown(
                                 f'<div class="card">'
                                 f'<div class="habit-name">{habit["name"]}</div>'
-                                f'<div class="streak-badge">🔥 {current_streak} day streak</div>',
+                                f'<div class="streak-badge">🔥 {current_streak} {periods.streak_unit(habit["frequency"])} streak</div>'
+                                f'{risk_html}',
                                 unsafe_allow_html=True
                             )
 
-                            # Create checkbox for marking habit completion
-                            if st.checkbox("Completed", value=completed, key=f"check_{habit['id']}"):
-                                # If checkbox is checked and no log exists for today, create one
-                                if existing_log.empty:
-                                    new_log = pd.DataFrame({
-                                        'habit_id': [habit['id']],
-                                        'date': [today_str],
-                                        'completed': [True]
-                                    })
-                                    st.session_state.logs = pd.concat([st.session_state.logs, new_log],
-                                                                      ignore_index=True)
-                                    dh.save_logs(st.session_state.logs)
-                                # If checkbox is checked and log exists but is marked incomplete, update it
-                                elif not existing_log.iloc[0]['completed']:
-                                    st.session_state.logs.loc[
-                                        (st.session_state.logs['habit_id'] == habit['id']) &
-                                        (st.session_state.logs['date'] == today_str),
-                                        'completed'
-                                    ] = True
-                                    dh.save_logs(st.session_state.logs)
+                            if is_measured(habit):
+                                # Measured habits take today's value instead; reaching the
+                                # target marks them completed
+                                target = habit.get('target')
+                                st.session_state[f"value_{habit['id']}"] = value or 0.0
+                                st.number_input(
+                                    f"Today ({habit.get('measure') or 'value'})", min_value=0.0, step=1.0,
+                                    key=f"value_{habit['id']}", on_change=record_value,
+                                    args=(habit['id'], today_str, target)
+                                )
+                                if not pd.isna(target):
+                                    st.caption(f"{'✅' if completed else '🎯'} Target: {target:g}")
                             else:
-                                # If checkbox is unchecked but a completed log exists, update it
-                                if not existing_log.empty and existing_log.iloc[0]['completed']:
-                                    st.session_state.logs.loc[
-                                        (st.session_state.logs['habit_id'] == habit['id']) &
-                                        (st.session_state.logs['date'] == today_str),
-                                        'completed'
-                                    ] = False
-                                    dh.save_logs(st.session_state.logs)
-                                # If checkbox is unchecked and no log exists, create one marked as incomplete
-                                elif existing_log.empty:
-                                    new_log = pd.DataFrame({
-                                        'habit_id': [habit['id']],
-                                        'date': [today_str],
-                                        'completed': [False]
-                                    })
-                                    st.session_state.logs = pd.concat([st.session_state.logs, new_log],
-                                                                      ignore_index=True)
-                                    dh.save_logs(st.session_state.logs)
+                                # Create checkbox for marking habit completion; it mirrors the saved
+                                # state and toggling it saves through the shared store
+                                st.session_state[f"check_{habit['id']}"] = bool(completed)
+                                st.checkbox("Completed", key=f"check_{habit['id']}",
+                                            on_change=toggle_habit, args=(habit['id'], today_str))
+
+                            # If no log exists for today, create one marked as incomplete
+                            if existing_log.empty:
+                                new_log = pd.DataFrame({
+                                    'habit_id': [habit['id']],
+                                    'date': [today_str],
+                                    'completed': [False]
+                                })
+                                record_write(store.upsert_logs(new_log))
 
                             # Close the card div
                             st.markdown('</div>', unsafe_allow_html=True)
@@ -471,10 +559,13 @@ if st.session_state.active_tab == "Dashboard":
         )
 
         # Create a card for the chart
-        st.markdown('<div class="card" style="padding: 20px;">', unsafe_allow_html=True)
-        fig = vis.create_calendar_heatmap(st.session_state.habits, st.session_state.logs)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        with profiling.section('app: dashboard heatmap'):
+            import visualizations as vis
+
+            st.markdown('<div class="card" style="padding: 20px;">', unsafe_allow_html=True)
+            fig = vis.create_calendar_heatmap(store.habits, store.logs)
+            st.plotly_chart(fig, use_container_width=True)
+            st.markdown('</div>', unsafe_allow_html=True)
 
 elif st.session_state.active_tab == "Manage Habits":
     # Modern title with icon
@@ -487,7 +578,7 @@ elif st.session_state.active_tab == "Manage Habits":
     # Create columns for layout
     col1, col2 = st.columns([1, 1])
 
-    with col1:
+    with col1, profiling.section('app: add habit form'):
         # Form for adding a new habit with improved styling
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.markdown('<h3 style="color: #333; margin-bottom: 20px; display: flex; align-items: center;">'
@@ -502,8 +593,8 @@ elif st.session_state.active_tab == "Manage Habits":
             category_options = default_categories.copy()
 
             # Add existing categories if they're not in the default list
-            if not st.session_state.habits.empty:
-                existing_categories = st.session_state.habits['category'].unique()
+            if not store.habits.empty:
+                existing_categories = store.habits['category'].unique()
                 for cat in existing_categories:
                     if cat not in category_options:
                         category_options.append(cat)
@@ -537,6 +628,15 @@ elif st.session_state.active_tab == "Manage Habits":
                 monthly = st.checkbox("Monthly", value=False, key="monthly_freq")
             with freq_cols[3]:
                 custom = st.checkbox("Custom", value=False, key="custom_freq")
+            custom_days = st.number_input("Custom: repeat every N days", min_value=2, max_value=365, value=2, step=1)
+
+            # Optional measurement, for habits logged as an amount (minutes, pages, glasses...)
+            measure_cols = st.columns(2)
+            with measure_cols[0]:
+                target = st.number_input("Target per day (optional)", min_value=0.0, value=0.0, step=1.0,
+                                         help="Leave at 0 for a yes/no habit")
+            with measure_cols[1]:
+                measure = st.text_input("Unit (optional)", placeholder="E.g., minutes")
 
             # Determine the frequency based on checkboxes
             if daily:
@@ -546,7 +646,7 @@ elif st.session_state.active_tab == "Manage Habits":
             elif monthly:
                 frequency = "Monthly"
             else:
-                frequency = "Custom"
+                frequency = periods.CUSTOM_FREQUENCY.format(days=int(custom_days))
 
             # Submit button for the form
             submit_button = st.form_submit_button(label="Add Habit")
@@ -560,12 +660,13 @@ elif st.session_state.active_tab == "Manage Habits":
                         'name': [habit_name],
                         'category': [category],
                         'frequency': [frequency],
-                        'created_at': [datetime.now().strftime('%Y-%m-%d')]
+                        'created_at': [datetime.now().strftime('%Y-%m-%d')],
+                        'target': [target or None],
+                        'measure': [measure]
                     })
 
                     # Add to session state and save
-                    st.session_state.habits = pd.concat([st.session_state.habits, new_habit], ignore_index=True)
-                    dh.save_habits(st.session_state.habits)
+                    record_write(store.upsert_habits(new_habit))
                     st.success(f"Added new habit: {habit_name}")
                     st.rerun()
                 else:
@@ -591,7 +692,7 @@ elif st.session_state.active_tab == "Manage Habits":
         )
 
     # Display existing habits for management
-    if not st.session_state.habits.empty:
+    if not store.habits.empty:
         st.subheader("Manage Existing Habits")
 
         # Add filters
@@ -601,16 +702,17 @@ elif st.session_state.active_tab == "Manage Habits":
             with col1:
                 filter_category = st.multiselect(
                     "Filter by Category",
-                    options=["All"] + list(st.session_state.habits['category'].unique()),
+                    options=["All"] + list(store.habits['category'].unique()),
                     default="All"
                 )
 
             # Apply filters
-            filtered_habits = st.session_state.habits.copy()
+            filtered_habits = store.habits
             if filter_category and "All" not in filter_category:
                 filtered_habits = filtered_habits[filtered_habits['category'].isin(filter_category)]
 
         # Display habits in a more modern UI
+        current_streaks = store.current_streaks()
         for _, habit in filtered_habits.iterrows():
             with st.expander(f"{habit['name']} ({habit['category']})", expanded=False):
                 col1, col2 = st.columns([3, 1])
@@ -622,8 +724,8 @@ elif st.session_state.active_tab == "Manage Habits":
                     st.write(f"**Created:** {habit['created_at']}")
 
                     # Display streak information
-                    current_streak = utils.get_current_streak(habit['id'], st.session_state.logs)
-                    st.write(f"**Current Streak:** {current_streak} days")
+                    current_streak = current_streaks.get(habit['id'], 0)
+                    st.write(f"**Current Streak:** {periods.format_streak(current_streak, periods.streak_unit(habit['frequency']))}")
 
                 with col2:
                     # Edit button
@@ -637,7 +739,7 @@ elif st.session_state.active_tab == "Manage Habits":
                         st.rerun()
 
                 # Display a mini log history
-                logs_for_habit = st.session_state.logs[st.session_state.logs['habit_id'] == habit['id']]
+                logs_for_habit = store.logs[store.logs['habit_id'] == habit['id']]
                 if not logs_for_habit.empty:
                     # Get the last 7 days of logs
                     last_7_days = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
@@ -659,7 +761,7 @@ elif st.session_state.active_tab == "Manage Habits":
 
     # Handle edit habit (if edit button was clicked)
     if 'edit_habit_id' in st.session_state:
-        habit_to_edit = st.session_state.habits[st.session_state.habits['id'] == st.session_state.edit_habit_id].iloc[0]
+        habit_to_edit = store.habits[store.habits['id'] == st.session_state.edit_habit_id].iloc[0]
 
         st.subheader(f"Edit Habit: {habit_to_edit['name']}")
 
@@ -671,7 +773,7 @@ elif st.session_state.active_tab == "Manage Habits":
             category_options = default_categories.copy()
 
             # Add existing categories
-            existing_categories = st.session_state.habits['category'].unique()
+            existing_categories = store.habits['category'].unique()
             for cat in existing_categories:
                 if cat not in category_options:
                     category_options.append(cat)
@@ -699,8 +801,9 @@ elif st.session_state.active_tab == "Manage Habits":
 
             # Find the index of the current frequency
             frequency_options = ["Daily", "Weekly", "Monthly", "Custom"]
+            current_kind, current_cycle = periods.parse_frequency(habit_to_edit['frequency'])
             try:
-                current_frequency_index = frequency_options.index(habit_to_edit['frequency'])
+                current_frequency_index = 3 if current_kind == 'cycle' else frequency_options.index(habit_to_edit['frequency'])
             except ValueError:
                 current_frequency_index = 0
 
@@ -709,6 +812,19 @@ elif st.session_state.active_tab == "Manage Habits":
                 options=frequency_options,
                 index=current_frequency_index
             )
+            custom_days = st.number_input("Custom: repeat every N days", min_value=2, max_value=365,
+                                          value=current_cycle if current_kind == 'cycle' else 2, step=1)
+            if frequency == "Custom":
+                frequency = periods.CUSTOM_FREQUENCY.format(days=int(custom_days))
+
+            current_target = habit_to_edit.get('target')
+            measure_cols = st.columns(2)
+            with measure_cols[0]:
+                target = st.number_input("Target per day (optional)", min_value=0.0, step=1.0,
+                                         value=0.0 if pd.isna(current_target) else float(current_target),
+                                         help="Leave at 0 for a yes/no habit")
+            with measure_cols[1]:
+                measure = st.text_input("Unit (optional)", value=habit_to_edit.get('measure') or '')
 
             update_button = st.form_submit_button(label="Update Habit")
             cancel_button = st.form_submit_button(label="Cancel")
@@ -716,12 +832,11 @@ elif st.session_state.active_tab == "Manage Habits":
             if update_button:
                 if new_name:
                     # Update the habit
-                    st.session_state.habits.loc[
-                        st.session_state.habits['id'] == st.session_state.edit_habit_id,
-                        ['name', 'category', 'frequency']
-                    ] = [new_name, category, frequency]
+                    updated_habit = store.habits[
+                        store.habits['id'] == st.session_state.edit_habit_id
+                    ].assign(name=new_name, category=category, frequency=frequency, target=target or None, measure=measure)
 
-                    dh.save_habits(st.session_state.habits)
+                    record_write(store.upsert_habits(updated_habit))
                     st.success(f"Updated habit: {new_name}")
 
                     # Clear the edit state and refresh
@@ -738,7 +853,7 @@ elif st.session_state.active_tab == "Manage Habits":
     # Handle delete habit (if delete button was clicked)
     if 'delete_habit_id' in st.session_state:
         habit_to_delete = \
-        st.session_state.habits[st.session_state.habits['id'] == st.session_state.delete_habit_id].iloc[0]
+        store.habits[store.habits['id'] == st.session_state.delete_habit_id].iloc[0]
 
         st.subheader(f"Delete Habit: {habit_to_delete['name']}")
         st.warning("Are you sure you want to delete this habit? This will also delete all log entries for this habit.")
@@ -746,17 +861,8 @@ elif st.session_state.active_tab == "Manage Habits":
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Yes, Delete"):
-                # Remove the habit
-                st.session_state.habits = st.session_state.habits[
-                    st.session_state.habits['id'] != st.session_state.delete_habit_id]
-
-                # Remove related log entries
-                st.session_state.logs = st.session_state.logs[
-                    st.session_state.logs['habit_id'] != st.session_state.delete_habit_id]
-
-                # Save both dataframes
-                dh.save_habits(st.session_state.habits)
-                dh.save_logs(st.session_state.logs)
+                # Remove the habit and its logs from the saved data and the shared copy
+                record_write(store.delete_habit(st.session_state.delete_habit_id))
 
                 # Clear the delete state and refresh
                 del st.session_state.delete_habit_id
@@ -777,7 +883,7 @@ elif st.session_state.active_tab == "Analytics":
         unsafe_allow_html=True
     )
 
-    if st.session_state.habits.empty or st.session_state.logs.empty:
+    if store.habits.empty or store.logs.empty:
         # Enhanced empty state for analytics
         st.markdown(
             '<div style="text-align: center; padding: 40px 20px; background-color: #F5F5F5; border-radius: 10px; margin: 20px 0;">'
@@ -811,6 +917,14 @@ elif st.session_state.active_tab == "Analytics":
                 min_value=start_date
             )
 
+        # Limit the analytics to some categories
+        all_categories = sorted(store.habits['category'].astype(str).unique())
+        selected_categories = st.multiselect("Categories", all_categories, default=all_categories,
+                                             key="analytics_categories")
+
+        # Older months are loaded only when the range reaches them
+        store.ensure_logs_loaded(start_date)
+
         # Display selected date range summary
         date_range_days = (end_date - start_date).days + 1
         st.markdown(
@@ -827,11 +941,16 @@ elif st.session_state.active_tab == "Analytics":
         end_date_str = end_date.strftime('%Y-%m-%d')
 
         # Filter logs by date range
-        filtered_logs = st.session_state.logs[
-            (st.session_state.logs['date'] >= start_date_str) &
-            (st.session_state.logs['date'] <= end_date_str)
+        filtered_logs = store.logs[
+            (store.logs['date'] >= start_date_str) &
+            (store.logs['date'] <= end_date_str)
             ]
 
+        # Habits of the selected categories, and only their logs
+        analytics_habits = store.habits[store.habits['category'].astype(str).isin(selected_categories)].reset_index(drop=True)
+        if len(analytics_habits) < len(store.habits):
+            filtered_logs = filtered_logs[filtered_logs['habit_id'].isin(analytics_habits['id'].unique())]
+
         if filtered_logs.empty:
             st.markdown(
                 '<div style="text-align: center; padding: 30px 20px; background-color: #F5F5F5; border-radius: 10px; margin: 20px 0;">'
@@ -861,9 +980,12 @@ elif st.session_state.active_tab == "Analytics":
             """
             st.markdown(tab_style, unsafe_allow_html=True)
 
-            tab1, tab2, tab3 = st.tabs(["📊 Completion Rates", "🔥 Streaks", "📆 Calendar View"])
+            import visualizations as vis
 
-            with tab1:
+            tab1, tab2, tab3, tab4, tab5 = st.tabs(
+                ["📊 Completion Rates", "🔥 Streaks", "📆 Calendar View", "🔗 Correlations", "🗂️ Categories"])
+
+            with tab1, profiling.section('app: analytics completion rates'):
                 st.markdown('<h2 class="sub-header">Habit Completion Rates</h2>', unsafe_allow_html=True)
                 st.markdown(
                     '<p style="color: #666; margin-bottom: 20px;">Compare how consistently you complete each habit</p>',
@@ -871,7 +993,7 @@ elif st.session_state.active_tab == "Analytics":
 
                 # Card for first chart
                 st.markdown('<div class="card" style="padding: 20px; margin-bottom: 25px;">', unsafe_allow_html=True)
-                completion_fig = vis.create_completion_chart(st.session_state.habits, filtered_logs)
+                completion_fig = vis.create_completion_chart(analytics_habits, filtered_logs, start_date_str, end_date_str)
                 st.plotly_chart(completion_fig, use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -879,19 +1001,40 @@ elif st.session_state.active_tab == "Analytics":
                 st.markdown('<div class="card" style="padding: 20px;">', unsafe_allow_html=True)
                 st.markdown('<h3 style="color: #333; margin-bottom: 15px;">Trend Over Time</h3>',
                             unsafe_allow_html=True)
-                trend_fig = vis.create_completion_trend(filtered_logs, start_date_str, end_date_str)
+                trend_fig = vis.create_completion_trend(analytics_habits, filtered_logs, start_date_str, end_date_str)
                 st.plotly_chart(trend_fig, use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
 
-            with tab2:
+                # Measured habits: totals and target hits over the range, shown once any are tracked
+                value_stats = utils.get_value_stats(analytics_habits, filtered_logs, start_date_str, end_date_str)
+                value_stats = value_stats[(value_stats['days'] > 0) | value_stats['target'].notna()]
+                if not value_stats.empty:
+                    st.markdown('<div class="card" style="padding: 20px; margin-top: 25px;">', unsafe_allow_html=True)
+                    st.markdown('<h3 style="color: #333; margin-bottom: 15px;">Measured Habits</h3>',
+                                unsafe_allow_html=True)
+                    value_fig = vis.create_value_trend(analytics_habits, filtered_logs, start_date_str, end_date_str)
+                    st.plotly_chart(value_fig, use_container_width=True)
+                    names = analytics_habits.set_index('id')['name']
+                    st.dataframe(
+                        value_stats.assign(habit=names.reindex(value_stats.index))[
+                            ['habit', 'days', 'total', 'mean', 'best', 'target', 'hits', 'hit_rate']
+                        ].rename(columns={'habit': 'Habit', 'days': 'Days Logged', 'total': 'Total', 'mean': 'Average',
+                                          'best': 'Best', 'target': 'Target', 'hits': 'Target Hits',
+                                          'hit_rate': 'Hit Rate (%)'}),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+                    st.markdown('</div>', unsafe_allow_html=True)
+
+            with tab2, profiling.section('app: analytics streaks'):
                 st.markdown('<h2 class="sub-header">Streak Analysis</h2>', unsafe_allow_html=True)
                 st.markdown('<p style="color: #666; margin-bottom: 20px;">Track your consistent habit performance</p>',
                             unsafe_allow_html=True)
 
                 # Calculate total habit data
-                total_habits = len(st.session_state.habits)
-                active_streaks = sum(1 for _, habit in st.session_state.habits.iterrows()
-                                     if utils.get_current_streak(habit['id'], st.session_state.logs) > 0)
+                total_habits = len(analytics_habits)
+                current_streaks = store.current_streaks()
+                active_streaks = sum(1 for habit_id in analytics_habits['id'] if current_streaks.get(habit_id, 0) > 0)
 
                 # Show summary cards
                 col1, col2, col3 = st.columns(3)
@@ -914,11 +1057,13 @@ elif st.session_state.active_tab == "Analytics":
                     )
 
                 with col3:
-                    longest_streak = utils.get_longest_streak(st.session_state.habits, st.session_state.logs)
+                    longest_streak = utils.get_longest_streak_from_summary(
+                        analytics_habits, periods.longest_streaks(analytics_habits, store.key))
+                    longest_unit = dict(zip(analytics_habits['name'], analytics_habits['frequency'])).get(longest_streak[0])
                     st.markdown(
                         f'<div class="card" style="padding: 15px; text-align: center;">'
                         f'<div style="font-size: 0.9rem; color: #666;">Longest Streak</div>'
-                        f'<div style="font-size: 1.7rem; font-weight: bold; color: #333;">{longest_streak[1]} days</div>'
+                        f'<div style="font-size: 1.7rem; font-weight: bold; color: #333;">{periods.format_streak(longest_streak[1], periods.streak_unit(longest_unit))}</div>'
                         f'<div style="font-size: 0.8rem; color: #777;">{longest_streak[0]}</div>'
                         f'</div>',
                         unsafe_allow_html=True
@@ -926,7 +1071,7 @@ elif st.session_state.active_tab == "Analytics":
 
                 # Card for streak chart
                 st.markdown('<div class="card" style="padding: 20px; margin-top: 20px;">', unsafe_allow_html=True)
-                streak_fig = vis.create_streak_chart(st.session_state.habits, st.session_state.logs)
+                streak_fig = vis.create_streak_chart(analytics_habits, store.logs)
                 st.plotly_chart(streak_fig, use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -937,15 +1082,17 @@ elif st.session_state.active_tab == "Analytics":
                     unsafe_allow_html=True
                 )
 
-                habits_need_attention = utils.get_habits_needing_attention(st.session_state.habits,
-                                                                           st.session_state.logs)
+                # Habits with a streak to lose, riskiest first
+                risk_scores = store.risk_scores()
+                risk_scores = risk_scores[risk_scores.index.isin(analytics_habits['id'])]
+                habits_need_attention = risk_scores[(risk_scores['current_streak'] >= 2) & (risk_scores['risk'] > 0)]
 
-                if habits_need_attention:
-                    for habit_name in habits_need_attention:
+                if not habits_need_attention.empty:
+                    for habit_name, risk in zip(habits_need_attention['name'], habits_need_attention['risk']):
                         st.markdown(
                             f'<div class="card" style="padding: 15px; background-color: #FFF3E0; margin-bottom: 10px;">'
                             f'<p style="margin: 0; color: #E65100;"><strong>Action needed:</strong> Your habit \'{habit_name}\' '
-                            f'is at risk of breaking its streak. Make sure to complete it today!</p>'
+                            f'is at risk of breaking its streak ({risk:.0%} risk of missing). Make sure to complete it today!</p>'
                             f'</div>',
                             unsafe_allow_html=True
                         )
@@ -958,7 +1105,17 @@ elif st.session_state.active_tab == "Analytics":
                         unsafe_allow_html=True
                     )
 
-            with tab3:
+                with st.expander("All habits by risk of missing"):
+                    st.dataframe(
+                        pd.DataFrame({
+                            'Habit': risk_scores['name'],
+                            'Risk': (risk_scores['risk'] * 100).round().astype(int).astype(str) + '%',
+                            'Current streak': risk_scores['current_streak']
+                        }),
+                        hide_index=True, use_container_width=True
+                    )
+
+            with tab3, profiling.section('app: analytics calendar'):
                 st.markdown('<h2 class="sub-header">Calendar View</h2>', unsafe_allow_html=True)
                 st.markdown(
                     '<p style="color: #666; margin-bottom: 20px;">See your habit completion patterns over time</p>',
@@ -971,13 +1128,13 @@ elif st.session_state.active_tab == "Analytics":
                 st.markdown('<p style="font-weight: 500; margin-bottom: 10px;">Select a habit to view:</p>',
                             unsafe_allow_html=True)
 
-                habit_options = st.session_state.habits['name'].tolist()
+                habit_options = analytics_habits['name'].tolist()
                 habit_options.insert(0, "All Habits")
 
                 # Create a row of buttons for habit selection
                 cols = st.columns(min(5, len(habit_options)))
 
-                if 'selected_calendar_habit' not in st.session_state:
+                if st.session_state.get('selected_calendar_habit') not in habit_options:
                     st.session_state.selected_calendar_habit = "All Habits"
 
                 for i, habit in enumerate(habit_options):
@@ -999,19 +1156,30 @@ elif st.session_state.active_tab == "Analytics":
 
                 if selected_habit == "All Habits":
                     # Show heatmap for all habits
-                    calendar_fig = vis.create_calendar_heatmap(st.session_state.habits, filtered_logs)
+                    calendar_fig = vis.create_calendar_heatmap(analytics_habits, filtered_logs)
                 else:
                     # Get the habit ID
-                    habit_id = st.session_state.habits[st.session_state.habits['name'] == selected_habit]['id'].iloc[0]
+                    habit_id = analytics_habits[analytics_habits['name'] == selected_habit]['id'].iloc[0]
 
                     # Show heatmap for selected habit
                     calendar_fig = vis.create_calendar_heatmap(
-                        st.session_state.habits[st.session_state.habits['id'] == habit_id],
+                        analytics_habits[analytics_habits['id'] == habit_id],
                         filtered_logs[filtered_logs['habit_id'] == habit_id]
                     )
 
                 st.plotly_chart(calendar_fig, use_container_width=True)
 
+                # Weekday and seasonal patterns over the selected range
+                st.markdown('<h3 style="color: #333; margin: 20px 0 10px;">Weekly and Seasonal Patterns</h3>',
+                            unsafe_allow_html=True)
+                pattern_by = st.radio("Show patterns for", ["Habits", "Categories"], horizontal=True,
+                                      key="pattern_by")
+                pattern_fig = vis.create_pattern_heatmap(
+                    analytics_habits, filtered_logs, start_date_str, end_date_str,
+                    by='name' if pattern_by == "Habits" else 'category'
+                )
+                st.plotly_chart(pattern_fig, use_container_width=True)
+
                 # Add calendar tips
                 st.markdown(
                     '<div style="background-color: #F9FBE7; padding: 15px; border-radius: 8px; margin-top: 20px;">'
@@ -1019,9 +1187,75 @@ elif st.session_state.active_tab == "Analytics":
                     '<ul style="color: #555; margin-bottom: 0;">'
                     '<li>Darker colors indicate higher completion rates</li>'
                     '<li>Hover over dates to see detailed statistics</li>'
-                    '<li>Look for patterns in your consistency</li>'
+                    '<li>Look for patterns in your consistency: the pattern heatmaps show your weakest '
+                    'weekdays and months</li>'
                     '</ul>'
                     '</div>',
                     unsafe_allow_html=True
                 )
                 st.markdown('</div>', unsafe_allow_html=True)
+
+            with tab4, profiling.section('app: analytics correlations'):
+                st.markdown('<h2 class="sub-header">Habits Completed Together</h2>', unsafe_allow_html=True)
+                st.markdown(
+                    '<p style="color: #666; margin-bottom: 20px;">See which habits you tend to complete on the '
+                    'same days and which ones you trade off against each other</p>',
+                    unsafe_allow_html=True)
+
+                st.markdown('<div class="card" style="padding: 20px;">', unsafe_allow_html=True)
+                correlation_fig = vis.create_correlation_heatmap(analytics_habits, filtered_logs, start_date_str,
+                                                                 end_date_str)
+                st.plotly_chart(correlation_fig, use_container_width=True)
+                st.markdown('</div>', unsafe_allow_html=True)
+
+            with tab5, profiling.section('app: analytics categories'):
+                st.markdown('<h2 class="sub-header">Category Overview</h2>', unsafe_allow_html=True)
+                st.markdown(
+                    '<p style="color: #666; margin-bottom: 20px;">Compare your categories by the share of due '
+                    'habits you completed</p>',
+                    unsafe_allow_html=True)
+
+                category_rollup = store.category_rollup(start_date_str, end_date_str, selected_categories)
+
+                st.markdown('<div class="card" style="padding: 20px; margin-bottom: 25px;">', unsafe_allow_html=True)
+                st.plotly_chart(vis.create_category_comparison(category_rollup), use_container_width=True)
+                st.markdown('</div>', unsafe_allow_html=True)
+
+                st.markdown('<div class="card" style="padding: 20px;">', unsafe_allow_html=True)
+                st.plotly_chart(vis.create_category_trend(category_rollup), use_container_width=True)
+                st.markdown('</div>', unsafe_allow_html=True)
+
+RERUN_SECONDS.observe(time.perf_counter() - rerun_started, page=st.session_state.active_tab)
+
+# Performance panel for sessions that opted in to profiling; it shows this rerun up to here
+if profiler is not None:
+    rerun = profiler.finish()
+    sections, caches = profiler.summary()
+
+    with st.sidebar.expander("⏱️ Performance"):
+        st.caption(f"Last rerun and the average of the last {len(profiler.history)}. "
+                   f"A section's time includes the sections it calls.")
+        st.dataframe(
+            pd.DataFrame(sections).round({'last_ms': 1, 'avg_ms': 1, 'avg_calls': 1}),
+            hide_index=True, use_container_width=True
+        )
+        if caches:
+            st.dataframe(
+                pd.DataFrame(caches).round({'hit_rate': 2, 'avg_hit_rate': 2}),
+                hide_index=True, use_container_width=True
+            )
+
+        if profiler.memory:
+            st.markdown("**Memory**")
+            st.caption(f"This rerun left {rerun.allocated / 1024:,.0f} KB allocated and peaked "
+                       f"{rerun.peak / 1024:,.0f} KB above its start (allocated_kb above is per section). "
+                       f"Lines that retained the most:")
+            if rerun.allocations:
+                st.dataframe(pd.DataFrame(rerun.allocations).round({'kb': 1}),
+                             hide_index=True, use_container_width=True)
+
+            # What this session holds; the store is shared by every session of the user
+            sizes = profiling.object_sizes(st.session_state.to_dict(), skip=(data_store.DataStore,))[:10]
+            sizes.append({'name': '(shared store)', 'kb': profiling.deep_size(store) / 1024, 'type': 'DataStore'})
+            st.caption("Largest objects in the session state, and the shared store:")
+            st.dataframe(pd.DataFrame(sizes).round({'kb': 1}), hide_index=True, use_container_width=True)
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import data_handler as dh
+import periods
+import reminders
+import rollups
+import synthetic_data
+import utils
+import visualizations as vis
+
+# Times data_handler, utils and the figure builders on synthetic datasets of growing size
+# and writes the results as JSON, so runs can be compared:
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json
+
+DEFAULT_HABITS = [10, 100, 1000]
+DEFAULT_YEARS = [1, 5, 10]
+
+
+def benchmark_cases(habits_df, logs_df):
+    """
+    Return the operations to time on one dataset as [(name, setup, run)]
+    setup (or None) runs untimed before each run, in the data directory
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    month_ago = (datetime.now() - timedelta(days=29)).strftime('%Y-%m-%d')
+    start = logs_df['date'].min() if not logs_df.empty else today
+    recent_logs = logs_df[logs_df['date'] >= month_ago]
+    habit_ids = list(habits_df['id'])
+    checkin = pd.DataFrame({'habit_id': [habit_ids[0]], 'date': [today], 'completed': [True]})
+
+    def clear():
+        for name in os.listdir('.'):
+            if os.path.isdir(name):
+                shutil.rmtree(name)
+            else:
+                os.remove(name)
+
+    measured_habits, measured_logs = synthetic_data.add_values(habits_df, logs_df)
+    recent_measured = measured_logs[measured_logs['date'] >= month_ago]
+    history = []
+
+    def history_index():
+        if not history:
+            history.append(periods.HistoryIndex(habits_df, logs_df))
+        return history[0]
+
+    rollup = []
+
+    def category_rollup():
+        if not rollup:
+            rollup.append(rollups.CategoryCube(habits_df, logs_df, start).frame(start, today))
+        return rollup[0]
+
+    def saved():
+        if not dh.log_months():
+            clear()
+            dh.save_habits(habits_df)
+            dh.save_logs(logs_df)
+
+    return [
+        ('data_handler.save_habits', clear, lambda: dh.save_habits(habits_df)),
+        ('data_handler.save_logs', clear, lambda: dh.save_logs(logs_df)),
+        ('data_handler.save_logs.unchanged', saved, lambda: dh.save_logs(logs_df)),
+        ('data_handler.load_habits', saved, dh.load_habits),
+        ('data_handler.load_logs', saved, dh.load_logs),
+        ('data_handler.load_logs.recent', saved, lambda: dh.load_logs(start_date=month_ago)),
+        ('data_handler.load_log_arrays', saved, dh.load_log_arrays),
+        ('data_handler.load_longest_streaks', saved, dh.load_longest_streaks),
+        ('data_handler.load_streak_index', saved, dh.load_streak_index),
+        ('data_handler.upsert_logs', saved, lambda: dh.upsert_logs(checkin)),
+        ('data_handler.save_logs.values', clear, lambda: dh.save_logs(measured_logs)),
+        ('periods.streaks', None, lambda: periods.streaks(habits_df, logs_df)),
+        ('periods.HistoryIndex', None, lambda: periods.HistoryIndex(habits_df, logs_df)),
+        ('periods.HistoryIndex.streaks', history_index, lambda: history_index().streaks(month_ago)),
+        ('periods.longest_streaks', saved, lambda: periods.longest_streaks(habits_df)),
+        ('utils.generate_id', None, utils.generate_id),
+        ('utils.get_current_streak', None, lambda: [utils.get_current_streak(h, logs_df) for h in habit_ids]),
+        ('utils.get_longest_streak', None, lambda: utils.get_longest_streak(habits_df, logs_df)),
+        ('utils.get_longest_streak_from_summary', saved,
+         lambda: utils.get_longest_streak_from_summary(habits_df, dh.load_longest_streaks())),
+        ('utils.get_habit_stats', saved,
+         lambda: utils.get_habit_stats(habits_df, logs_df, dh.load_longest_streaks())),
+        ('utils.get_co_completion', None, lambda: utils.get_co_completion(habits_df, logs_df, start, today)),
+        ('utils.get_completion_patterns', None,
+         lambda: utils.get_completion_patterns(habits_df, logs_df, start, today, by='category')),
+        ('utils.get_completion_likelihood', None, lambda: utils.get_completion_likelihood(habits_df, logs_df)),
+        ('utils.get_risk_scores', None, lambda: utils.get_risk_scores(habits_df, logs_df)),
+        ('utils.get_habits_needing_attention', None, lambda: utils.get_habits_needing_attention(habits_df, logs_df)),
+        ('utils.get_value_stats', None, lambda: utils.get_value_stats(measured_habits, measured_logs, start, today)),
+        ('reminders.find_at_risk', saved, lambda: reminders.find_at_risk([None])),
+        ('visualizations.create_calendar_heatmap', None, lambda: vis.create_calendar_heatmap(habits_df, logs_df)),
+        ('visualizations.create_completion_chart', None,
+         lambda: vis.create_completion_chart(habits_df, recent_logs, month_ago, today)),
+        ('visualizations.create_completion_trend', None,
+         lambda: vis.create_completion_trend(habits_df, recent_logs, month_ago, today)),
+        ('visualizations.create_correlation_heatmap', None,
+         lambda: vis.create_correlation_heatmap(habits_df, logs_df, start, today)),
+        ('visualizations.create_pattern_heatmap', None,
+         lambda: vis.create_pattern_heatmap(habits_df, logs_df, start, today)),
+        ('visualizations.create_value_trend', None,
+         lambda: vis.create_value_trend(measured_habits, recent_measured, month_ago, today)),
+        ('rollups.CategoryCube', None, lambda: rollups.CategoryCube(habits_df, logs_df, start).frame(start, today)),
+        ('visualizations.create_category_comparison', category_rollup,
+         lambda: vis.create_category_comparison(category_rollup())),
+        ('visualizations.create_category_trend', category_rollup,
+         lambda: vis.create_category_trend(category_rollup())),
+        ('visualizations.create_streak_chart', None, lambda: vis.create_streak_chart(habits_df, logs_df))
+    ]
+
+
+def time_case(setup, run, repeat):
+    """
+    Time run() up to `repeat` times; returns (best seconds, runs)
+    A run slower than a second is not repeated
+    """
+    best, runs = None, 0
+    while runs < repeat:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        runs += 1
+        if elapsed > 1:
+            break
+    return best, runs
+
+
+def run_benchmarks(habit_counts, year_counts, repeat=3, budget=10.0, only=None, seed=0):
+    """
+    Time every case on every dataset size, smallest first
+    A case slower than `budget` seconds is skipped on the larger datasets that follow
+    Returns a list of result dicts
+    """
+    results = []
+    over_budget = set()
+    sizes = sorted(((h, y) for h in habit_counts for y in year_counts), key=lambda size: size[0] * size[1])
+    original_dir = os.getcwd()
+
+    for habits, years in sizes:
+        habits_df, logs_df = synthetic_data.generate_dataset(habits, years, seed=seed)
+        data_dir = tempfile.mkdtemp(prefix='habit_benchmark_')
+        os.chdir(data_dir)
+
+        try:
+            for name, setup, run in benchmark_cases(habits_df, logs_df):
+                if only and not any(pattern in name for pattern in only):
+                    continue
+
+                result = {'name': name, 'habits': habits, 'years': years, 'rows': len(logs_df)}
+                if name in over_budget:
+                    result.update(status='skipped', seconds=None, runs=0)
+                else:
+                    try:
+                        seconds, runs = time_case(setup, run, repeat)
+                        result.update(status='ok', seconds=seconds, runs=runs)
+                        if seconds > budget:
+                            over_budget.add(name)
+                    except Exception as e:
+                        result.update(status='error', seconds=None, runs=0, error=f"{type(e).__name__}: {e}")
+
+                results.append(result)
+                print(format_result(result), flush=True)
+        finally:
+            os.chdir(original_dir)
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    return results
+
+
+def format_result(result, baseline=None):
+    size = f"{result['habits']:>5} habits {result['years']:>3}y {result['rows']:>9} rows"
+    if result['status'] != 'ok':
+        return f"{result['name']:<45} {size}  {result['status']} {result.get('error', '')}".rstrip()
+
+    line = f"{result['name']:<45} {size}  {result['seconds'] * 1e3:>11.2f} ms"
+    if baseline and baseline.get('seconds'):
+        line += f"  x{result['seconds'] / baseline['seconds']:.2f} vs baseline"
+    return line
+
+
+def environment():
+    """
+    Describe the machine and versions, stored with the results
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__
+    }
+
+
+def compare(results, baseline_path):
+    """
+    Print each result next to the matching result of an earlier run
+    """
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['name'], r['habits'], r['years']): r for r in json.load(f)['results']}
+
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        print(format_result(result, baseline.get((result['name'], result['habits'], result['years']))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark data_handler, utils and visualizations")
+    parser.add_argument('--habits', type=int, nargs='+', default=DEFAULT_HABITS, help="habit counts to test")
+    parser.add_argument('--years', type=int, nargs='+', default=DEFAULT_YEARS, help="years of history to test")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case; the fastest is kept (default: 3)")
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help="skip a case on larger datasets once it takes longer than this many seconds")
+    parser.add_argument('--only', nargs='+', help="only run cases whose name contains one of these")
+    parser.add_argument('--seed', type=int, default=0, help="synthetic data seed (default: 0)")
+    parser.add_argument('--output', default=f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                        help="JSON file to write the results to")
+    parser.add_argument('--compare', help="results file of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.habits, args.years, args.repeat, args.budget, args.only, args.seed)
+
+    report = {
+        'environment': environment(),
+        'settings': {'habits': args.habits, 'years': args.years, 'repeat': args.repeat,
+                     'budget': args.budget, 'seed': args.seed},
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import json
+import os
+import re
+import hashlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks (Windows): only sessions within this process are serialized
+    fcntl = None
+
+# Where the habit data is kept on disk. This module only uses the standard library, so
+# command-line check-ins can reach the data without importing pandas (see data_handler)
+
+# Define file paths for data storage, relative to the data directory of a user
+HABITS_FILE = 'habits.json'
+LOGS_FILE = 'logs.json'
+CHANGES_FILE = 'changes.jsonl'
+LOCK_FILE = '.habit_data.lock'
+
+# Logs queued by queue_logs, applied by data_handler the next time it accesses the data
+PENDING_FILE = 'pending.jsonl'
+
+# Each user's data lives in its own directory, USERS_DIR/<shard>/<user>, where the shard is
+# derived from a hash of the user key so no directory holds more than a slice of the users.
+# Without a user, data is kept in the working directory as before
+USERS_DIR = 'users'
+USER_SHARDS = 256
+USER_KEY_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.@-]{0,127}')
+
+
+def user_dir(user=None):
+    """
+    Return the directory holding a user's data ('' for the working directory when user is None)
+    Raises ValueError for keys that are not safe to use as a directory name
+    """
+    if user is None:
+        return ''
+
+    user = str(user)
+    if not USER_KEY_PATTERN.fullmatch(user):
+        raise ValueError(f"Invalid user key: {user!r}")
+
+    digest = hashlib.sha1(user.encode()).digest()
+    shard = int.from_bytes(digest[:4], 'big') % USER_SHARDS
+    return os.path.join(USERS_DIR, f'{shard:02x}', user)
+
+
+def list_users():
+    """
+    Return the keys of every user with a data directory, sorted
+    """
+    if not os.path.isdir(USERS_DIR):
+        return []
+    return sorted(
+        user for shard in os.listdir(USERS_DIR) if os.path.isdir(os.path.join(USERS_DIR, shard))
+        for user in os.listdir(os.path.join(USERS_DIR, shard))
+    )
+
+
+@contextmanager
+def file_lock(root):
+    """
+    Hold the advisory lock on LOCK_FILE in directory root, which serializes processes
+    Not re-entrant; within a process use data_handler's lock, which wraps this one
+    """
+    if root:
+        os.makedirs(root, exist_ok=True)
+
+    with open(os.path.join(root, LOCK_FILE), 'a') as lock_handle:
+        if fcntl:
+            fcntl.flock(lock_handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_handle, fcntl.LOCK_UN)
+
+
+def read_habits(user=None):
+    """
+    Return the saved habits as a list of dicts, without building a DataFrame
+    """
+    habits_file = os.path.join(user_dir(user), HABITS_FILE)
+    if not os.path.exists(habits_file):
+        return []
+
+    with open(habits_file, 'r') as f:
+        return json.load(f)
+
+
+def queue_logs(logs, user=None):
+    """
+    Queue log rows ({'habit_id', 'date', 'completed'} dicts, with an optional 'value') for saving
+    The rows are appended to PENDING_FILE under the file lock; data_handler merges them
+    into the logs by (habit_id, date) the next time it loads or saves data
+    """
+    root = user_dir(user)
+    lines = ''.join(json.dumps(log) + '\n' for log in logs)
+
+    with file_lock(root):
+        with open(os.path.join(root, PENDING_FILE), 'a') as f:
+            f.write(lines)
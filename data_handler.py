@@ -1,143 +1,1472 @@
 import pandas as pd
+import numpy as np
 import json
 import os
+import calendar
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
-# Define file paths for data storage
-HABITS_FILE = 'habits.json'
-LOGS_FILE = 'logs.json'
+from data_files import (
+    HABITS_FILE, LOGS_FILE, CHANGES_FILE, PENDING_FILE,
+    user_dir, file_lock
+)
+import metrics
+import profiling
 
+# Logs are stored as one JSON file per month plus a manifest describing them.
+# LOGS_FILE is only read to migrate data saved before partitioning
+LOGS_DIR = 'logs'
+LOGS_MANIFEST_FILE = os.path.join(LOGS_DIR, 'manifest.json')
 
-def save_habits(habits_df):
+# Columnar binary copy of the logs for fast, memory-mapped loading.
+# The JSON partitions remain the portable source of truth
+SNAPSHOT_DIR = os.path.join(LOGS_DIR, 'snapshot')
+SNAPSHOT_META_FILE = os.path.join(SNAPSHOT_DIR, 'meta.json')
+SNAPSHOT_COLUMNS = ('habit_code', 'day', 'completed', 'value')
+EPOCH_DAY = np.datetime64('1970-01-01', 'D')
+
+# {habit_id: [last completed day, streak ending on it]} for every habit, kept current by
+# every log write so reminders can find at-risk streaks without reading logs
+STREAK_INDEX_FILE = os.path.join(LOGS_DIR, 'streak_index.json')
+
+# Current streaks as of one day, saved by the rollover job (see data_store) so the first
+# render of the day does not have to compute them
+DAILY_SUMMARY_FILE = 'daily_summary.json'
+
+HABIT_COLUMNS = ['id', 'name', 'category', 'frequency', 'created_at', 'target', 'measure']
+LOG_COLUMNS = ['habit_id', 'date', 'completed']
+LOG_KEY_COLUMNS = ['habit_id', 'date']
+
+# Measured habits log an amount (minutes, glasses, ...) as well: an optional float32 'value'
+# column, NaN where nothing was measured, and per habit a float 'target' (NaN for yes/no
+# habits) with a 'measure' label. Frames only carry the value column when some log has a
+# value, and yes/no rows hash and serialize exactly as before, so existing data is untouched
+LOG_VALUE_COLUMN = 'value'
+
+# How a merge import resolves a log that differs between the backup and local data
+CONFLICT_POLICIES = ('incoming', 'local', 'completed')
+
+
+# One thread lock per data directory, so users never wait on each other's writes
+_locks = {}
+_locks_guard = threading.Lock()
+_lock_state = threading.local()
+
+# Sizes of data files as written: whole files for rewrites, appended bytes for the journal
+FILE_WRITE_BYTES = metrics.histogram(
+    'habit_tracker_file_write_bytes', "Bytes written per data file write", ['file'], buckets=metrics.SIZE_BUCKETS
+)
+
+
+@contextmanager
+def _data_lock(root):
     """
-    Save habits DataFrame to JSON file
+    Hold the exclusive lock on the data in directory root: a thread lock for sessions in
+    this process plus the advisory file lock for other processes.
+    Re-entrant within a thread
     """
-    # Convert DataFrame to JSON
-    habits_json = habits_df.to_json(orient='records')
+    with _locks_guard:
+        lock = _locks.setdefault(root, threading.RLock())
+
+    with lock:
+        depths = _lock_state.__dict__.setdefault('depths', {})
+        depth = depths.get(root, 0)
+        if depth > 0:
+            yield
+            return
+
+        with file_lock(root):
+            depths[root] = 1
+            try:
+                yield
+            finally:
+                depths[root] = 0
 
-    # Write to file
-    with open(HABITS_FILE, 'w') as f:
-        f.write(habits_json)
 
+def _temp_path(path):
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
 
-def load_habits():
+
+def _file_kind(path):
     """
-    Load habits from JSON file
-    Returns a DataFrame of habits
+    The file label for metrics: month partitions, their indexes and snapshot columns are grouped
     """
-    if not os.path.exists(HABITS_FILE):
-        # Return empty DataFrame if file doesn't exist
-        return pd.DataFrame(columns=['id', 'name', 'category', 'frequency', 'created_at'])
+    name = os.path.basename(path)
+    if name[:4].isdigit():
+        return 'partition index' if '.index' in name else 'partition'
+    if os.path.dirname(path).endswith(SNAPSHOT_DIR):
+        return 'snapshot'
+    return name
+
+
+def _write_atomic(path, content):
+    """
+    Write text to a temporary file and move it into place, so readers never see a partial file
+    """
+    temp_file = _temp_path(path)
+    with open(temp_file, 'w') as f:
+        f.write(content)
+        size = f.tell()
+    os.replace(temp_file, path)
+    FILE_WRITE_BYTES.observe(size, file=_file_kind(path))
+
+
+def _save_array_atomic(path, array):
+    """
+    np.save through a temporary file, like _write_atomic
+    """
+    temp_file = _temp_path(path)
+    with open(temp_file, 'wb') as f:
+        np.save(f, array)
+        size = f.tell()
+    os.replace(temp_file, path)
+    FILE_WRITE_BYTES.observe(size, file=_file_kind(path))
+
+
+def _normalize_dates(dates):
+    """
+    Coerce a column of dates to 'YYYY-MM-DD' strings
+    Older files may hold epoch milliseconds or timestamps written by to_json
+    """
+    if dates.empty:
+        return dates.astype(str)
+
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.strftime('%Y-%m-%d')
+
+    if pd.api.types.is_numeric_dtype(dates):
+        return pd.to_datetime(dates, unit='ms').dt.strftime('%Y-%m-%d')
+
+    # Fast path: the column already holds ISO date strings
+    as_str = dates.astype(str)
+    if (as_str.str.len() == 10).all():
+        return as_str
+
+    # Mixed column: epoch milliseconds next to strings or timestamps
+    numeric = pd.to_numeric(dates, errors='coerce')
+    parsed = pd.to_datetime(dates.where(numeric.isna()), errors='coerce', format='mixed')
+    parsed = parsed.fillna(pd.to_datetime(numeric, unit='ms'))
+    return parsed.dt.strftime('%Y-%m-%d')
+
+
+def _normalize_logs(logs_df):
+    """
+    Return a copy of logs with string ids, ISO date strings, boolean completion and, if
+    the logs have values, float32 values
+    """
+    has_values = LOG_VALUE_COLUMN in logs_df.columns and logs_df[LOG_VALUE_COLUMN].notna().any()
+    logs_df = logs_df.reindex(columns=LOG_COLUMNS + [LOG_VALUE_COLUMN] if has_values else LOG_COLUMNS)
+    logs_df['habit_id'] = logs_df['habit_id'].astype(str)
+    logs_df['date'] = _normalize_dates(logs_df['date'])
+    completed = logs_df['completed']
+    if completed.dtype != bool:
+        # mask rather than fillna: fillna downcasting object columns is deprecated
+        completed = completed.mask(completed.isna(), False)
+    logs_df['completed'] = completed.astype(bool)
+    if has_values:
+        logs_df[LOG_VALUE_COLUMN] = pd.to_numeric(logs_df[LOG_VALUE_COLUMN], errors='coerce').astype(np.float32)
+    return logs_df.reset_index(drop=True)
+
+
+def _hash_log_rows(logs_df):
+    """
+    Hash normalized log rows
+    Returns (key_hashes, row_hashes): one uint64 per row for its (habit_id, date) key
+    and one for its full content
+    """
+    key_hashes = pd.util.hash_pandas_object(logs_df[LOG_KEY_COLUMNS], index=False).to_numpy()
+    row_hashes = pd.util.hash_pandas_object(logs_df[LOG_COLUMNS], index=False).to_numpy()
+    if LOG_VALUE_COLUMN in logs_df.columns:
+        # Only rows with a value hash differently from a yes/no row
+        values = logs_df[LOG_VALUE_COLUMN]
+        measured = values.notna().to_numpy()
+        row_hashes = row_hashes.copy()
+        row_hashes[measured] += pd.util.hash_pandas_object(values[measured], index=False).to_numpy()
+    return key_hashes, row_hashes
+
+
+def _hash_sum(row_hashes):
+    """
+    Order-independent fingerprint of a set of row hashes
+    """
+    return int(np.sum(row_hashes, dtype=np.uint64))
+
+
+def _month_of(date):
+    """
+    Partition name ('YYYY-MM') for a date or 'YYYY-MM-DD' string
+    """
+    return str(date)[:7]
+
+
+def _previous_month(month):
+    """
+    Partition name of the month before `month`
+    """
+    year, mon = int(month[:4]), int(month[5:7])
+    return f'{year - 1}-12' if mon == 1 else f'{year}-{mon - 1:02d}'
+
+
+def _partition_path(root, month):
+    return os.path.join(root, LOGS_DIR, f'{month}.json')
+
+
+def _partition_index_path(root, month):
+    return os.path.join(root, LOGS_DIR, f'{month}.index.npy')
+
+
+def _save_manifest(root, manifest):
+    """
+    Write the partition manifest atomically
+    """
+    os.makedirs(os.path.join(root, LOGS_DIR), exist_ok=True)
+    _write_atomic(os.path.join(root, LOGS_MANIFEST_FILE), json.dumps(manifest))
+
+
+def _load_manifest(root):
+    """
+    Load the partition manifest: a 'version' bumped on every write and, per month,
+    its row count, content hash and per-habit streak summary
+    Logs saved before partitioning are migrated on first access, and logs queued by
+    data_files.queue_logs are applied first
+    """
+    _apply_pending(root)
+
+    manifest_file = os.path.join(root, LOGS_MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+
+    manifest = {'version': 0, 'partitions': {}}
+
+    if os.path.exists(os.path.join(root, LOGS_FILE)):
+        with _data_lock(root):
+            # Another session may have migrated while we waited for the lock
+            if os.path.exists(manifest_file):
+                return _load_manifest(root)
+
+            legacy_df = _load_legacy_logs(root)
+            _save_partitions(root, legacy_df, manifest, record=False)
+
+    return manifest
+
+
+def _partition_streaks(month, logs_df):
+    """
+    Summarize each habit's completed runs within one month as [prefix, suffix, best]:
+    the run starting on the 1st, the run ending on the last day and the longest run
+    Summaries of consecutive months combine into all-time streaks without loading logs
+    Also returns {habit_id: [day, run]}: the last day of the month the habit was completed
+    and the run ending on it, for habits completed at least once
+    """
+    if logs_df.empty:
+        return {}, {}
+
+    days = calendar.monthrange(int(month[:4]), int(month[5:7]))[1]
+    codes, habit_ids = pd.factorize(logs_df['habit_id'])
+    completed = logs_df['completed'].to_numpy(dtype=bool)
+    day_index = logs_df['date'].str[8:10].astype(int).to_numpy() - 1
+
+    # Habit x day completion matrix for the month
+    done = np.zeros((len(habit_ids), days), dtype=bool)
+    done[codes[completed], day_index[completed]] = True
+
+    # Length of the run ending on each day: completions since the last missed day
+    totals = np.cumsum(done, axis=1)
+    runs = totals - np.maximum.accumulate(np.where(done, 0, totals), axis=1)
+    prefix = np.where(done.all(axis=1), days, np.argmin(done, axis=1))
+    streaks = {
+        habit_id: [int(p), int(s), int(b)]
+        for habit_id, p, s, b in zip(habit_ids, prefix, runs[:, -1], runs.max(axis=1))
+    }
+
+    last_day = days - 1 - np.argmax(done[:, ::-1], axis=1)
+    last_runs = {
+        habit_id: [int(day) + 1, int(run)]
+        for habit_id, day, run, any_done in zip(
+            habit_ids, last_day, runs[np.arange(len(habit_ids)), last_day], done.any(axis=1)
+        )
+        if any_done
+    }
+    return streaks, last_runs
+
+
+def _write_partition(root, month, logs_df, key_hashes, row_hashes, manifest):
+    """
+    Write one month of normalized logs with its hash index and update its manifest entry
+    An empty month removes the partition
+    """
+    if logs_df.empty:
+        for path in (_partition_path(root, month), _partition_index_path(root, month)):
+            if os.path.exists(path):
+                os.remove(path)
+        manifest['partitions'].pop(month, None)
+        return
+
+    os.makedirs(os.path.join(root, LOGS_DIR), exist_ok=True)
+
+    # Months without values are written without the column
+    if LOG_VALUE_COLUMN in logs_df.columns and logs_df[LOG_VALUE_COLUMN].isna().all():
+        logs_df = logs_df.drop(columns=LOG_VALUE_COLUMN)
+    _write_atomic(_partition_path(root, month), logs_df.to_json(orient='records'))
+
+    # Hash index sorted by key hash, one (key, row) pair per log
+    order = np.argsort(key_hashes)
+    _save_array_atomic(_partition_index_path(root, month), np.column_stack([key_hashes[order], row_hashes[order]]))
+
+    streaks, last_runs = _partition_streaks(month, logs_df)
+    manifest['partitions'][month] = {
+        'rows': len(logs_df),
+        'hash': _hash_sum(row_hashes),
+        'version': manifest['version'] + 1,
+        'streaks': streaks,
+        'last': last_runs
+    }
+
+
+def _read_partition(root, month):
+    """
+    Load one month of logs as a normalized DataFrame
+    """
+    with open(_partition_path(root, month), 'r') as f:
+        logs_df = pd.DataFrame(json.loads(f.read()))
+    return _normalize_logs(logs_df)
+
+
+def _load_partition_index(root, month, entry):
+    """
+    Load a month's hash index, rebuilding it if it no longer matches the manifest
+    Returns (key_hashes, row_hashes) sorted by key hash
+    """
+    path = _partition_index_path(root, month)
+    if os.path.exists(path):
+        try:
+            index = np.load(path)
+            if len(index) == entry['rows'] and _hash_sum(index[:, 1]) == entry['hash']:
+                profiling.cache_lookup('logs index', True)
+                return index[:, 0], index[:, 1]
+        except Exception as e:
+            print(f"Error loading logs index for {month}: {e}")
+
+    profiling.cache_lookup('logs index', False)
+    key_hashes, row_hashes = _hash_log_rows(_read_partition(root, month))
+    order = np.argsort(key_hashes)
+    _save_array_atomic(path, np.column_stack([key_hashes[order], row_hashes[order]]))
+    return key_hashes[order], row_hashes[order]
+
+
+def _load_logs_index(root, manifest):
+    """
+    Merge the hash indexes of every partition
+    Returns (key_hashes, row_hashes) sorted by key hash
+    """
+    keys, rows = [np.array([], dtype=np.uint64)], [np.array([], dtype=np.uint64)]
+    for month, entry in manifest['partitions'].items():
+        month_keys, month_rows = _load_partition_index(root, month, entry)
+        keys.append(month_keys)
+        rows.append(month_rows)
+
+    keys, rows = np.concatenate(keys), np.concatenate(rows)
+    order = np.argsort(keys)
+    return keys[order], rows[order]
+
+
+def _save_partitions(root, logs_df, manifest, months=(), record=True):
+    """
+    Replace the saved partitions of every month present in logs_df, plus `months`
+    Months whose content hash is unchanged are not rewritten. Changed rows are
+    recorded in the change journal unless record is False
+    """
+    logs_df = _normalize_logs(logs_df)
+    key_hashes, row_hashes = _hash_log_rows(logs_df)
+    log_months = logs_df['date'].str[:7]
+    positions_by_month = log_months.groupby(log_months).indices
+    empty = np.array([], dtype=np.intp)
+
+    upserts, deletes = [], []
+    changed_frames = {}
+    changed_habits = set()
+
+    for month in sorted(set(positions_by_month) | set(months)):
+        positions = positions_by_month.get(month, empty)
+        month_keys, month_rows = key_hashes[positions], row_hashes[positions]
+        entry = manifest['partitions'].get(month)
+
+        if entry is None and len(positions) == 0:
+            continue
+        if entry and entry['rows'] == len(positions) and entry['hash'] == _hash_sum(month_rows):
+            continue
+
+        month_df = logs_df.iloc[positions]
+
+        if record:
+            # Diff against the month's hash index to find what changed
+            if entry:
+                index_keys, index_rows = _load_partition_index(root, month, entry)
+            else:
+                index_keys = index_rows = np.array([], dtype=np.uint64)
+            _, unchanged = _lookup_hashes(index_keys, index_rows, month_keys, month_rows)
+            upserts += json.loads(month_df[~unchanged].to_json(orient='records'))
+
+            removed = ~np.isin(index_keys, month_keys)
+            if removed.any():
+                # Only hashes are indexed, so read the old partition to name the removed rows
+                previous_df = _read_partition(root, month)
+                previous_keys, _ = _hash_log_rows(previous_df)
+                removed_df = previous_df.loc[np.isin(previous_keys, index_keys[removed]), LOG_KEY_COLUMNS]
+                deletes += removed_df.to_dict('records')
+
+        if entry:
+            changed_habits.update(entry['streaks'])
+        changed_habits.update(month_df['habit_id'].unique())
+
+        _write_partition(root, month, month_df, month_keys, month_rows, manifest)
+        changed_frames[month] = month_df
+
+    if changed_frames:
+        manifest['version'] += 1
+        # The index goes first: if the manifest is never saved, the version mismatch
+        # gets the index rebuilt by the next write
+        _save_streak_index(root, manifest, changed_habits, manifest['version'] - 1)
+        _save_manifest(root, manifest)
+        _splice_snapshot(root, manifest, changed_frames)
+        if record:
+            _record_changes(root, 'logs', upserts, deletes)
+
+
+def _month_last_runs(root, month, entry):
+    """
+    A partition's {habit_id: [last completed day of the month, run ending on it]}
+    Manifests written before these were kept get them from the partition, filled into entry
+    """
+    if 'last' not in entry:
+        entry['last'] = _partition_streaks(month, _read_partition(root, month))[1]
+    return entry['last']
+
+
+def _last_run(root, partitions, months, habit_id):
+    """
+    [last completed day, streak ending on it] for one habit, or None if it was never completed
+    months lists the partitions newest first; only the months the answer spans are read
+    """
+    for month in months:
+        entry = partitions[month]
+        if habit_id not in entry['streaks']:
+            continue
+        last = _month_last_runs(root, month, entry).get(habit_id)
+        if last is None:
+            continue
+
+        day, run = last
+        # A run from the 1st continues through the directly preceding months
+        extends, previous = run == day, _previous_month(month)
+        while extends and habit_id in partitions.get(previous, {}).get('streaks', {}):
+            prefix, suffix, _ = partitions[previous]['streaks'][habit_id]
+            run += suffix
+            extends = prefix == calendar.monthrange(int(previous[:4]), int(previous[5:7]))[1]
+            previous = _previous_month(previous)
+        return [f'{month}-{day:02d}', run]
+
+    return None
+
+
+def _read_streak_index(root):
+    """
+    Load the saved streak index {'version', 'habits'}, or None if missing or unreadable
+    """
+    index_file = os.path.join(root, STREAK_INDEX_FILE)
+    if not os.path.exists(index_file):
+        return None
 
     try:
-        with open(HABITS_FILE, 'r') as f:
-            habits_json = f.read()
+        with open(index_file, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading streak index: {e}")
+        return None
 
-        # Convert JSON to DataFrame
-        habits_df = pd.read_json(habits_json, orient='records')
 
-        # Ensure all required columns exist
-        required_columns = ['id', 'name', 'category', 'frequency', 'created_at']
-        for col in required_columns:
+def _save_streak_index(root, manifest, habit_ids=None, previous_version=None):
+    """
+    Update the streak index for habit_ids after a write that turned previous_version into
+    the manifest's version; rebuild it for every habit if it was not at previous_version
+    Returns the index's {habit_id: [last completed day, streak ending on it]}
+    """
+    index = _read_streak_index(root)
+    partitions = manifest['partitions']
+
+    if habit_ids is None or index is None or index.get('version') != previous_version:
+        habits = {}
+        habit_ids = {habit_id for entry in partitions.values() for habit_id in entry['streaks']}
+    else:
+        habits = index['habits']
+
+    months = sorted(partitions, reverse=True)
+    for habit_id in habit_ids:
+        last_run = _last_run(root, partitions, months, habit_id)
+        if last_run is None:
+            habits.pop(habit_id, None)
+        else:
+            habits[habit_id] = last_run
+
+    os.makedirs(os.path.join(root, LOGS_DIR), exist_ok=True)
+    _write_atomic(os.path.join(root, STREAK_INDEX_FILE), json.dumps({'version': manifest['version'], 'habits': habits}))
+    return habits
+
+
+def _columnar(logs_df, habit_ids, habit_codes):
+    """
+    Convert normalized logs to snapshot columns sorted by day
+    habit_ids/habit_codes map ids to codes and are extended with unseen ids
+    """
+    for habit_id in logs_df['habit_id'].unique():
+        if habit_id not in habit_codes:
+            habit_codes[habit_id] = len(habit_ids)
+            habit_ids.append(habit_id)
+
+    days = (pd.to_datetime(logs_df['date'], format='%Y-%m-%d').to_numpy().astype('datetime64[D]') - EPOCH_DAY)
+    days = days.astype(np.int32)
+    order = np.argsort(days, kind='stable')
+
+    if LOG_VALUE_COLUMN in logs_df.columns:
+        values = logs_df[LOG_VALUE_COLUMN].to_numpy(dtype=np.float32, na_value=np.nan)
+    else:
+        values = np.full(len(logs_df), np.nan, dtype=np.float32)
+
+    return {
+        'habit_code': logs_df['habit_id'].map(habit_codes).to_numpy(dtype=np.int32)[order],
+        'day': days[order],
+        'completed': logs_df['completed'].to_numpy(dtype=bool)[order],
+        'value': values[order]
+    }
+
+
+def _open_snapshot(root):
+    """
+    Memory-map the snapshot columns
+    Returns (meta, columns) or None if there is no usable snapshot. Columns are mapped
+    copy-on-write, so callers may modify frames built on them without touching the files
+    """
+    meta_file = os.path.join(root, SNAPSHOT_META_FILE)
+    paths = {name: os.path.join(root, SNAPSHOT_DIR, f'{name}.npy') for name in SNAPSHOT_COLUMNS}
+    if not os.path.exists(meta_file) or not all(os.path.exists(path) for path in paths.values()):
+        # Snapshots written before a column was added are rebuilt like missing ones
+        return None
+
+    try:
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+
+        mmap_mode = 'c' if meta['rows'] > 0 else None
+        columns = {name: np.load(path, mmap_mode=mmap_mode) for name, path in paths.items()}
+        if any(len(column) != meta['rows'] for column in columns.values()):
+            return None
+
+        return meta, columns
+    except Exception as e:
+        print(f"Error opening logs snapshot: {e}")
+        return None
+
+
+def _write_snapshot(root, meta, columns):
+    """
+    Write snapshot columns, then the meta file that makes them current
+    """
+    os.makedirs(os.path.join(root, SNAPSHOT_DIR), exist_ok=True)
+
+    for name in SNAPSHOT_COLUMNS:
+        _save_array_atomic(os.path.join(root, SNAPSHOT_DIR, f'{name}.npy'), columns[name])
+
+    _write_atomic(os.path.join(root, SNAPSHOT_META_FILE), json.dumps(meta))
+
+
+def _snapshot_current(snapshot, manifest):
+    """
+    Whether a snapshot (see _open_snapshot) holds the manifest's version of every month
+    """
+    return snapshot is not None and all(
+        snapshot[0]['partitions'].get(month, {}).get('version') == entry['version']
+        for month, entry in manifest['partitions'].items()
+    )
+
+
+def _splice_snapshot(root, manifest, month_frames):
+    """
+    Bring the snapshot up to date after the months in month_frames were rewritten
+    Unchanged months are copied over from the current snapshot as binary slices; months the
+    snapshot lacks or holds an older version of are read from their JSON partitions, so a
+    missing or outdated snapshot is rebuilt
+    """
+    snapshot = _open_snapshot(root)
+    meta, columns = snapshot if snapshot else ({'habit_ids': [], 'partitions': {}}, None)
+
+    month_frames = dict(month_frames)
+    for month, entry in manifest['partitions'].items():
+        if month not in month_frames and meta['partitions'].get(month, {}).get('version') != entry['version']:
+            month_frames[month] = _read_partition(root, month)
+
+    habit_ids = list(meta['habit_ids'])
+    habit_codes = {habit_id: code for code, habit_id in enumerate(habit_ids)}
+    pieces, partitions, rows = [], {}, 0
+
+    for month in sorted(manifest['partitions']):
+        if month in month_frames:
+            piece = _columnar(month_frames[month], habit_ids, habit_codes)
+        else:
+            bounds = meta['partitions'][month]
+            piece = {name: columns[name][bounds['start']:bounds['stop']] for name in SNAPSHOT_COLUMNS}
+
+        count = len(piece['day'])
+        partitions[month] = {'start': rows, 'stop': rows + count, 'version': manifest['partitions'][month]['version']}
+        pieces.append(piece)
+        rows += count
+
+    new_columns = {
+        'habit_code': np.concatenate([p['habit_code'] for p in pieces] or [np.array([], dtype=np.int32)]),
+        'day': np.concatenate([p['day'] for p in pieces] or [np.array([], dtype=np.int32)]),
+        'completed': np.concatenate([p['completed'] for p in pieces] or [np.array([], dtype=bool)]),
+        'value': np.concatenate([p['value'] for p in pieces] or [np.array([], dtype=np.float32)])
+    }
+    _write_snapshot(root, {'rows': rows, 'habit_ids': habit_ids, 'partitions': partitions}, new_columns)
+
+
+def _snapshot_frame(meta, columns, start, stop):
+    """
+    Wrap rows start..stop of the snapshot in a logs DataFrame
+    habit_id is a categorical over the mapped codes and completed (and value, if any row
+    has one) a view of the mapped column; only the date strings are materialized, via a
+    lookup of the distinct days
+    """
+    days = columns['day'][start:stop]
+    if len(days) == 0:
+        return pd.DataFrame(columns=LOG_COLUMNS)
+
+    first_day = int(days[0])
+    date_strings = np.datetime_as_string(
+        np.arange(first_day, int(days[-1]) + 1).astype('datetime64[D]')
+    ).astype(object)
+
+    frame = {
+        'habit_id': pd.Categorical.from_codes(columns['habit_code'][start:stop], categories=meta['habit_ids']),
+        'date': date_strings[days - first_day],
+        'completed': columns['completed'][start:stop]
+    }
+    values = columns['value'][start:stop]
+    if not np.isnan(values).all():
+        frame[LOG_VALUE_COLUMN] = values
+    return pd.DataFrame(frame, copy=False)
+
+
+@profiling.timed
+def save_snapshot(user=None):
+    """
+    Rebuild the columnar snapshot from the JSON partitions
+    Normally the snapshot is kept current by every log write, and load_logs repairs one that
+    is missing or outdated; this recreates it from scratch, e.g. after it was damaged
+    """
+    root = user_dir(user)
+    with _data_lock(root):
+        manifest = _load_manifest(root)
+        months = sorted(manifest['partitions'])
+        _splice_snapshot(root, manifest, {m: _read_partition(root, m) for m in months})
+
+
+def _refresh_snapshot(root, read_frames):
+    """
+    Bring a missing or outdated snapshot up to date after a load read months from JSON
+    read_frames is {month: (version, logs)} of the partitions that load read; those still
+    at that version are reused rather than read again
+    """
+    try:
+        with _data_lock(root):
+            # Another session may have refreshed it while we waited for the lock
+            manifest = _load_manifest(root)
+            if _snapshot_current(_open_snapshot(root), manifest):
+                return
+
+            partitions = manifest['partitions']
+            _splice_snapshot(root, manifest, {
+                month: logs_df for month, (version, logs_df) in read_frames.items()
+                if partitions.get(month, {}).get('version') == version
+            })
+    except Exception as e:
+        print(f"Error rebuilding logs snapshot: {e}")
+
+
+@profiling.timed
+def load_log_arrays(user=None):
+    """
+    Return the raw snapshot columns for vectorized analytics, without building a DataFrame
+    Returns (habit_ids, habit_code, day, completed): habit_code indexes habit_ids and day
+    counts days since 1970-01-01. The arrays are memory-mapped and sorted by day
+    """
+    root = user_dir(user)
+    manifest = _load_manifest(root)
+    snapshot = _open_snapshot(root)
+    fresh = _snapshot_current(snapshot, manifest)
+    profiling.cache_lookup('snapshot', fresh)
+    if not fresh:
+        _refresh_snapshot(root, {})
+        snapshot = _open_snapshot(root)
+
+    if snapshot is None:
+        empty = np.array([], dtype=np.int32)
+        return [], empty, empty, np.array([], dtype=bool)
+
+    meta, columns = snapshot
+    return meta['habit_ids'], columns['habit_code'], columns['day'], columns['completed']
+
+
+def _lookup_hashes(index_keys, index_rows, key_hashes, row_hashes):
+    """
+    Look up rows in a sorted hash index
+    Returns boolean arrays (known, unchanged): whether each row's key is in the index
+    and whether its content hash matches the indexed one
+    """
+    if len(index_keys) == 0:
+        known = np.zeros(len(key_hashes), dtype=bool)
+        return known, known
+
+    positions = np.minimum(np.searchsorted(index_keys, key_hashes), len(index_keys) - 1)
+    known = index_keys[positions] == key_hashes
+    unchanged = known & (index_rows[positions] == row_hashes)
+    return known, unchanged
+
+
+@profiling.timed
+def get_change_seq(user=None):
+    """
+    Return the sequence number of the last recorded change, 0 if nothing was recorded
+    """
+    root = user_dir(user)
+    _apply_pending(root)
+    return _change_seq(root)
+
+
+def _change_seq(root):
+    changes_file = os.path.join(root, CHANGES_FILE)
+    if not os.path.exists(changes_file):
+        return 0
+
+    with open(changes_file, 'rb') as f:
+        # Entries are short, so the last one fits in the tail of the file
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().split(b'\n')
+
+    # The last element is empty unless a writer is midway through a line
+    for line in reversed(lines[:-1]):
+        if line.strip():
+            return json.loads(line)['seq']
+    return 0
+
+
+def _record_changes(root, table, upserts, deletes):
+    """
+    Append one mutation to the change journal under a new sequence number
+    upserts is a list of row dicts and deletes a list of key dicts
+    Returns the new sequence number, or the current one if nothing changed
+    """
+    if not upserts and not deletes:
+        return _change_seq(root)
+
+    seq = _change_seq(root) + 1
+    with open(os.path.join(root, CHANGES_FILE), 'a') as f:
+        start = f.tell()
+        for row in upserts:
+            f.write(json.dumps({'seq': seq, 'table': table, 'op': 'upsert', 'row': row}) + '\n')
+        for key in deletes:
+            f.write(json.dumps({'seq': seq, 'table': table, 'op': 'delete', 'key': key}) + '\n')
+        FILE_WRITE_BYTES.observe(f.tell() - start, file=CHANGES_FILE)
+
+    return seq
+
+
+def _changes_floor(root):
+    """
+    The sequence number the journal was compacted through (see compact_changes), 0 if never
+    """
+    with open(os.path.join(root, CHANGES_FILE), 'rb') as f:
+        line = f.readline()
+    entry = json.loads(line) if line.strip() else {}
+    return entry['seq'] if entry.get('op') == 'compacted' else 0
+
+
+def _changes_offset(root, since):
+    """
+    Byte offset of the first journal entry with seq > since
+    Entries are appended in seq order, so this is a binary search over the file
+    """
+    with open(os.path.join(root, CHANGES_FILE), 'rb') as f:
+        def line_at(pos):
+            # First complete line starting at or after pos
+            if pos > 0:
+                f.seek(pos - 1)
+                f.readline()
+            else:
+                f.seek(0)
+            return f.tell(), f.readline()
+
+        lo, hi = 0, os.fstat(f.fileno()).st_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            _, line = line_at(mid)
+            if not line or json.loads(line)['seq'] > since:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        return line_at(lo)[0]
+
+
+@profiling.timed
+def save_habits(habits_df, user=None):
+    """
+    Save habits DataFrame to JSON file
+    This replaces every saved habit; use upsert_habits to merge into the saved habits
+    """
+    root = user_dir(user)
+    with _data_lock(root):
+        # Record which habits were added, edited or removed
+        previous_df = load_habits(user)
+        current = {h['id']: h for h in json.loads(habits_df.to_json(orient='records'))}
+        previous = {h['id']: h for h in json.loads(previous_df.to_json(orient='records'))}
+        _record_changes(
+            root,
+            'habits',
+            [h for habit_id, h in current.items() if previous.get(habit_id) != h],
+            [{'id': habit_id} for habit_id in previous if habit_id not in current]
+        )
+
+        # Convert DataFrame to JSON
+        habits_json = habits_df.to_json(orient='records')
+
+        # Write to file
+        _write_atomic(os.path.join(root, HABITS_FILE), habits_json)
+
+
+def _normalize_habits(habits_df, fill_missing=True):
+    """
+    Return a copy of habits with ISO created_at dates, float32 targets and string measures
+    With fill_missing, columns the habits lack are added with their defaults; otherwise only
+    the columns present are converted, so a merge can leave the others alone
+    """
+    habits_df = habits_df.copy()
+    if fill_missing:
+        for col in HABIT_COLUMNS:
             if col not in habits_df.columns:
                 if col == 'created_at':
                     habits_df[col] = datetime.now().strftime('%Y-%m-%d')
+                elif col == 'target':
+                    habits_df[col] = np.nan
                 else:
                     habits_df[col] = ""
 
-        return habits_df
+    if 'created_at' in habits_df.columns:
+        habits_df['created_at'] = _normalize_dates(habits_df['created_at'])
+    if 'target' in habits_df.columns:
+        habits_df['target'] = pd.to_numeric(habits_df['target'], errors='coerce').astype(np.float32)
+    if 'measure' in habits_df.columns:
+        habits_df['measure'] = habits_df['measure'].fillna('').astype(str)
+    return habits_df
+
+
+def load_habits(user=None):
+    """
+    Load habits from JSON file
+    Returns a DataFrame of habits
+    """
+    habits_file = os.path.join(user_dir(user), HABITS_FILE)
+    if not os.path.exists(habits_file):
+        # Return empty DataFrame if file doesn't exist
+        return pd.DataFrame(columns=HABIT_COLUMNS)
+
+    try:
+        with open(habits_file, 'r') as f:
+            habits_json = f.read()
+
+        # Convert JSON to DataFrame, with every column
+        return _normalize_habits(pd.DataFrame(json.loads(habits_json)))
     except Exception as e:
         # Return empty DataFrame if there's an error
         print(f"Error loading habits: {e}")
-        return pd.DataFrame(columns=['id', 'name', 'category', 'frequency', 'created_at'])
+        return pd.DataFrame(columns=HABIT_COLUMNS)
 
 
-def save_logs(logs_df):
+@profiling.timed
+def save_logs(logs_df, since=None, user=None):
     """
-    Save logs DataFrame to JSON file
+    Save logs DataFrame to the monthly partitions
+    logs_df must hold every log from the month of `since` on (all logs if since is None);
+    older months are left untouched. Only months whose content changed are rewritten
     """
-    # Convert DataFrame to JSON
-    logs_json = logs_df.to_json(orient='records')
+    root = user_dir(user)
+    with _data_lock(root):
+        manifest = _load_manifest(root)
 
-    # Write to file
-    with open(LOGS_FILE, 'w') as f:
-        f.write(logs_json)
+        if since is None:
+            months = list(manifest['partitions'])
+        else:
+            months = [m for m in manifest['partitions'] if m >= _month_of(since)]
 
+        _save_partitions(root, logs_df, manifest, months)
 
-def load_logs():
+
+@profiling.timed
+def upsert_logs(logs_df, user=None):
+    """
+    Merge logs into the saved logs by (habit_id, date)
+    Unlike save_logs this only reads and rewrites the months the given rows fall in,
+    under the data lock, so concurrent sessions never drop each other's check-ins
+    Returns (previous_seq, seq): the change sequence before and after the write. A
+    session whose last known sequence equals previous_seq has seen every other change
     """
-    Load logs from JSON file
+    root = user_dir(user)
+
+    with _data_lock(root):
+        # Queued logs are older than these, so they are applied first
+        _apply_pending(root)
+        previous_seq = _change_seq(root)
+        _upsert_logs(root, logs_df)
+        return previous_seq, _change_seq(root)
+
+
+def _upsert_logs(root, logs_df):
+    """
+    Merge logs into the saved logs by (habit_id, date); the caller holds the data lock
+    """
+    logs_df = _normalize_logs(logs_df).drop_duplicates(LOG_KEY_COLUMNS, keep='last')
+    months = sorted(set(logs_df['date'].str[:7]))
+    manifest = _load_manifest(root)
+
+    saved_frames = [_read_partition(root, m) for m in months if m in manifest['partitions']]
+    merged_df = pd.concat(saved_frames + [logs_df], ignore_index=True)
+    merged_df = merged_df.drop_duplicates(LOG_KEY_COLUMNS, keep='last')
+    _save_partitions(root, merged_df, manifest, months)
+
+
+def _apply_pending(root):
+    """
+    Merge the logs queued in PENDING_FILE (see data_files.queue_logs) into the saved logs
+    A cheap existence check when nothing is queued
+    """
+    pending_file = os.path.join(root, PENDING_FILE)
+    if not os.path.exists(pending_file):
+        return
+
+    with _data_lock(root):
+        # Another session may have applied the queue while we waited for the lock
+        if not os.path.exists(pending_file):
+            return
+
+        with open(pending_file, 'r') as f:
+            lines = f.read().splitlines()
+        os.remove(pending_file)
+
+        try:
+            queued = [json.loads(line) for line in lines if line.strip()]
+            if queued:
+                _upsert_logs(root, pd.DataFrame(queued).reindex(columns=LOG_COLUMNS + [LOG_VALUE_COLUMN]))
+        except Exception as e:
+            # Put the queue back so the logs are not lost
+            print(f"Error applying queued logs: {e}")
+            with open(pending_file, 'a') as f:
+                f.write(''.join(line + '\n' for line in lines))
+
+
+@profiling.timed
+def upsert_habits(habits_df, user=None):
+    """
+    Merge habits into the saved habits by id under the data lock
+    Returns (previous_seq, seq) like upsert_logs
+    """
+    root = user_dir(user)
+    with _data_lock(root):
+        previous_seq = _change_seq(root)
+        _merge_habits(habits_df, 'incoming', user)
+        return previous_seq, _change_seq(root)
+
+
+@profiling.timed
+def delete_habit(habit_id, user=None):
+    """
+    Remove a habit and all of its logs from the saved data under the data lock
+    Returns (previous_seq, seq) like upsert_logs
+    """
+    root = user_dir(user)
+    with _data_lock(root):
+        previous_seq = _change_seq(root)
+        habits_df = load_habits(user)
+        save_habits(habits_df[habits_df['id'] != habit_id], user=user)
+        delete_habit_logs(habit_id, user=user)
+        return previous_seq, _change_seq(root)
+
+
+@profiling.timed
+def load_logs(start_date=None, end_date=None, user=None):
+    """
+    Load logs from the monthly partitions
+    Only the months overlapping start_date..end_date are read (whole months are returned);
+    without bounds the entire history is loaded
     Returns a DataFrame of logs
     """
-    if not os.path.exists(LOGS_FILE):
-        # Return empty DataFrame if file doesn't exist
-        return pd.DataFrame(columns=['habit_id', 'date', 'completed'])
+    try:
+        root = user_dir(user)
+        manifest = _load_manifest(root)
+
+        months = sorted(
+            m for m in manifest['partitions']
+            if (start_date is None or m >= _month_of(start_date))
+            and (end_date is None or m <= _month_of(end_date))
+        )
+
+        if not months:
+            return pd.DataFrame(columns=LOG_COLUMNS)
+
+        # Months that are current in the snapshot come from adjacent binary slices;
+        # anything changed since falls back to its JSON partition
+        snapshot = _open_snapshot(root)
+        meta, columns = snapshot if snapshot else ({'partitions': {}}, None)
+        pieces, read_frames = [], {}
+
+        for month in months:
+            bounds = meta['partitions'].get(month)
+            version = manifest['partitions'][month]['version']
+            if bounds is None or bounds['version'] != version:
+                pieces.append(_read_partition(root, month))
+                read_frames[month] = (version, pieces[-1])
+            elif pieces and isinstance(pieces[-1], tuple) and pieces[-1][1] == bounds['start']:
+                pieces[-1] = (pieces[-1][0], bounds['stop'])
+            else:
+                pieces.append((bounds['start'], bounds['stop']))
+
+        profiling.cache_lookup('snapshot', not read_frames)
+        if read_frames:
+            # Repair the snapshot so later loads read binary slices again
+            _refresh_snapshot(root, read_frames)
 
+        frames = [
+            _snapshot_frame(meta, columns, *piece) if isinstance(piece, tuple) else piece
+            for piece in pieces
+        ]
+
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index=True)
+    except Exception as e:
+        # Return empty DataFrame if there's an error
+        print(f"Error loading logs: {e}")
+        return pd.DataFrame(columns=LOG_COLUMNS)
+
+
+def _load_legacy_logs(root):
+    """
+    Load logs from the single pre-partitioning JSON file
+    Returns a DataFrame of logs
+    """
     try:
-        with open(LOGS_FILE, 'r') as f:
+        with open(os.path.join(root, LOGS_FILE), 'r') as f:
             logs_json = f.read()
 
         # Convert JSON to DataFrame
-        logs_df = pd.read_json(logs_json, orient='records')
+        logs_df = pd.DataFrame(json.loads(logs_json))
 
         # Ensure all required columns exist
-        required_columns = ['habit_id', 'date', 'completed']
-        for col in required_columns:
+        for col in LOG_COLUMNS:
             if col not in logs_df.columns:
                 if col == 'completed':
                     logs_df[col] = False
                 else:
                     logs_df[col] = ""
 
-        return logs_df
+        return _normalize_logs(logs_df)
     except Exception as e:
         # Return empty DataFrame if there's an error
         print(f"Error loading logs: {e}")
-        return pd.DataFrame(columns=['habit_id', 'date', 'completed'])
+        return pd.DataFrame(columns=LOG_COLUMNS)
 
 
-def export_data():
+@profiling.timed
+def log_months(user=None):
+    """
+    Return the months ('YYYY-MM') that have saved logs, oldest first
+    """
+    return sorted(_load_manifest(user_dir(user))['partitions'])
+
+
+@profiling.timed
+def delete_habit_logs(habit_id, user=None):
+    """
+    Remove every saved log of a habit, rewriting only the months that contain it
+    """
+    root = user_dir(user)
+    with _data_lock(root):
+        manifest = _load_manifest(root)
+        months = [m for m, entry in manifest['partitions'].items() if habit_id in entry['streaks']]
+
+        if months:
+            logs_df = pd.concat([_read_partition(root, m) for m in months], ignore_index=True)
+            _save_partitions(root, logs_df[logs_df['habit_id'] != habit_id], manifest, months)
+
+
+@profiling.timed
+def load_longest_streaks(user=None):
+    """
+    Return {habit_id: longest streak in days} over the whole history
+    Computed from the per-month streak summaries in the manifest, without reading any logs
+    """
+    partitions = _load_manifest(user_dir(user))['partitions']
+    longest, carry, last_month = {}, {}, {}
+
+    for month in sorted(partitions):
+        days = calendar.monthrange(int(month[:4]), int(month[5:7]))[1]
+        previous = _previous_month(month)
+
+        for habit_id, (prefix, suffix, best) in partitions[month]['streaks'].items():
+            # A run carries over only from a directly preceding month
+            run = carry.get(habit_id, 0) if last_month.get(habit_id) == previous else 0
+            longest[habit_id] = max(longest.get(habit_id, 0), best, run + prefix)
+            carry[habit_id] = run + days if prefix == days else suffix
+            last_month[habit_id] = month
+
+    return longest
+
+
+@profiling.timed
+def load_streak_index(user=None):
+    """
+    Return {habit_id: [last completed day, streak ending on that day]} for every habit
+    completed at least once, without reading logs
+    A habit's current streak is the run if its last day is today or yesterday, else 0.
+    Queued check-ins are applied first; a missing or outdated index is rebuilt
+    """
+    root = user_dir(user)
+    index = None if os.path.exists(os.path.join(root, PENDING_FILE)) else _read_streak_index(root)
+    profiling.cache_lookup('streak index', index is not None)
+    if index is not None:
+        return index['habits']
+
+    with _data_lock(root):
+        manifest = _load_manifest(root)
+        index = _read_streak_index(root)
+        if index is not None and index['version'] == manifest['version']:
+            return index['habits']
+        if not manifest['partitions']:
+            return {}
+
+        habits = _save_streak_index(root, manifest)
+        # Keep the per-month summaries filled in for older manifests
+        _save_manifest(root, manifest)
+        return habits
+
+
+@profiling.timed
+def save_daily_summary(day, seq, current_streaks, user=None):
+    """
+    Save {habit_id: current streak} as of day, computed from the data at change seq
+    """
+    try:
+        _write_atomic(os.path.join(user_dir(user), DAILY_SUMMARY_FILE),
+                      json.dumps({'date': day, 'seq': seq, 'current_streaks': current_streaks}))
+        return True
+    except Exception as e:
+        print(f"Error saving daily summary: {e}")
+        return False
+
+
+@profiling.timed
+def load_daily_summary(day, seq, user=None):
+    """
+    Return the saved {habit_id: current streak} if it is for day and change seq, else None
+    """
+    summary_file = os.path.join(user_dir(user), DAILY_SUMMARY_FILE)
+    if not os.path.exists(summary_file):
+        return None
+
+    try:
+        with open(summary_file, 'r') as f:
+            summary = json.load(f)
+    except Exception as e:
+        print(f"Error loading daily summary: {e}")
+        return None
+
+    if summary.get('date') != day or summary.get('seq') != seq:
+        return None
+    return summary['current_streaks']
+
+
+@profiling.timed
+def export_data(user=None, compact=False):
     """
     Export all data to a single JSON file for backup
+    The file is written to the user's data directory. With compact=True the change journal
+    is compacted through the backup's watermark (see compact_changes), so later
+    incremental exports can only chain from this backup
     """
     try:
-        habits_df = load_habits()
-        logs_df = load_logs()
+        habits_df = load_habits(user)
+        logs_df = load_logs(user=user)
 
         export_data = {
-            'habits': habits_df.to_dict('records'),
-            'logs': logs_df.to_dict('records'),
+            'habits': json.loads(habits_df.to_json(orient='records')),
+            'logs': json.loads(logs_df.to_json(orient='records')),
+            'seq': get_change_seq(user),
             'exported_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
-        export_file = f'habit_tracker_export_{datetime.now().strftime("%Y%m%d")}.json'
+        export_file = os.path.join(user_dir(user), f'habit_tracker_export_{datetime.now().strftime("%Y%m%d")}.json')
 
         with open(export_file, 'w') as f:
             json.dump(export_data, f, indent=2)
 
+        if compact:
+            compact_changes(export_data['seq'], user)
+
         return export_file
     except Exception as e:
         print(f"Error exporting data: {e}")
         return None
 
 
-def import_data(file_path):
+@profiling.timed
+def export_changes(since=0, user=None):
+    """
+    Export the habits and logs changed after change sequence `since` for an incremental backup
+    Only the journal entries past the watermark are read. Returns the file name, whose
+    'seq' field is the watermark to pass as `since` next time, or None if the journal was
+    compacted past `since` and a full export is needed
+    """
+    try:
+        root = user_dir(user)
+        habits, logs = {}, {}
+        seq = since
+
+        if os.path.exists(os.path.join(root, CHANGES_FILE)):
+            floor = _changes_floor(root)
+            if since < floor:
+                print(f"Error exporting changes: changes up to seq {floor} were compacted, "
+                      f"export everything instead")
+                return None
+
+            with open(os.path.join(root, CHANGES_FILE), 'r') as f:
+                f.seek(_changes_offset(root, since))
+                for line in f:
+                    entry = json.loads(line)
+                    seq = entry['seq']
+                    record = entry.get('row') or entry['key']
+
+                    # Later entries for the same key replace earlier ones
+                    if entry['table'] == 'habits':
+                        habits[record['id']] = entry
+                    else:
+                        logs[(record['habit_id'], record['date'])] = entry
+
+        changes = {
+            'since': since,
+            'seq': seq,
+            'habits': [e['row'] for e in habits.values() if e['op'] == 'upsert'],
+            'deleted_habits': [e['key'] for e in habits.values() if e['op'] == 'delete'],
+            'logs': [e['row'] for e in logs.values() if e['op'] == 'upsert'],
+            'deleted_logs': [e['key'] for e in logs.values() if e['op'] == 'delete'],
+            'exported_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+        export_file = os.path.join(root, f'habit_tracker_changes_{since}_{seq}.json')
+
+        with open(export_file, 'w') as f:
+            json.dump(changes, f, indent=2)
+
+        return export_file
+    except Exception as e:
+        print(f"Error exporting changes: {e}")
+        return None
+
+
+@profiling.timed
+def compact_changes(through, user=None):
+    """
+    Drop the change journal's entries up to sequence `through`, e.g. once a full backup at
+    that watermark was taken (see export_data)
+    The journal otherwise grows with every change. A marker line keeps the sequence going,
+    and export_changes refuses watermarks older than it
+    Returns the number of entries dropped
+    """
+    root = user_dir(user)
+    changes_file = os.path.join(root, CHANGES_FILE)
+
+    with _data_lock(root):
+        if not os.path.exists(changes_file):
+            return 0
+
+        floor = _changes_floor(root)
+        through = min(through, _change_seq(root))
+        if through <= floor:
+            return 0
+
+        offset = _changes_offset(root, through)
+        with open(changes_file, 'rb') as f:
+            # The previous marker, if any, is not an entry
+            dropped = f.read(offset).count(b'\n') - (floor > 0)
+            rest = f.read().decode()
+
+        _write_atomic(changes_file, json.dumps({'seq': through, 'op': 'compacted'}) + '\n' + rest)
+        return dropped
+
+
+@profiling.timed
+def apply_changes(snapshot_path, changes_path, output_path=None):
+    """
+    Replay a delta from export_changes onto a snapshot from export_data
+    The snapshot must be at least as recent as the delta's watermark. The result is
+    written to output_path (the snapshot itself by default) and its path returned
+    """
+    try:
+        with open(snapshot_path, 'r') as f:
+            snapshot = json.load(f)
+        with open(changes_path, 'r') as f:
+            changes = json.load(f)
+
+        if snapshot.get('seq', 0) < changes['since']:
+            print(f"Error applying changes: snapshot is at seq {snapshot.get('seq', 0)}, "
+                  f"changes start after seq {changes['since']}")
+            return None
+
+        habits = {h['id']: h for h in snapshot['habits']}
+        logs = {(l['habit_id'], l['date']): l for l in snapshot['logs']}
+
+        for key in changes['deleted_habits']:
+            habits.pop(key['id'], None)
+        for habit in changes['habits']:
+            habits[habit['id']] = habit
+        for key in changes['deleted_logs']:
+            logs.pop((key['habit_id'], key['date']), None)
+        for log in changes['logs']:
+            logs[(log['habit_id'], log['date'])] = log
+
+        snapshot['habits'] = list(habits.values())
+        snapshot['logs'] = list(logs.values())
+        snapshot['seq'] = max(snapshot.get('seq', 0), changes['seq'])
+        snapshot['exported_at'] = changes['exported_at']
+
+        output_path = output_path or snapshot_path
+        with open(output_path, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+
+        return output_path
+    except Exception as e:
+        print(f"Error applying changes: {e}")
+        return None
+
+
+@profiling.timed
+def import_data(file_path, merge=False, on_conflict='completed', user=None):
     """
     Import data from a backup file
+    With merge=True the backup is merged into the existing data instead of replacing it:
+    habits are matched by id and logs are upserted by (habit_id, date). A log that differs
+    from the local copy is resolved by on_conflict:
+      'incoming'  - the backup wins
+      'local'     - the local row is kept
+      'completed' - the day counts as completed if either side completed it
     """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError(f"on_conflict must be one of {CONFLICT_POLICIES}, got {on_conflict!r}")
+
     try:
         with open(file_path, 'r') as f:
             import_data = json.load(f)
 
-        # Convert to DataFrames
+        # Convert to DataFrames; habits keep only the fields the backup has, as backups
+        # made before a field existed must not clear it when merged
         habits_df = pd.DataFrame(import_data['habits'])
-        logs_df = pd.DataFrame(import_data['logs'])
+        logs_df = pd.DataFrame(import_data['logs']).reindex(columns=LOG_COLUMNS + [LOG_VALUE_COLUMN])
 
-        # Save imported data
-        save_habits(habits_df)
-        save_logs(logs_df)
+        root = user_dir(user)
+        with _data_lock(root):
+            if merge:
+                _merge_habits(habits_df, on_conflict, user)
+                _merge_logs(root, logs_df, on_conflict)
+                return True
+
+            # Save imported data
+            save_habits(_normalize_habits(habits_df)[HABIT_COLUMNS], user=user)
+            save_logs(logs_df, user=user)
 
         return True
     except Exception as e:
         print(f"Error importing data: {e}")
         return False
+
+
+def _merge_habits(incoming_df, on_conflict, user=None):
+    """
+    Upsert imported habits into the saved habits by id
+    """
+    if incoming_df.empty:
+        return
+
+    local_df = load_habits(user)
+    incoming_df = _normalize_habits(incoming_df.drop_duplicates('id', keep='last'), fill_missing=False)
+    new_habits = _normalize_habits(incoming_df[~incoming_df['id'].isin(local_df['id'])])
+
+    if on_conflict == 'local':
+        # Only habits unknown locally are taken from the backup
+        merged_df = pd.concat([local_df, new_habits], ignore_index=True)
+    else:
+        # Replace matching habits in place, then append the new ones. Cleared fields (e.g. a
+        # removed target) are taken too; columns the incoming habits lack keep their values
+        merged_df = local_df.set_index('id')
+        incoming = incoming_df.set_index('id')
+        matched = incoming.index.intersection(merged_df.index)
+        columns = merged_df.columns.intersection(incoming.columns)
+        if len(matched) and len(columns):
+            merged_df.loc[matched, columns] = incoming.loc[matched, columns]
+        merged_df = pd.concat([merged_df.reset_index(), new_habits], ignore_index=True)
+
+    merged_df = merged_df[HABIT_COLUMNS]
+    if not merged_df.equals(local_df[HABIT_COLUMNS]):
+        save_habits(merged_df, user=user)
+
+
+def _merge_logs(root, incoming_df, on_conflict):
+    """
+    Upsert imported logs into the saved logs by (habit_id, date)
+    Rows whose hash matches the saved row are skipped, so a backup that mostly overlaps
+    the local data only costs the hashing of its rows; only the months holding changed
+    rows are read and rewritten
+    """
+    incoming_df = _normalize_logs(incoming_df).drop_duplicates(LOG_KEY_COLUMNS, keep='last')
+    if incoming_df.empty:
+        return
+
+    # Look up each incoming row in the sorted hash index
+    manifest = _load_manifest(root)
+    index_keys, index_rows = _load_logs_index(root, manifest)
+    known, unchanged = _lookup_hashes(index_keys, index_rows, *_hash_log_rows(incoming_df))
+
+    if on_conflict == 'local':
+        # Existing rows are never overwritten, so only new keys matter
+        delta_df = incoming_df[~known]
+    else:
+        delta_df = incoming_df[~unchanged]
+
+    if delta_df.empty:
+        return
+
+    # Only the months the delta touches are read and rewritten
+    months = sorted(set(delta_df['date'].str[:7]))
+    local_frames = [_read_partition(root, m) for m in months if m in manifest['partitions']]
+    local_df = pd.concat(local_frames, ignore_index=True) if local_frames else pd.DataFrame(columns=LOG_COLUMNS)
+
+    if on_conflict == 'completed':
+        # A day completed on either side stays completed
+        local_completed = local_df.drop_duplicates(LOG_KEY_COLUMNS, keep='last')
+        local_completed = local_completed.set_index(LOG_KEY_COLUMNS)['completed']
+        delta_keys = pd.MultiIndex.from_frame(delta_df[LOG_KEY_COLUMNS])
+        previous = local_completed.reindex(delta_keys, fill_value=False).astype(bool).to_numpy()
+        delta_df = delta_df.assign(completed=delta_df['completed'].to_numpy() | previous)
+
+    merged_df = pd.concat([local_df, delta_df], ignore_index=True)
+    merged_df = merged_df.drop_duplicates(LOG_KEY_COLUMNS, keep='last')
+    _save_partitions(root, merged_df, manifest, months)
@@ -0,0 +1,494 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+import data_handler as dh
+import periods
+import profiling
+import rollups
+import utils
+
+# One DataStore per user key, shared by every session in the process. Stores no session
+# holds stay cached for returning users, least recently used first, and are evicted
+# beyond MAX_IDLE_STORES
+MAX_IDLE_STORES = 64
+
+_stores = OrderedDict()
+_stores_lock = threading.Lock()
+
+# The rollover job precomputes every cached store's streaks and risk likelihoods this many
+# seconds after each local midnight, so the first render of a day does not pay for them
+ROLLOVER_DELAY = 5
+
+_rollover_thread = None
+
+# The dtype astype(str) produces: object, or a string dtype in newer pandas
+_STR_DTYPE = pd.Series(['']).astype(str).dtype
+
+
+def _typed_logs(logs_df):
+    """
+    Compact column types for the shared copy: categorical habit ids, string dates, bool
+    completion and, for logs with values, float32 values
+    Columns that already have their type are used as they are rather than copied
+    """
+    habit_ids, dates, completed = logs_df['habit_id'], logs_df['date'], logs_df['completed']
+    if not isinstance(habit_ids.dtype, pd.CategoricalDtype):
+        habit_ids = habit_ids.astype('category')
+    if dates.dtype != _STR_DTYPE or not pd.api.types.is_string_dtype(dates):
+        dates = dates.astype(str)
+    if completed.dtype != bool:
+        completed = completed.astype(bool)
+
+    columns = {
+        'habit_id': habit_ids.array,
+        'date': dates.array,
+        'completed': completed.array
+    }
+    if dh.LOG_VALUE_COLUMN in logs_df.columns:
+        values = logs_df[dh.LOG_VALUE_COLUMN]
+        columns[dh.LOG_VALUE_COLUMN] = (values if values.dtype == np.float32 else values.astype(np.float32)).array
+    return pd.DataFrame(columns, copy=False)
+
+
+def _append_logs(typed_logs, logs_df):
+    """
+    Append logs to a frame made by _typed_logs, converting only the new rows
+    """
+    habit_ids = typed_logs['habit_id']
+    new_ids = logs_df['habit_id'].astype(str)
+    missing = new_ids[~new_ids.isin(habit_ids.cat.categories)].unique()
+    if len(missing):
+        # Concatenating categoricals keeps the type only if their categories match
+        habit_ids = habit_ids.cat.add_categories(missing)
+        typed_logs = typed_logs.assign(habit_id=habit_ids)
+
+    new_logs = _typed_logs(pd.DataFrame({
+        'habit_id': pd.Categorical(new_ids, categories=habit_ids.cat.categories),
+        'date': logs_df['date'].astype(str).array,
+        'completed': logs_df['completed'].to_numpy(),
+        **({dh.LOG_VALUE_COLUMN: pd.to_numeric(logs_df[dh.LOG_VALUE_COLUMN], errors='coerce').to_numpy()}
+           if dh.LOG_VALUE_COLUMN in logs_df.columns else {})
+    }))
+    combined = pd.concat([typed_logs, new_logs], ignore_index=True)
+    if dh.LOG_VALUE_COLUMN in combined.columns and combined[dh.LOG_VALUE_COLUMN].dtype != np.float32:
+        # Frames without values contribute NaN, which concat widens to float64
+        combined[dh.LOG_VALUE_COLUMN] = combined[dh.LOG_VALUE_COLUMN].astype(np.float32)
+    return combined
+
+
+def _streak_dict(table):
+    """
+    {habit_id: current streak} as plain ints from a periods.streaks table
+    """
+    return {habit_id: int(streak) for habit_id, streak in table['current_streak'].items()}
+
+
+class DataStore:
+    """
+    The canonical in-memory copy of one user's habits and logs
+    Frames are replaced rather than modified in place, so sessions can read them without
+    locking. All mutations go through the store's methods, which hold its lock and
+    write through to data_handler
+    """
+
+    def __init__(self, key=None):
+        # The data_handler user the store's data belongs to
+        self.key = key
+        self.lock = threading.RLock()
+        self.refcount = 0
+
+        # Logs are loaded by month: self.logs holds every log from logs_since on
+        self.logs_since = (datetime.now().replace(day=1) - timedelta(days=1)).replace(day=1).strftime('%Y-%m-%d')
+        self._load()
+
+    def _load(self):
+        """
+        (Re)load habits and the loaded log window from storage
+        """
+        # Take the version before loading, so changes made meanwhile trigger another reload
+        self.version = dh.get_change_seq(self.key)
+        self.habits = dh.load_habits(self.key)
+        self.logs = _typed_logs(dh.load_logs(start_date=self.logs_since, user=self.key))
+        # Category rollup of the loaded window, built on first use (see category_rollup)
+        self._cube = None
+        # (version, periods.HistoryIndex) of the whole history, built on first use
+        self._history = None
+        self._forget_streaks()
+        self.ensure_streak_history()
+
+    def _forget_streaks(self):
+        # {habit_id: current streak} as of self._streaks_day; habits whose logs change are
+        # dropped and recomputed on the next current_streaks()
+        self._streaks_day = None
+        self._streaks = {}
+        # Completion likelihoods (see utils.get_completion_likelihood) as of self._likelihood_day
+        self._likelihood_day = None
+        self._likelihood = None
+
+    @profiling.timed
+    def refresh(self):
+        """
+        Reload if data was saved by anything other than this store (another process, the CLI)
+        Returns the current version
+        """
+        with self.lock:
+            current = dh.get_change_seq(self.key) == self.version
+            profiling.cache_lookup('data_store.refresh', current)
+            if not current:
+                self._load()
+            return self.version
+
+    @profiling.timed
+    def ensure_logs_loaded(self, start_date):
+        """
+        Load the months between start_date and the oldest loaded month, if any
+        """
+        month_start = pd.Timestamp(start_date).replace(day=1)
+
+        with self.lock:
+            loaded_start = pd.Timestamp(self.logs_since)
+            profiling.cache_lookup('data_store.logs', month_start >= loaded_start)
+            if month_start >= loaded_start:
+                return
+
+            older_logs = dh.load_logs(start_date=month_start, end_date=loaded_start - timedelta(days=1),
+                                      user=self.key)
+            if not older_logs.empty:
+                self.logs = _typed_logs(pd.concat([older_logs, self.logs], ignore_index=True))
+                self._forget_streaks()
+            self.logs_since = month_start.strftime('%Y-%m-%d')
+            # The rollup starts at the loaded window; it is rebuilt from the new start
+            self._cube = None
+
+    @profiling.timed
+    def ensure_streak_history(self):
+        """
+        Load older months while some habit's current streak reaches back to the oldest loaded day
+        """
+        with self.lock:
+            saved_months = dh.log_months(self.key)
+            while True:
+                table = periods.streaks(self.habits, self.logs)
+                needs_since = table.loc[table['current_streak'] > 0, 'needs_since'].min()
+                if (not saved_months or self.logs_since[:7] <= saved_months[0] or pd.isna(needs_since)
+                        or needs_since >= self.logs_since):
+                    # Every streak fits in the loaded window, so these are today's streaks
+                    self._streaks_day = datetime.now().strftime('%Y-%m-%d')
+                    self._streaks = _streak_dict(table)
+                    break
+                self.ensure_logs_loaded(needs_since)
+
+    def _current_streaks(self):
+        """
+        Today's {habit_id: current streak} and the version they were computed at
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+
+        with self.lock:
+            if self._streaks_day != today:
+                # A new day: start from the summary the rollover job saved, if it is current
+                self._streaks_day = today
+                self._streaks = dh.load_daily_summary(today, self.version, self.key) or {}
+            streaks, habits, logs, version = self._streaks, self.habits, self.logs, self.version
+            known = {habit_id: streaks[habit_id] for habit_id in habits['id'] if habit_id in streaks}
+            missing = ~habits['id'].isin(known)
+            profiling.cache_lookup('data_store.streaks', not missing.any())
+
+        # Compute the missing streaks outside the lock; frames are never modified in place
+        computed = _streak_dict(periods.streaks(habits[missing], logs)) if missing.any() else {}
+        if computed:
+            with self.lock:
+                # Keep them only if no write or reload happened meanwhile
+                if self.version == version and self._streaks is streaks:
+                    streaks.update(computed)
+
+        return version, {**known, **computed}
+
+    @profiling.timed
+    def current_streaks(self):
+        """
+        Return {habit_id: current streak} as of today for every habit, in its periods (see periods)
+        Streaks are kept for the day and recomputed only for habits whose logs changed
+        """
+        return self._current_streaks()[1]
+
+    @profiling.timed
+    def risk_scores(self):
+        """
+        Habits by risk of being missed in their current period, riskiest first (see
+        utils.get_risk_scores)
+        Likelihoods only use logs up to yesterday, so they are computed once a day
+        """
+        today = datetime.now()
+        self.ensure_logs_loaded(today - timedelta(days=utils.RISK_HISTORY_DAYS))
+
+        with self.lock:
+            current = self._likelihood_day == today.strftime('%Y-%m-%d')
+            profiling.cache_lookup('data_store.likelihood', current)
+            habits, logs, version, likelihood = self.habits, self.logs, self.version, self._likelihood
+
+        if not current:
+            # Compute outside the lock and keep the result only if nothing was written meanwhile
+            likelihood = utils.get_completion_likelihood(habits, logs, today)
+            with self.lock:
+                if self.version == version:
+                    self._likelihood_day, self._likelihood = today.strftime('%Y-%m-%d'), likelihood
+
+        return utils.get_risk_scores(habits, logs, likelihood, self.current_streaks(), today)
+
+    @profiling.timed
+    def category_rollup(self, start_date, end_date, categories=None):
+        """
+        Completed and expected occurrences per category and day between two days (see
+        rollups.CategoryCube.frame), loading older months if the range reaches them
+        The cube is built once a day and kept up to date by every write, so logs are not rescanned
+        """
+        self.ensure_logs_loaded(start_date)
+
+        with self.lock:
+            today = periods.day_of(datetime.now())
+            cached = self._cube is not None and self._cube.today == today
+            profiling.cache_lookup('data_store.category_rollup', cached)
+            if not cached:
+                self._cube = rollups.CategoryCube(self.habits, self.logs, self.logs_since)
+            return self._cube.frame(start_date, end_date, categories)
+
+    @profiling.timed
+    def history_index(self):
+        """
+        A periods.HistoryIndex over every saved log, for streaks as of past days (see
+        utils.get_streaks); it is rebuilt on first use after each write
+        """
+        saved_months = dh.log_months(self.key)
+        if saved_months:
+            self.ensure_logs_loaded(saved_months[0] + '-01')
+
+        with self.lock:
+            history = self._history
+            profiling.cache_lookup('data_store.history_index', history is not None and history[0] == self.version)
+            if history is not None and history[0] == self.version:
+                return history[1]
+            habits, logs, version = self.habits, self.logs, self.version
+
+        # Build outside the lock; frames are never modified in place
+        index = periods.HistoryIndex(habits, logs)
+        with self.lock:
+            if self.version == version:
+                self._history = (version, index)
+        return index
+
+    @profiling.timed
+    def precompute(self):
+        """
+        Refresh, compute today's streaks and save them as the daily summary, so other
+        processes loading this user today start with them too, and today's risk likelihoods
+        Returns {habit_id: current streak}
+        """
+        self.refresh()
+        self.ensure_streak_history()
+        version, streaks = self._current_streaks()
+        if not self.habits.empty:
+            dh.save_daily_summary(datetime.now().strftime('%Y-%m-%d'), version, streaks, self.key)
+            self.risk_scores()
+        return streaks
+
+    def _after_write(self, versions, apply):
+        """
+        Bring the in-memory copy in line with a write that returned versions
+        If nothing else was saved since our last load, apply() patches the copy;
+        otherwise everything is reloaded so the other writes are picked up too
+        """
+        previous_seq, seq = versions
+        if previous_seq == self.version:
+            apply()
+            self.version = seq
+        else:
+            self._load()
+        return versions
+
+    @profiling.timed
+    def upsert_logs(self, logs_df):
+        """
+        Merge logs by (habit_id, date) into the saved data and the shared copy
+        Returns (previous_seq, seq) from data_handler.upsert_logs
+        """
+        # A batch may hold several check-ins for one day; the last one wins, as on disk
+        logs_df = logs_df.drop_duplicates(dh.LOG_KEY_COLUMNS, keep='last')
+
+        def apply():
+            # Drop the rows being replaced, then append the new ones. Only rows on the
+            # dates being written can be replaced, so only those are compared
+            new_ids = logs_df['habit_id'].astype(str)
+            new_keys = set(zip(new_ids, logs_df['date'].astype(str)))
+            candidates = self.logs[self.logs['date'].isin({date for _, date in new_keys})]
+            replaced = [
+                index for index, habit_id, date in zip(candidates.index, candidates['habit_id'], candidates['date'])
+                if (str(habit_id), date) in new_keys
+            ]
+            # Logs before the loaded window stay on disk until their months are loaded
+            loaded = logs_df[logs_df['date'].astype(str) >= self.logs_since]
+            previous_logs = self.logs
+            self.logs = _append_logs(self.logs.drop(index=replaced) if replaced else self.logs, loaded)
+            if self._cube is not None:
+                self._cube.update(previous_logs, self.logs, loaded)
+            for habit_id in new_ids:
+                self._streaks.pop(habit_id, None)
+            # Likelihoods only change with logs before today
+            if (logs_df['date'].astype(str) < datetime.now().strftime('%Y-%m-%d')).any():
+                self._likelihood_day = None
+
+        with self.lock:
+            return self._after_write(dh.upsert_logs(logs_df, user=self.key), apply)
+
+    @profiling.timed
+    def upsert_habits(self, habits_df):
+        """
+        Merge habits by id into the saved data and the shared copy
+        Returns (previous_seq, seq) from data_handler.upsert_habits
+        """
+        def apply():
+            self.habits = dh.load_habits(self.key)
+            # A new frequency changes the habit's periods, a new category its rollup row
+            for habit_id in habits_df['id']:
+                self._streaks.pop(habit_id, None)
+            self._likelihood_day = None
+            self._cube = None
+
+        with self.lock:
+            return self._after_write(dh.upsert_habits(habits_df, user=self.key), apply)
+
+    @profiling.timed
+    def delete_habit(self, habit_id):
+        """
+        Remove a habit and its logs from the saved data and the shared copy
+        Returns (previous_seq, seq) from data_handler.delete_habit
+        """
+        def apply():
+            if self._cube is not None:
+                self._cube.remove(habit_id, self.logs[self.logs['habit_id'] == habit_id])
+            self.habits = self.habits[self.habits['id'] != habit_id].reset_index(drop=True)
+            self.logs = _typed_logs(self.logs[self.logs['habit_id'] != habit_id])
+            self._streaks.pop(habit_id, None)
+            self._likelihood_day = None
+
+        with self.lock:
+            return self._after_write(dh.delete_habit(habit_id, user=self.key), apply)
+
+
+class StoreHandle:
+    """
+    A session's reference to a shared DataStore
+    The reference is released when the handle is garbage collected with its session
+    """
+
+    def __init__(self, store):
+        self.store = store
+        weakref.finalize(self, _release, store.key)
+
+
+def acquire(key=None):
+    """
+    Return a handle on the shared store for a user, loading it unless it is cached
+    Raises ValueError for an invalid user key
+    """
+    dh.user_dir(key)
+
+    with _stores_lock:
+        store = _stores.get(key)
+        profiling.cache_lookup('data_store.acquire', store is not None)
+        if store is not None:
+            return _hold(store)
+
+    # Load outside the registry lock so other users are not held up; if two sessions
+    # load the same user at once, the first store registered wins
+    loaded = DataStore(key)
+    with _stores_lock:
+        return _hold(_stores.setdefault(key, loaded))
+
+
+def _hold(store):
+    """
+    Take a reference to a registered store and mark it most recently used
+    Must be called with _stores_lock held
+    """
+    _stores.move_to_end(store.key)
+    store.refcount += 1
+    _evict_idle()
+    return StoreHandle(store)
+
+
+def _release(key):
+    """
+    Drop one reference to a store; once unreferenced it stays cached until evicted
+    """
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None:
+            store.refcount -= 1
+            _evict_idle()
+
+
+def _evict_idle():
+    """
+    Free the least recently used stores no session holds, beyond MAX_IDLE_STORES
+    Must be called with _stores_lock held
+    """
+    idle = [key for key, store in _stores.items() if store.refcount <= 0]
+    for key in idle[:max(0, len(idle) - MAX_IDLE_STORES)]:
+        del _stores[key]
+
+
+def open_stores():
+    """
+    Return {key: refcount} for the stores currently held in memory
+    """
+    with _stores_lock:
+        return {key: store.refcount for key, store in _stores.items()}
+
+
+def precompute_stores():
+    """
+    Precompute today's streaks for every store held in memory
+    Returns the number of stores precomputed
+    """
+    with _stores_lock:
+        stores = list(_stores.values())
+
+    for store in stores:
+        try:
+            store.precompute()
+        except Exception as e:
+            print(f"Error precomputing streaks for {store.key or 'the default user'}: {e}")
+    return len(stores)
+
+
+def seconds_until_rollover(now=None):
+    """
+    Seconds from now until ROLLOVER_DELAY seconds past the next local midnight
+    """
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (midnight - now).total_seconds() + ROLLOVER_DELAY
+
+
+def start_rollover_job():
+    """
+    Run precompute_stores after every midnight from a daemon thread
+    Only one job runs per process
+    """
+    global _rollover_thread
+
+    def run():
+        while True:
+            time.sleep(seconds_until_rollover())
+            precompute_stores()
+
+    with _stores_lock:
+        if _rollover_thread is None:
+            _rollover_thread = threading.Thread(target=run, name='rollover', daemon=True)
+            _rollover_thread.start()
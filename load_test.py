@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: peak memory is not reported
+    resource = None
+
+import data_handler as dh
+import synthetic_data
+from data_files import LOCK_FILE
+
+# Drives simulated Streamlit sessions through app.py with AppTest and reports rerun
+# latency, peak memory and how many data files were written. Sessions in one worker
+# process share its data stores like sessions of one server; workers share the data
+# directory like several servers (or the CLI) would:
+#
+#   python load_test.py --sessions 20 --iterations 5 --workers 2 --output load.json
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+
+class WriteCounter:
+    """
+    Counts files opened for writing under a directory, through an audit hook
+    Audit hooks cannot be removed, so counting is switched off instead when done
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.realpath(directory)
+        self.counts = Counter()
+        self.active = False
+        self.lock = threading.Lock()
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if event != 'open' or not self.active:
+            return
+
+        path, mode, flags = args
+        writing = any(c in mode for c in 'wax+') if isinstance(mode, str) else bool(flags & (os.O_WRONLY | os.O_RDWR))
+        if not writing or not isinstance(path, (str, bytes, os.PathLike)):
+            return
+
+        # The lock file is opened for appending to take the lock, not to write
+        path = os.path.realpath(os.fsdecode(path))
+        if path.startswith(self.directory + os.sep) and os.path.basename(path) != LOCK_FILE:
+            with self.lock:
+                self.counts[_file_kind(path)] += 1
+
+
+def _file_kind(path):
+    """
+    Group written files for the report: a temporary file counts as the file it replaces,
+    month partitions and snapshot columns are counted together
+    """
+    name = os.path.basename(path)
+    if name.endswith('.tmp'):
+        # <file>.<pid>.<thread>.tmp, see data_handler._temp_path
+        name = name.rsplit('.', 3)[0]
+
+    if os.path.basename(os.path.dirname(path)) == 'snapshot':
+        return 'snapshot'
+    if name[:4].isdigit():
+        return 'partition index' if '.index' in name else 'partition'
+    return name
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50_ms': float(np.percentile(values, 50) * 1e3),
+        'p95_ms': float(np.percentile(values, 95) * 1e3),
+        'p99_ms': float(np.percentile(values, 99) * 1e3),
+        'max_ms': float(max(values) * 1e3)
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def session_steps(session, user, iterations, seed, latencies, errors):
+    """
+    One simulated user: open the dashboard, then `iterations` times toggle a checkbox,
+    open Analytics, pick another start date and go back to the dashboard
+    A generator that yields after each rerun, so sessions can be interleaved
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed * 1000 + session)
+
+    def timed(action, step):
+        start = time.perf_counter()
+        try:
+            step()
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+        except Exception as e:
+            errors[action].append(f"session {session}: {type(e).__name__}: {e}")
+            return False
+        latencies[action].append(time.perf_counter() - start)
+        return True
+
+    at = AppTest.from_file(APP_FILE, default_timeout=120)
+    if user is not None:
+        at.query_params['user'] = user
+
+    if not timed('open_app', at.run):
+        return
+    yield
+
+    for _ in range(iterations):
+        checkboxes = [c for c in at.checkbox if c.key and c.key.startswith('check_')]
+        if checkboxes:
+            checkbox = rng.choice(checkboxes)
+            timed('toggle_checkbox', lambda: checkbox.set_value(not checkbox.value).run())
+            yield
+
+        if not timed('open_analytics', lambda: at.sidebar.radio[0].set_value('Analytics').run()):
+            return
+        yield
+
+        if at.date_input:
+            start_date = datetime.now().date() - timedelta(days=rng.randint(7, 120))
+            timed('change_date_range', lambda: at.date_input[0].set_value(start_date).run())
+            yield
+
+        if not timed('open_dashboard', lambda: at.sidebar.radio[0].set_value('Dashboard').run()):
+            return
+        yield
+
+
+def run_worker(data_dir, sessions, iterations, seed):
+    """
+    Run sessions [(session, user)] in data_dir, interleaving their reruns round-robin
+    AppTest reruns cannot overlap within a process, so this is how sessions share a
+    process (and its data stores); concurrency comes from running several workers
+    Returns (latencies, errors, file write counts, peak RSS in MB)
+    """
+    os.chdir(data_dir)
+    writes = WriteCounter(data_dir)
+    latencies, errors = defaultdict(list), defaultdict(list)
+
+    writes.active = True
+    running = [session_steps(session, user, iterations, seed, latencies, errors) for session, user in sessions]
+    while running:
+        for steps in list(running):
+            if next(steps, StopIteration) is StopIteration:
+                running.remove(steps)
+    writes.active = False
+
+    return dict(latencies), dict(errors), dict(writes.counts), peak_rss_mb()
+
+
+def run_load_test(sessions=10, iterations=3, users=1, habits=10, years=1, workers=1, seed=0):
+    """
+    Create a synthetic dataset per user in a temporary directory and drive `sessions`
+    sessions through the app, spread over the users and over `workers` processes
+    Returns the report dict
+    """
+    original_dir = os.getcwd()
+    data_dir = tempfile.mkdtemp(prefix='habit_load_test_')
+    os.chdir(data_dir)
+
+    try:
+        user_keys = [None] if users == 1 else [f'user{i}' for i in range(users)]
+        for i, user in enumerate(user_keys):
+            habits_df, logs_df = synthetic_data.generate_dataset(habits, years, seed=seed + i)
+            dh.save_habits(habits_df, user=user)
+            dh.save_logs(logs_df, user=user)
+
+        assigned = [(s, user_keys[s % len(user_keys)]) for s in range(sessions)]
+        start = time.perf_counter()
+        if workers == 1:
+            results = [run_worker(data_dir, assigned, iterations, seed)]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(run_worker, data_dir, assigned[w::workers], iterations, seed)
+                           for w in range(workers)]
+                results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    # Combine the workers' measurements
+    latencies, errors, writes = defaultdict(list), defaultdict(list), Counter()
+    for worker_latencies, worker_errors, worker_writes, _ in results:
+        for action, values in worker_latencies.items():
+            latencies[action].extend(values)
+        for action, messages in worker_errors.items():
+            errors[action].extend(messages)
+        writes.update(worker_writes)
+    peaks = [peak for *_, peak in results if peak is not None]
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'settings': {'sessions': sessions, 'iterations': iterations, 'users': users, 'habits': habits,
+                     'years': years, 'workers': workers, 'seed': seed},
+        'elapsed_s': elapsed,
+        'reruns': len(all_latencies),
+        'reruns_per_s': len(all_latencies) / elapsed if elapsed else None,
+        'latency': percentiles(all_latencies),
+        'latency_by_action': {action: percentiles(values) for action, values in latencies.items()},
+        'peak_rss_mb': max(peaks) if peaks else None,
+        'peak_rss_mb_total': sum(peaks) if peaks else None,
+        'file_writes': sum(writes.values()),
+        'file_writes_by_kind': dict(writes),
+        'file_writes_per_rerun': sum(writes.values()) / len(all_latencies) if all_latencies else None,
+        'errors': dict(errors)
+    }
+
+
+def print_report(report):
+    settings = report['settings']
+    print(f"{settings['sessions']} sessions x {settings['iterations']} iterations in {settings['workers']} "
+          f"worker(s), {settings['users']} user(s), {settings['habits']} habits x {settings['years']}y")
+    print(f"{report['reruns']} reruns in {report['elapsed_s']:.1f}s ({report['reruns_per_s']:.1f}/s)")
+
+    for action, stats in [('all', report['latency'])] + sorted(report['latency_by_action'].items()):
+        if stats['count']:
+            print(f"  {action:<18} n={stats['count']:<5} p50 {stats['p50_ms']:8.1f} ms  "
+                  f"p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms")
+
+    if report['peak_rss_mb'] is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB per worker, {report['peak_rss_mb_total']:.0f} MB in total")
+    if report['reruns']:
+        print(f"File writes: {report['file_writes']} ({report['file_writes_per_rerun']:.1f} per rerun) "
+              f"{report['file_writes_by_kind']}")
+
+    for action, messages in report['errors'].items():
+        print(f"Errors in {action}: {len(messages)}, first: {messages[0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent sessions of app.py")
+    parser.add_argument('--sessions', type=int, default=10, help="simulated sessions (default: 10)")
+    parser.add_argument('--iterations', type=int, default=3, help="flows per session (default: 3)")
+    parser.add_argument('--users', type=int, default=1, help="spread sessions over this many users (default: 1)")
+    parser.add_argument('--habits', type=int, default=10, help="habits per user (default: 10)")
+    parser.add_argument('--years', type=int, default=1, help="years of history per user (default: 1)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes to spread the sessions over, sharing the data directory (default: 1)")
+    parser.add_argument('--seed', type=int, default=0, help="synthetic data and action seed (default: 0)")
+    parser.add_argument('--output', help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(args.sessions, args.iterations, args.users, args.habits, args.years,
+                           args.workers, args.seed)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,254 @@
-def main():
-    print("Hello from repl-nix-workspace!")
+import argparse
+import sys
+from datetime import date, timedelta
+
+# Only the standard library and data_files are imported up front: check and uncheck queue
+# their log without loading pandas, so a check-in from a shell script or cron is fast.
+# The other commands import data_handler and utils when they run
+import data_files
+
+
+def find_habit(habits, name_or_id):
+    """
+    Return the habit whose id or name (case-insensitive) matches, or None
+    """
+    for habit in habits:
+        if habit['id'] == name_or_id:
+            return habit
+
+    for habit in habits:
+        if habit['name'].lower() == name_or_id.lower():
+            return habit
+
+    return None
+
+
+def parse_date(value):
+    """
+    argparse type for dates: 'today', 'yesterday' or YYYY-MM-DD
+    """
+    if value == 'today':
+        return date.today().isoformat()
+    if value == 'yesterday':
+        return (date.today() - timedelta(days=1)).isoformat()
+
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {value!r} (use YYYY-MM-DD)")
+
+
+def check(args, completed=True):
+    """
+    Mark a habit as completed (or not) for a day
+    """
+    habit = find_habit(data_files.read_habits(args.user), args.habit)
+    if habit is None:
+        print(f"Error: no habit named {args.habit!r}", file=sys.stderr)
+        return 1
+
+    log = {'habit_id': habit['id'], 'date': args.date, 'completed': completed}
+    value = getattr(args, 'value', None)
+    if value is not None:
+        # A measured check-in counts as completed once it reaches the habit's target
+        target = habit.get('target')
+        log.update(value=value, completed=value >= target if target is not None else value > 0)
+
+    data_files.queue_logs([log], args.user)
+    logged = '' if value is None else f" ({value:g} {habit.get('measure') or ''}".rstrip() + ')'
+    print(f"{'Checked' if log['completed'] else 'Unchecked'} {habit['name']} for {args.date}{logged}")
+    return 0
+
+
+def uncheck(args):
+    return check(args, completed=False)
+
+
+def streak(args):
+    """
+    Print the current and longest streak of one habit, in its periods, as of --as-of
+    """
+    import data_handler as dh
+    import periods
+    import utils
+
+    habits_df = dh.load_habits(args.user)
+    habit = find_habit(habits_df.to_dict('records'), args.habit)
+    if habit is None:
+        print(f"Error: no habit named {args.habit!r}", file=sys.stderr)
+        return 1
+
+    logs_df = dh.load_logs(user=args.user)
+    if args.as_of is None:
+        current = int(periods.streaks(habits_df, logs_df).loc[habit['id'], 'current_streak'])
+        longest = periods.longest_streaks(habits_df, args.user).get(habit['id'], 0)
+    else:
+        table = utils.get_streaks(habits_df, logs_df, args.as_of)
+        current, longest = (int(table.loc[habit['id'], column]) for column in ('current_streak', 'longest_streak'))
+    unit = periods.streak_unit(habit['frequency'])
+    print(f"{habit['name']}: current streak {periods.format_streak(current, unit)}, "
+          f"longest {periods.format_streak(longest, unit)}")
+    return 0
+
+
+def stats(args):
+    """
+    Print streaks and the completion rate over the last `days` days for every habit, as of --as-of
+    Streaks and completions are counted in each habit's periods (days, weeks, ...)
+    """
+    import data_handler as dh
+    import periods
+    import utils
+
+    habits_df = dh.load_habits(args.user)
+    if habits_df.empty:
+        print("No habits yet")
+        return 0
+
+    logs_df = dh.load_logs(user=args.user)
+    if args.as_of is None:
+        stats = utils.get_habit_stats(habits_df, logs_df, periods.longest_streaks(habits_df, args.user), args.days)
+    else:
+        stats = utils.get_habit_stats(habits_df, logs_df, days=args.days, as_of=args.as_of)
+
+    name_width = max(len('Habit'), *(len(habit['name']) for habit in stats))
+    print(f"{'Habit':<{name_width}}  {'Current':>7}  {'Longest':>7}  {'Done':>9}  {'Rate':>5}")
+
+    for habit in stats:
+        done = f"{habit['completed']}/{habit['expected']}"
+        print(
+            f"{habit['name']:<{name_width}}  "
+            f"{habit['current_streak']:>7}  "
+            f"{habit['longest_streak']:>7}  "
+            f"{done:>9}  "
+            f"{habit['rate']:>4.0f}%"
+        )
+    return 0
+
+
+def export(args):
+    """
+    Write a full backup, or with --since the changes after that sequence number
+    """
+    import data_handler as dh
+
+    if args.since is None:
+        export_file = dh.export_data(args.user, compact=args.compact)
+    elif args.compact:
+        print("Error: --compact only applies to full exports", file=sys.stderr)
+        return 2
+    else:
+        export_file = dh.export_changes(args.since, args.user)
+
+    if export_file is None:
+        return 1
+
+    print(export_file)
+    return 0
+
+
+def precompute(args):
+    """
+    Save today's streaks for the user, or every user, so the app and the API start the
+    day with them; run it from cron just after midnight
+    """
+    import data_store
+
+    users = [None] + data_files.list_users() if args.all_users else [args.user]
+    for user in users:
+        streaks = data_store.DataStore(user).precompute()
+        print(f"{user or 'default user'}: {len(streaks)} streaks for {date.today().isoformat()}")
+    return 0
+
+
+def remind(args):
+    """
+    Send a reminder for every habit whose streak breaks unless it is completed today
+    """
+    import reminders
+
+    users = None if args.all_users else [args.user]
+    sink = reminders.jsonl_sink(args.output) if args.output else reminders.stdout_sink
+    count = reminders.dispatch(sink, users)
+    if args.output:
+        print(f"{count} reminders written to {args.output}")
+    return 0
+
+
+def serve(args):
+    """
+    Run the JSON HTTP API until interrupted
+    """
+    import asyncio
+    import api
+
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='habit', description="Track habits from the command line")
+    parser.add_argument('--user', help="user whose data to use (default: the single-user data)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, handler, help_text in (
+        ('check', check, "mark a habit as completed"),
+        ('uncheck', uncheck, "mark a habit as not completed")
+    ):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('habit', help="habit name or id")
+        command.add_argument('--date', type=parse_date, default='today', help="YYYY-MM-DD, 'today' or 'yesterday'")
+        command.set_defaults(handler=handler)
+    commands.choices['check'].add_argument('--value', type=float,
+                                           help="amount done, for measured habits (e.g. minutes)")
+
+    command = commands.add_parser('streak', help="show a habit's current and longest streak")
+    command.add_argument('habit', help="habit name or id")
+    command.add_argument('--as-of', type=parse_date, help="show the streak as it stood at the end of this day")
+    command.set_defaults(handler=streak)
+
+    command = commands.add_parser('stats', help="show streaks and completion rates for every habit")
+    command.add_argument('--days', type=int, default=30, help="completion rate window (default: 30)")
+    command.add_argument('--as-of', type=parse_date, help="show the stats as they stood at the end of this day")
+    command.set_defaults(handler=stats)
+
+    command = commands.add_parser('export', help="write a backup file and print its name")
+    command.add_argument('--since', type=int, help="only export changes after this sequence number")
+    command.add_argument('--compact', action='store_true',
+                         help="drop the change journal up to this backup; later --since exports must start from it")
+    command.set_defaults(handler=export)
+
+    command = commands.add_parser('precompute', help="save today's streaks so the first render of the day is fast")
+    command.add_argument('--all-users', action='store_true', help="precompute the default user and every user")
+    command.set_defaults(handler=precompute)
+
+    command = commands.add_parser('remind', help="remind about habits whose streak breaks unless completed today")
+    command.add_argument('--all-users', action='store_true', help="check the default user and every user")
+    command.add_argument('--output', help="append reminders to this file as JSON lines instead of printing them")
+    command.set_defaults(handler=remind)
+
+    command = commands.add_parser('serve', help="serve the JSON HTTP API (see api.py)")
+    command.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    command.add_argument('--port', type=int, default=8765, help="port to listen on (default: 8765)")
+    command.set_defaults(handler=serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        data_files.user_dir(args.user)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    return args.handler(args)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import bisect
+import os
+import threading
+import time
+
+# Process-wide counters and histograms in the Prometheus text format. Metrics are
+# registered where they are fed (see profiling, data_handler and app.py). The API serves
+# its process's metrics at GET /metrics; the app rewrites HABIT_TRACKER_METRICS_FILE every
+# METRICS_INTERVAL seconds when it is set, e.g. for node_exporter's textfile collector
+METRICS_FILE = os.environ.get('HABIT_TRACKER_METRICS_FILE')
+METRICS_INTERVAL = 15
+
+# Seconds, like Prometheus' client defaults
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Bytes, from 1 KB to 64 MB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+_registry = {}
+_registry_lock = threading.Lock()
+_writer = None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count per combination of label values
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """
+    Observations counted into buckets per combination of label values, with their sum
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # {label values: [count per bucket plus one for +Inf, sum]}
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+
+        samples = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _format_value(float(bound))
+                samples.append((f'{self.name}_bucket', _format_labels(self.labels, key, [('le', le)]), cumulative))
+            samples.append((f'{self.name}_sum', _format_labels(self.labels, key), total))
+            samples.append((f'{self.name}_count', _format_labels(self.labels, key), cumulative))
+        return samples
+
+
+def _register(cls, name, documentation, labels, **kwargs):
+    """
+    Return the metric registered under name, creating it on first use
+    Registering again returns the same metric, so modules that are re-run (app.py) can
+    declare their metrics at the top
+    """
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, documentation, labels, **kwargs)
+        elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+            raise ValueError(f"Metric {name} is already registered with other labels or type")
+        return metric
+
+
+def counter(name, documentation, labels=()):
+    return _register(Counter, name, documentation, labels)
+
+
+def histogram(name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram, name, documentation, labels, buckets=buckets)
+
+
+def render():
+    """
+    All registered metrics in the Prometheus text exposition format
+    """
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def write_file(path):
+    """
+    Write the metrics to path, replacing it atomically so scrapers never read half a file
+    """
+    temp_file = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_file, 'w') as f:
+            f.write(render())
+        os.replace(temp_file, path)
+        return True
+    except Exception as e:
+        print(f"Error writing metrics to {path}: {e}")
+        return False
+
+
+def start_file_writer(path=METRICS_FILE, interval=METRICS_INTERVAL):
+    """
+    Rewrite the metrics file every `interval` seconds from a daemon thread
+    Only one writer runs per process; returns False when no path is configured
+    """
+    global _writer
+    if not path:
+        return False
+
+    def run():
+        while True:
+            write_file(path)
+            time.sleep(interval)
+
+    with _registry_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=run, name='metrics-file-writer', daemon=True)
+            _writer.start()
+    return True
@@ -0,0 +1,468 @@
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import data_handler as dh
+import profiling
+
+# Streaks and completion counted in each habit's own period: days for Daily habits, ISO
+# weeks (Monday to Sunday) for Weekly, calendar months for Monthly and N-day cycles from the
+# creation day for 'Every N days'. A period counts as completed if the habit was completed
+# on any day of it. 'Custom' without a cycle, and unknown frequencies, count as Daily.
+# Every function works on all habits at once: logs are bucketed into periods with numpy,
+# without a loop over habits
+KINDS = ('day', 'week', 'month', 'cycle')
+DAY, WEEK, MONTH, CYCLE = range(len(KINDS))
+
+# Frequency stored for a custom cycle, e.g. 'Every 3 days'
+CUSTOM_FREQUENCY = 'Every {days} days'
+_CUSTOM_PATTERN = re.compile(r'every\s+(\d+)\s+days?', re.IGNORECASE)
+
+# 1970-01-01 was a Thursday; shifting by 3 days makes ISO weeks start on Mondays
+_WEEK_OFFSET = 3
+
+# Column labels of day_patterns: weekdays from Monday, then months of the year
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def parse_frequency(frequency):
+    """
+    Return (kind, cycle_days) for a habit frequency: ('day', 1), ('week', 7), ('month', 0)
+    or ('cycle', N) for 'Every N days'
+    """
+    if frequency == 'Weekly':
+        return 'week', 7
+    if frequency == 'Monthly':
+        return 'month', 0
+
+    match = _CUSTOM_PATTERN.fullmatch(str(frequency).strip())
+    if match and int(match.group(1)) > 1:
+        return 'cycle', int(match.group(1))
+    return 'day', 1
+
+
+def streak_unit(frequency):
+    """
+    The period a habit's streak is counted in: 'day', 'week', 'month' or 'cycle'
+    """
+    return parse_frequency(frequency)[0]
+
+
+def format_streak(count, unit):
+    """
+    A streak length with its unit, e.g. '1 day' or '3 weeks'
+    """
+    return f"{count} {unit}{'' if count == 1 else 's'}"
+
+
+def _to_days(dates):
+    """
+    Days since 1970-01-01 of 'YYYY-MM-DD' strings (or anything numpy reads as dates)
+    """
+    return (np.asarray(dates, dtype='datetime64[D]') - dh.EPOCH_DAY).astype(np.int64)
+
+
+def schedules(habits_df):
+    """
+    Per-habit arrays (kind, cycle_days, anchor_day): kind indexes KINDS and anchor_day is
+    the creation day that custom cycles count from
+    """
+    parsed = [parse_frequency(frequency) for frequency in habits_df['frequency']]
+    kinds = np.array([KINDS.index(kind) for kind, _ in parsed], dtype=np.int64)
+    cycles = np.array([max(cycle, 1) for _, cycle in parsed], dtype=np.int64)
+    created = pd.to_datetime(habits_df['created_at'], errors='coerce').fillna(pd.Timestamp(0))
+    anchors = _to_days(created.to_numpy().astype('datetime64[D]'))
+    return kinds, cycles, anchors
+
+
+def period_index(day, kind, cycle, anchor):
+    """
+    Number of the period holding each day, elementwise over arrays of days and schedules
+    Consecutive periods have consecutive numbers
+    """
+    weeks = (day + _WEEK_OFFSET) // 7
+    months = (dh.EPOCH_DAY + day).astype('datetime64[M]').astype(np.int64)
+    cycles = (day - anchor) // cycle
+    return np.select([kind == WEEK, kind == MONTH, kind == CYCLE], [weeks, months, cycles], day)
+
+
+def period_start(period, kind, cycle, anchor):
+    """
+    First day of each period, the inverse of period_index
+    """
+    weeks = period * 7 - _WEEK_OFFSET
+    months = (period.astype('datetime64[M]').astype('datetime64[D]') - dh.EPOCH_DAY).astype(np.int64)
+    cycles = anchor + period * cycle
+    return np.select([kind == WEEK, kind == MONTH, kind == CYCLE], [weeks, months, cycles], period)
+
+
+def log_arrays(habits_df, logs_df):
+    """
+    (codes, days, completed) of logs, codes indexing habits_df rows (-1 for other habits)
+    """
+    # Look up and parse each distinct id and date once: a decade of logs repeats both millions of times
+    ids, distinct_ids = pd.factorize(logs_df['habit_id'], use_na_sentinel=False)
+    codes = pd.Index(habits_df['id']).get_indexer(pd.Index(distinct_ids).astype(str))[ids]
+    dates, distinct_dates = pd.factorize(logs_df['date'], use_na_sentinel=False)
+    days = _to_days(np.asarray(distinct_dates, dtype=object))[dates]
+    return codes, days, logs_df['completed'].to_numpy(dtype=bool)
+
+
+def _distinct_periods(codes, periods):
+    """
+    Sort (habit code, period) pairs by habit then period and drop repeats
+    """
+    order = np.lexsort((periods, codes))
+    codes, periods = codes[order], periods[order]
+    distinct = np.ones(len(codes), dtype=bool)
+    distinct[1:] = (codes[1:] != codes[:-1]) | (periods[1:] != periods[:-1])
+    return codes[distinct], periods[distinct]
+
+
+def _streak_table(habits_df, codes, days, completed, today=None):
+    """
+    The streak engine over log arrays; see streaks()
+    """
+    kinds, cycles, anchors = schedules(habits_df)
+    count = len(habits_df)
+    today_day = day_of(today or datetime.now())
+    current_period = period_index(np.full(count, today_day), kinds, cycles, anchors)
+
+    # Completed periods up to the current one, one row per (habit, period)
+    keep = completed & (codes >= 0) & (days <= today_day)
+    codes = codes[keep]
+    periods = period_index(days[keep], kinds[codes], cycles[codes], anchors[codes])
+    codes, periods = _distinct_periods(codes, periods)
+
+    # Length of the run of consecutive periods ending at each row
+    positions = np.arange(len(codes))
+    run_starts = np.ones(len(codes), dtype=bool)
+    run_starts[1:] = (codes[1:] != codes[:-1]) | (periods[1:] != periods[:-1] + 1)
+    runs = positions - np.maximum.accumulate(np.where(run_starts, positions, 0)) + 1
+
+    longest = np.zeros(count, dtype=np.int64)
+    np.maximum.at(longest, codes, runs)
+
+    # Each habit's last completed period and the run ending there
+    last_period = np.full(count, np.iinfo(np.int64).min // 2)
+    last_run = np.zeros(count, dtype=np.int64)
+    is_last = np.ones(len(codes), dtype=bool)
+    is_last[:-1] = codes[1:] != codes[:-1]
+    last_period[codes[is_last]] = periods[is_last]
+    last_run[codes[is_last]] = runs[is_last]
+
+    # The streak is current if its last period is this one or, while this one is still
+    # open, the one before
+    is_current = last_period >= current_period - 1
+    current = np.where(is_current, last_run, 0)
+    first_period = np.where(is_current, last_period - last_run + 1, current_period)
+    needs_since = period_start(first_period - 1, kinds, cycles, anchors)
+
+    return pd.DataFrame({
+        'current_streak': current,
+        'longest_streak': longest,
+        'done_current': last_period == current_period,
+        'unit': np.array(KINDS, dtype=object)[kinds],
+        'needs_since': (dh.EPOCH_DAY + needs_since).astype(str)
+    }, index=pd.Index(habits_df['id'], name='id'))
+
+
+@profiling.timed
+def streaks(habits_df, logs_df, today=None):
+    """
+    Streaks of every habit in its own periods, from the logs given
+    Returns a DataFrame indexed by habit id with current_streak and longest_streak (in
+    periods), done_current (completed in the current period), unit (see KINDS) and
+    needs_since: the first day logs must reach back to for the current streak to be whole
+    """
+    codes, days, completed = log_arrays(habits_df, logs_df)
+    return _streak_table(habits_df, codes, days, completed, today)
+
+
+class HistoryIndex:
+    """
+    Every habit's completed periods laid out for as-of queries, so streaks on any past day
+    are answered without replaying logs
+    One row per (habit, period), sorted by habit then period, with the first day the
+    period was completed, the run of consecutive periods ending there and the longest run
+    up to it; a row's position within its habit is the prefix count of completed periods.
+    Building sorts the logs once; each query is one binary search per habit
+    """
+
+    # Rows are keyed habit * _KEY_SPAN + period, with periods shifted to be non-negative
+    _KEY_SPAN = 1 << 40
+    _KEY_SHIFT = 1 << 39
+
+    @profiling.timed
+    def __init__(self, habits_df, logs_df):
+        self.ids = pd.Index(habits_df['id'], name='id')
+        self.kinds, self.cycles, self.anchors = schedules(habits_df)
+
+        # First completed day of each (habit, period)
+        codes, days, completed = log_arrays(habits_df, logs_df)
+        keep = completed & (codes >= 0)
+        codes, days = codes[keep], days[keep]
+        # Periods follow days, so sorting by (habit, day) sorts by (habit, period) too
+        order = np.argsort(codes * self._KEY_SPAN + days, kind='stable')
+        codes, days = codes[order], days[order]
+        periods = period_index(days, self.kinds[codes], self.cycles[codes], self.anchors[codes])
+        first = np.ones(len(codes), dtype=bool)
+        first[1:] = (codes[1:] != codes[:-1]) | (periods[1:] != periods[:-1])
+        self.codes, self.periods, self.first_days = codes[first], periods[first], days[first]
+        self.keys = self.codes * self._KEY_SPAN + self.periods + self._KEY_SHIFT
+
+        # Run boundaries: the run of consecutive periods ending at each row, and the
+        # longest so far (a running max that restarts with each habit)
+        positions = np.arange(len(self.codes))
+        run_starts = np.ones(len(self.codes), dtype=bool)
+        run_starts[1:] = (self.codes[1:] != self.codes[:-1]) | (self.periods[1:] != self.periods[:-1] + 1)
+        self.runs = positions - np.maximum.accumulate(np.where(run_starts, positions, 0)) + 1
+        offsets = self.codes * self._KEY_SPAN
+        self.longest = np.maximum.accumulate(self.runs + offsets) - offsets
+        self.habit_starts = np.searchsorted(self.codes, np.arange(len(self.ids)))
+
+    @profiling.timed
+    def streaks(self, as_of=None):
+        """
+        Streaks of every habit as they stood at the end of as_of (default today), like streaks()
+        Returns a DataFrame indexed by habit id with current_streak, longest_streak,
+        done_current, completed_periods (up to as_of) and unit
+        """
+        count = len(self.ids)
+        day = day_of(as_of or datetime.now())
+        habits = np.arange(count)
+        current_period = period_index(np.full(count, day), self.kinds, self.cycles, self.anchors)
+        units = np.array(KINDS, dtype=object)[self.kinds]
+        if not len(self.keys):
+            zeros = np.zeros(count, dtype=np.int64)
+            return pd.DataFrame({
+                'current_streak': zeros, 'longest_streak': zeros, 'done_current': zeros.astype(bool),
+                'completed_periods': zeros, 'unit': units
+            }, index=self.ids)
+
+        # Last completed period up to the current one; if the current one was only
+        # completed after as_of, the one before
+        rows = np.searchsorted(self.keys, habits * self._KEY_SPAN + current_period + self._KEY_SHIFT, side='right') - 1
+        safe = np.maximum(rows, 0)
+        rows = rows - ((rows >= self.habit_starts) & (self.periods[safe] == current_period)
+                       & (self.first_days[safe] > day))
+        found = rows >= self.habit_starts
+        rows = np.maximum(rows, 0)
+
+        last_period = np.where(found, self.periods[rows], np.iinfo(np.int64).min // 2)
+        is_current = last_period >= current_period - 1
+
+        return pd.DataFrame({
+            'current_streak': np.where(is_current & found, self.runs[rows], 0),
+            'longest_streak': np.where(found, self.longest[rows], 0),
+            'done_current': last_period == current_period,
+            'completed_periods': np.where(found, rows - self.habit_starts + 1, 0),
+            'unit': units
+        }, index=self.ids)
+
+
+@profiling.timed
+def done_current(habits_df, logs_df, today=None):
+    """
+    Whether each habit was completed in its current period, as a bool Series indexed by habit id
+    Only logs from the earliest current period on are read
+    """
+    kinds, cycles, anchors = schedules(habits_df)
+    today_day = day_of(today or datetime.now())
+    starts = period_start(period_index(np.full(len(habits_df), today_day), kinds, cycles, anchors),
+                          kinds, cycles, anchors)
+
+    done = np.zeros(len(habits_df), dtype=bool)
+    if len(habits_df):
+        recent = logs_df[logs_df['date'] >= str(dh.EPOCH_DAY + starts.min())]
+        codes, days, completed = log_arrays(habits_df, recent)
+        rows = np.maximum(codes, 0)
+        keep = completed & (codes >= 0) & (days >= starts[rows]) & (days <= today_day)
+        done[codes[keep]] = True
+    return pd.Series(done, index=pd.Index(habits_df['id'], name='id'), name='done_current')
+
+
+@profiling.timed
+def longest_streaks(habits_df, user=None):
+    """
+    Return {habit_id: longest streak in its periods} over the whole history
+    Daily habits use data_handler.load_longest_streaks; the others are computed from the
+    columnar snapshot
+    """
+    longest = dh.load_longest_streaks(user)
+    periodic = habits_df[[streak_unit(frequency) != 'day' for frequency in habits_df['frequency']]]
+    if periodic.empty:
+        return longest
+
+    habit_ids, habit_code, day, completed = dh.load_log_arrays(user)
+    codes = pd.Index(periodic['id']).get_indexer(pd.Index(habit_ids, dtype=object))[np.asarray(habit_code, dtype=np.intp)]
+    table = _streak_table(periodic, codes, np.asarray(day, dtype=np.int64), np.asarray(completed))
+    return {**longest, **table['longest_streak'].to_dict()}
+
+
+def day_of(value):
+    """
+    Days since 1970-01-01 of a date, datetime or 'YYYY-MM-DD...' string
+    """
+    return int(_to_days(pd.Timestamp(value).strftime('%Y-%m-%d')))
+
+
+@profiling.timed
+def occurrences(habits_df, logs_df, start_date, end_date, today=None):
+    """
+    The expected-occurrence calendar: one row per (habit, period) a habit was due in
+    between start_date and end_date, from the day it was created and up to today
+    A period is due on its last day, or on the range end if that comes first. A period
+    that ends after today is only included once completed
+    Returns a DataFrame with code (row of habits_df), period, due (day) and completed
+    """
+    if habits_df.empty:
+        return pd.DataFrame({'code': [], 'period': [], 'due': [], 'completed': []}, dtype=np.int64)
+
+    kinds, cycles, anchors = schedules(habits_df)
+    count = len(habits_df)
+    today_day = day_of(today or datetime.now())
+    first_day = np.maximum(day_of(start_date), anchors)
+    last_day = np.full(count, min(day_of(end_date), today_day))
+
+    # Every period from each habit's first to last day, habit by habit
+    first = period_index(first_day, kinds, cycles, anchors)
+    counts = np.where(first_day <= last_day, period_index(last_day, kinds, cycles, anchors) - first + 1, 0)
+    codes = np.repeat(np.arange(count), counts)
+    offsets = np.arange(len(codes)) - np.repeat(np.cumsum(counts) - counts, counts)
+    periods = first[codes] + offsets
+    ends = period_start(periods + 1, kinds[codes], cycles[codes], anchors[codes]) - 1
+
+    # Periods with a completion inside each habit's own range
+    log_codes, days, completed = log_arrays(habits_df, logs_df)
+    rows = np.maximum(log_codes, 0)
+    keep = completed & (log_codes >= 0) & (days >= first_day[rows]) & (days <= last_day[rows])
+    log_codes, days = log_codes[keep], days[keep]
+    done_codes, done_periods = _distinct_periods(
+        log_codes, period_index(days, kinds[log_codes], cycles[log_codes], anchors[log_codes])
+    )
+    done = np.isin(codes * (1 << 32) + periods, done_codes * (1 << 32) + done_periods)
+
+    due = (ends <= today_day) | done
+    return pd.DataFrame({
+        'code': codes[due],
+        'period': periods[due],
+        'due': np.minimum(ends, last_day[codes])[due],
+        'completed': done[due]
+    })
+
+
+@profiling.timed
+def completion(habits_df, logs_df, start_date, end_date, today=None):
+    """
+    Periods completed out of the periods expected per habit between two days, inclusive
+    (see occurrences): days the app was not opened count against the rate
+    Returns a DataFrame indexed by habit id with completed, expected and rate (%)
+    """
+    calendar = occurrences(habits_df, logs_df, start_date, end_date, today)
+    codes = calendar['code'].to_numpy()
+    expected = np.bincount(codes, minlength=len(habits_df))
+    done = np.bincount(codes, weights=calendar['completed'].to_numpy(), minlength=len(habits_df)).astype(np.int64)
+
+    return pd.DataFrame({
+        'completed': done,
+        'expected': expected,
+        'rate': np.where(expected > 0, done / np.maximum(expected, 1) * 100, 0.0)
+    }, index=pd.Index(habits_df['id'], name='id'))
+
+
+@profiling.timed
+def daily_completion(habits_df, logs_df, start_date, end_date, today=None):
+    """
+    Occurrences completed and due on each day between two days (see occurrences)
+    Returns a DataFrame with date ('YYYY-MM-DD'), completed, expected and rate (%, NaN
+    on days nothing was due)
+    """
+    calendar = occurrences(habits_df, logs_df, start_date, end_date, today)
+    first = day_of(start_date)
+    days = max(day_of(end_date) - first + 1, 0)
+    due = calendar['due'].to_numpy() - first
+    expected = np.bincount(due, minlength=days)[:days]
+    done = np.bincount(due, weights=calendar['completed'].to_numpy(), minlength=days)[:days]
+
+    return pd.DataFrame({
+        'date': (dh.EPOCH_DAY + first + np.arange(days)).astype(str),
+        'completed': done.astype(np.int64),
+        'expected': expected,
+        'rate': np.where(expected > 0, done / np.maximum(expected, 1) * 100, np.nan)
+    })
+
+
+@profiling.timed
+def completion_matrix(habits_df, logs_df, start_date, end_date):
+    """
+    Habit x day arrays over a date range, rows in habits_df order: done (completed that
+    day) and active (on or after the day the habit was created)
+    Returns (done, active) as boolean arrays of shape (habits, days)
+    """
+    _, _, anchors = schedules(habits_df)
+    first = day_of(start_date)
+    days = max(day_of(end_date) - first + 1, 0)
+    active = (first + np.arange(days))[np.newaxis, :] >= anchors[:, np.newaxis]
+
+    codes, log_days, completed = log_arrays(habits_df, logs_df)
+    keep = completed & (codes >= 0) & (log_days >= first) & (log_days < first + days)
+    done = np.zeros((len(habits_df), days), dtype=bool)
+    done[codes[keep], log_days[keep] - first] = True
+    return done & active, active
+
+
+def _day_buckets(days):
+    """
+    Column of each day in day_patterns: its weekday (0-6), and its month of the year (7-18)
+    """
+    weekdays = (days + _WEEK_OFFSET) % 7
+    months = (dh.EPOCH_DAY + days).astype('datetime64[M]').astype(np.int64) % 12
+    return weekdays, len(WEEKDAYS) + months
+
+
+@profiling.timed
+def day_patterns(habits_df, logs_df, start_date, end_date, today=None):
+    """
+    Days completed and days active per habit by weekday and by month of the year, between
+    two days and from the day each habit was created up to today
+    Every habit is counted in days whatever its frequency, so a weekly habit shows which
+    weekdays it gets done on
+    Returns (completed, active) DataFrames indexed by habit id, columns WEEKDAYS + MONTHS
+    """
+    ids = pd.Index(habits_df['id'], name='id')
+    columns = list(WEEKDAYS + MONTHS)
+    if habits_df.empty:
+        empty = pd.DataFrame(0, index=ids, columns=columns)
+        return empty, empty.copy()
+
+    count, width = len(habits_df), len(columns)
+    _, _, anchors = schedules(habits_df)
+    first_day = np.maximum(day_of(start_date), anchors)
+    last_day = min(day_of(end_date), day_of(today or datetime.now()))
+
+    # Completed logs in each habit's range, counted per (habit, column) with one bincount each
+    codes, days, completed = log_arrays(habits_df, logs_df)
+    rows = np.maximum(codes, 0)
+    keep = completed & (codes >= 0) & (days >= first_day[rows]) & (days <= last_day)
+    codes, days = codes[keep], days[keep]
+    weekdays, months = _day_buckets(days)
+    done = (np.bincount(codes * width + weekdays, minlength=count * width)
+            + np.bincount(codes * width + months, minlength=count * width)).reshape(count, width)
+
+    # Active days from running totals of each column over the whole range: one lookup per habit
+    base = int(first_day.min())
+    span = np.arange(base, max(last_day, base - 1) + 1)
+    weekdays, months = _day_buckets(span)
+    totals = np.zeros((len(span) + 1, width), dtype=np.int64)
+    totals[np.arange(1, len(span) + 1), weekdays] = 1
+    totals[np.arange(1, len(span) + 1), months] = 1
+    totals = totals.cumsum(axis=0)
+    starts = np.clip(first_day - base, 0, len(span))
+    active = totals[len(span)] - totals[starts]
+
+    return (pd.DataFrame(done, index=ids, columns=columns),
+            pd.DataFrame(active, index=ids, columns=columns))
@@ -0,0 +1,327 @@
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Opt-in timing of app reruns. A session that opts in (?profile=1, or every session when
+# HABIT_TRACKER_PROFILE=1) keeps a Profiler; functions decorated with @timed, blocks in
+# section() and cache lookups reported with cache_lookup() are recorded into the rerun
+# active in the current thread. Timed calls and cache lookups also always feed the
+# process-wide metrics (see metrics)
+ENABLED = os.environ.get('HABIT_TRACKER_PROFILE', '') not in ('', '0')
+
+# Memory diagnostics (?memory=1 or HABIT_TRACKER_MEMORY=1) also trace allocations with
+# tracemalloc: each section gets the bytes it left allocated, and each rerun the lines
+# that retained the most. tracemalloc sees the whole process and slows it down, so use it
+# with one session at a time. Tracing runs only while a rerun with memory diagnostics is open
+MEMORY_ENABLED = os.environ.get('HABIT_TRACKER_MEMORY', '') not in ('', '0')
+TOP_ALLOCATIONS = 10
+
+# Open reruns tracing memory, and whether they started tracemalloc (so they may stop it)
+_memory_reruns = 0
+_started_tracing = False
+_memory_lock = threading.Lock()
+
+# Reruns kept for the rolling averages
+HISTORY = 20
+
+_local = threading.local()
+
+FUNCTION_SECONDS = metrics.histogram(
+    'habit_tracker_function_seconds', "Duration of data_handler, data store, utils and chart calls", ['function']
+)
+CACHE_LOOKUPS = metrics.counter(
+    'habit_tracker_cache_lookups_total', "Cache lookups by cache and result (hit or miss)", ['cache', 'result']
+)
+
+
+class Rerun:
+    """
+    Timings of one rerun: {section: [seconds, calls, bytes left allocated]} and
+    {cache: [hits, misses]}
+    Sections nest, so a section's time and memory include the sections it called
+    """
+
+    def __init__(self, memory=False):
+        self.thread = threading.get_ident()
+        self.started = time.perf_counter()
+        self.wall_time = None
+        self.sections = defaultdict(lambda: [0.0, 0, 0])
+        self.caches = defaultdict(lambda: [0, 0])
+
+        # Memory diagnostics: bytes left allocated and the peak, both relative to the start,
+        # and the top [{location, kb, blocks}] retained by line
+        self.memory = memory
+        self.allocated = None
+        self.peak = None
+        self.allocations = []
+        if memory:
+            _start_tracing()
+            # Released by close(), or when a rerun left open is dropped with its session
+            self._release = weakref.finalize(self, _stop_tracing)
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+            self._memory_start = tracemalloc.get_traced_memory()[0]
+
+    def close(self):
+        """
+        Stop counting this rerun as tracing memory; safe to call more than once
+        """
+        if self.memory:
+            self._release()
+
+
+def _start_tracing():
+    global _memory_reruns, _started_tracing
+    with _memory_lock:
+        if _memory_reruns == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _memory_reruns += 1
+
+
+def _stop_tracing():
+    """
+    Stop tracemalloc once the last rerun tracing memory is closed, unless it was already
+    tracing before (e.g. PYTHONTRACEMALLOC)
+    """
+    global _memory_reruns, _started_tracing
+    with _memory_lock:
+        _memory_reruns -= 1
+        if _memory_reruns == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class Profiler:
+    """
+    A session's recent reruns
+    """
+
+    def __init__(self, history=HISTORY, memory=False):
+        self.history = deque(maxlen=history)
+        self.current = None
+        self.memory = memory
+
+    def activate(self):
+        """
+        Record into this session's current rerun from this thread, starting one if needed
+        Callbacks run before the script in the same thread, so they join its rerun, and so
+        does a rerun interrupted by st.rerun(); one left open by another thread is dropped
+        """
+        if self.current is None or self.current.thread != threading.get_ident():
+            if self.current is not None:
+                self.current.close()
+            self.current = Rerun(self.memory)
+        _local.rerun = self.current
+
+    def finish(self):
+        """
+        Close the current rerun and add it to the history; returns it
+        """
+        rerun, self.current = self.current, None
+        _local.rerun = None
+        if rerun is None:
+            return None
+
+        rerun.wall_time = time.perf_counter() - rerun.started
+        try:
+            if rerun.memory and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                rerun.allocated = current - rerun._memory_start
+                rerun.peak = peak - rerun._memory_start
+                rerun.allocations = _top_allocations(rerun._snapshot)
+        finally:
+            # Snapshots are large; keep only the summary
+            rerun._snapshot = None
+            rerun.close()
+
+        self.history.append(rerun)
+        return rerun
+
+    def summary(self):
+        """
+        Rows for the last rerun and the average over the history
+        Returns (sections, caches) as lists of dicts, slowest sections first
+        """
+        if not self.history:
+            return [], []
+
+        last, count = self.history[-1], len(self.history)
+
+        def average(name, field):
+            return sum(rerun.sections.get(name, (0.0, 0, 0))[field] for rerun in self.history) / count
+
+        sections = [{
+            'section': 'Rerun',
+            'last_ms': last.wall_time * 1e3,
+            'calls': 1,
+            'avg_ms': sum(rerun.wall_time for rerun in self.history) / count * 1e3,
+            'avg_calls': 1.0
+        }]
+        if self.memory:
+            sections[0]['allocated_kb'] = (last.allocated or 0) / 1024
+
+        for name in sorted({name for rerun in self.history for name in rerun.sections}):
+            seconds, calls, allocated = last.sections.get(name, (0.0, 0, 0))
+            row = {
+                'section': name,
+                'last_ms': seconds * 1e3,
+                'calls': calls,
+                'avg_ms': average(name, 0) * 1e3,
+                'avg_calls': average(name, 1)
+            }
+            if self.memory:
+                row['allocated_kb'] = allocated / 1024
+            sections.append(row)
+        sections[1:] = sorted(sections[1:], key=lambda row: row['avg_ms'], reverse=True)
+
+        caches = []
+        for name in sorted({name for rerun in self.history for name in rerun.caches}):
+            hits, misses = last.caches.get(name, (0, 0))
+            total_hits = sum(rerun.caches.get(name, (0, 0))[0] for rerun in self.history)
+            total_misses = sum(rerun.caches.get(name, (0, 0))[1] for rerun in self.history)
+            caches.append({
+                'cache': name,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else None,
+                'avg_hit_rate': total_hits / (total_hits + total_misses) if total_hits + total_misses else None
+            })
+
+        return sections, caches
+
+
+def _top_allocations(before):
+    """
+    The lines whose allocations grew the most since the snapshot `before`
+    """
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')]
+    after = tracemalloc.take_snapshot().filter_traces(ignore)
+    stats = after.compare_to(before.filter_traces(ignore), 'lineno')
+
+    allocations = []
+    for stat in stats[:TOP_ALLOCATIONS]:
+        if stat.size_diff <= 0:
+            break
+        frame = stat.traceback[0]
+        allocations.append({
+            'location': f"{os.sep.join(frame.filename.split(os.sep)[-2:])}:{frame.lineno}",
+            'kb': stat.size_diff / 1024,
+            'blocks': stat.count_diff
+        })
+    return allocations
+
+
+def _traced_memory(rerun):
+    return tracemalloc.get_traced_memory()[0] if rerun is not None and rerun.memory else 0
+
+
+def _record(rerun, name, seconds, allocated):
+    if rerun is not None:
+        entry = rerun.sections[name]
+        entry[0] += seconds
+        entry[1] += 1
+        entry[2] += allocated
+
+
+@contextmanager
+def section(name):
+    """
+    Time a block as a named section of the active rerun
+    """
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is None:
+        yield
+        return
+
+    start, memory_start = time.perf_counter(), _traced_memory(rerun)
+    try:
+        yield
+    finally:
+        _record(rerun, name, time.perf_counter() - start, _traced_memory(rerun) - memory_start)
+
+
+def timed(func):
+    """
+    Decorator timing each call of a function as the section module.function, and in
+    the habit_tracker_function_seconds metric
+    """
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        rerun = getattr(_local, 'rerun', None)
+        start, memory_start = time.perf_counter(), _traced_memory(rerun)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            FUNCTION_SECONDS.observe(elapsed, function=name)
+            _record(rerun, name, elapsed, _traced_memory(rerun) - memory_start)
+
+    return wrapper
+
+
+def cache_lookup(name, hit):
+    """
+    Count a hit or miss of a named cache in the active rerun and in the metrics
+    """
+    CACHE_LOOKUPS.inc(cache=name, result='hit' if hit else 'miss')
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun.caches[name][0 if hit else 1] += 1
+
+
+def deep_size(obj, skip=()):
+    """
+    Approximate bytes held by obj and everything it references, each object counted once
+    pandas and numpy objects count their data; instances of the `skip` types count nothing
+    """
+    seen, size, pending = set(), 0, [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, skip):
+            continue
+        seen.add(id(obj))
+
+        if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+            usage = obj.memory_usage(deep=True)
+            size += int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+        elif isinstance(obj, np.ndarray):
+            size += obj.nbytes
+        elif isinstance(obj, type) or callable(obj) or type(obj).__name__ == 'module':
+            # Classes, functions and modules are shared, not held by the object
+            continue
+        else:
+            size += sys.getsizeof(obj, 0)
+            if isinstance(obj, dict):
+                pending.extend(obj.keys())
+                pending.extend(obj.values())
+            elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+                pending.extend(obj)
+            elif hasattr(obj, '__dict__'):
+                pending.append(vars(obj))
+    return size
+
+
+def object_sizes(objects, skip=()):
+    """
+    deep_size of each value in a {name: object} mapping, largest first
+    Returns a list of {'name', 'kb', 'type'} dicts
+    """
+    sizes = [
+        {'name': str(name), 'kb': deep_size(obj, skip) / 1024, 'type': type(obj).__name__}
+        for name, obj in objects.items()
+    ]
+    return sorted(sizes, key=lambda row: row['kb'], reverse=True)
@@ -0,0 +1,89 @@
+import json
+from datetime import date, timedelta
+
+import data_files
+import data_handler as dh
+import metrics
+import periods
+import profiling
+
+# Reminders for daily habits whose streak breaks unless they are completed today: a streak
+# of at least MIN_STREAK days ending yesterday. Every user is scanned from the streak index
+# that data_handler keeps current on each write (see load_streak_index), so no logs are
+# read. Reminders go to a sink, any callable taking a list of reminder dicts; stdout_sink
+# and jsonl_sink stand in for real delivery
+MIN_STREAK = 2
+
+REMINDERS_SENT = metrics.counter('habit_tracker_reminders_total', "At-risk streak reminders dispatched")
+
+
+@profiling.timed
+def find_at_risk(users=None, today=None):
+    """
+    Return a reminder {'user', 'habit_id', 'habit', 'streak', 'date'} for every habit at risk today
+    users defaults to the default user plus every user with a data directory
+    """
+    today = today or date.today()
+    yesterday = (today - timedelta(days=1)).isoformat()
+    if users is None:
+        users = [None] + data_files.list_users()
+
+    reminders = []
+    for user in users:
+        try:
+            habits = data_files.read_habits(user)
+            if not habits:
+                continue
+
+            at_risk = {
+                habit_id: run for habit_id, (last_day, run) in dh.load_streak_index(user).items()
+                if last_day == yesterday and run >= MIN_STREAK
+            }
+        except Exception as e:
+            print(f"Error finding reminders for {user or 'the default user'}: {e}")
+            continue
+
+        for habit in habits:
+            # The index counts days, so habits with longer periods are left out
+            if habit['id'] in at_risk and periods.streak_unit(habit.get('frequency')) == 'day':
+                reminders.append({
+                    'user': user,
+                    'habit_id': habit['id'],
+                    'habit': habit['name'],
+                    'streak': at_risk[habit['id']],
+                    'date': today.isoformat()
+                })
+
+    return reminders
+
+
+def stdout_sink(reminders):
+    """
+    Print one line per reminder
+    """
+    for reminder in reminders:
+        print(f"{reminder['user'] or 'default user'}: complete '{reminder['habit']}' today "
+              f"to keep your {reminder['streak']}-day streak")
+
+
+def jsonl_sink(path):
+    """
+    Return a sink appending reminders to path, one JSON object per line
+    """
+    def sink(reminders):
+        with open(path, 'a') as f:
+            f.write(''.join(json.dumps(reminder) + '\n' for reminder in reminders))
+
+    return sink
+
+
+def dispatch(sink=stdout_sink, users=None, today=None):
+    """
+    Find the habits at risk today and pass them to sink in a single call
+    Returns the number of reminders dispatched
+    """
+    reminders = find_at_risk(users, today)
+    if reminders:
+        sink(reminders)
+        REMINDERS_SENT.inc(len(reminders))
+    return len(reminders)
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+import data_handler as dh
+import periods
+import profiling
+
+# Completed and expected occurrences per (category, day), kept next to a store's logs so
+# category views read a few thousand cells instead of rescanning every log. Rates use the
+# same expected-occurrence calendar as the other views (see periods.occurrences): each period
+# a habit was due in counts on the day it ends, whether or not anything was logged, and the
+# period still running today counts once completed. A cube is built for one day from one
+# bincount over the calendar; a check-in then only re-counts the periods its logs fall in.
+# Rows are categories, columns days from `since` to today
+
+# (habit code, period) pairs as one int64 key
+_KEY_SPAN = 1 << 32
+
+
+class CategoryCube:
+    """
+    Completed and expected occurrences per category and day for one set of habits, from
+    since up to today
+    Logs of habits the cube was not built with are ignored
+    """
+
+    def __init__(self, habits_df, logs_df, since, today=None):
+        self.habits = habits_df.reset_index(drop=True)
+        self.categories, rows = np.unique(habits_df['category'].astype(str).to_numpy(), return_inverse=True)
+        self.habit_rows = rows.reshape(-1)
+        self.kinds, self.cycles, self.anchors = periods.schedules(habits_df)
+        self.since = pd.Timestamp(since).strftime('%Y-%m-%d')
+        self.today = periods.day_of(today or datetime.now())
+        self.first_day = periods.day_of(self.since)
+
+        shape = (len(self.categories), max(self.today - self.first_day + 1, 0))
+        self.completed = np.zeros(shape, dtype=np.int32)
+        self.expected = np.zeros(shape, dtype=np.int32)
+        self._add_occurrences(np.arange(len(self.habits)), logs_df)
+
+    def _add_occurrences(self, codes, logs_df, sign=1):
+        """
+        Count the calendar of the habits at rows `codes` into the cube, or out of it with sign=-1
+        """
+        today = dh.EPOCH_DAY + self.today
+        calendar = periods.occurrences(self.habits.iloc[codes], logs_df, self.since, today, today)
+        calendar_codes = np.asarray(codes)[calendar['code'].to_numpy()]
+        self._add_cells(calendar_codes, calendar['due'].to_numpy(), calendar['completed'].to_numpy(dtype=bool),
+                        np.full(len(calendar), sign), np.full(len(calendar), sign))
+
+    def _add_cells(self, codes, due, completed, completed_delta, expected_delta):
+        width = self.expected.shape[1]
+        cells = self.habit_rows[codes] * width + (due - self.first_day)
+        np.add.at(self.expected.reshape(-1), cells, expected_delta.astype(np.int32))
+        np.add.at(self.completed.reshape(-1), cells[completed], completed_delta[completed].astype(np.int32))
+
+    def _period_keys(self, logs_df, completed_only=False):
+        """
+        (habit code, period) keys of logs inside the cube's range, on or after their habit's creation
+        """
+        codes, days, completed = periods.log_arrays(self.habits, logs_df)
+        first_day = np.maximum(self.first_day, self.anchors[np.maximum(codes, 0)])
+        keep = (codes >= 0) & (days >= first_day) & (days <= self.today)
+        if completed_only:
+            keep &= completed
+        codes, days = codes[keep], days[keep]
+        period = periods.period_index(days, self.kinds[codes], self.cycles[codes], self.anchors[codes])
+        return codes * _KEY_SPAN + period
+
+    def update(self, logs_before, logs_after, written_logs):
+        """
+        Re-count the periods written logs fall in, given the logs before and after the write
+        A period counts as completed once any of its days is, so only these periods can change
+        """
+        keys = np.unique(self._period_keys(written_logs))
+        if not len(keys):
+            return
+
+        # Only the logs of the habits written to decide those periods
+        ids = self.habits['id'].to_numpy()[np.unique(keys // _KEY_SPAN)]
+        was_done = np.isin(keys, self._period_keys(logs_before[logs_before['habit_id'].isin(ids)], True))
+        is_done = np.isin(keys, self._period_keys(logs_after[logs_after['habit_id'].isin(ids)], True))
+        changed = was_done != is_done
+        if not changed.any():
+            return
+
+        keys, delta = keys[changed], is_done[changed].astype(np.int64) - was_done[changed]
+        codes, period = keys // _KEY_SPAN, keys % _KEY_SPAN
+        ends = periods.period_start(period + 1, self.kinds[codes], self.cycles[codes], self.anchors[codes]) - 1
+        # Periods still running are only expected once completed
+        running = ends > self.today
+        self._add_cells(codes, np.minimum(ends, self.today), np.ones(len(keys), dtype=bool), delta,
+                        np.where(running, delta, 0))
+
+    def remove(self, habit_id, logs_df):
+        """
+        Count a habit out of the cube, given its logs
+        """
+        codes = np.flatnonzero(self.habits['id'].to_numpy() == habit_id)
+        if len(codes):
+            self._add_occurrences(codes, logs_df, sign=-1)
+
+    @profiling.timed
+    def frame(self, start_date, end_date, categories=None):
+        """
+        Return the cells between two days, inclusive, as a DataFrame with date ('YYYY-MM-DD'),
+        category, completed, expected and rate (%); days nothing was due in a category are left out
+        categories, if given, limits the rows
+        """
+        width = self.expected.shape[1]
+        lo = int(np.clip(periods.day_of(start_date) - self.first_day, 0, width))
+        hi = int(np.clip(periods.day_of(end_date) - self.first_day + 1, lo, width))
+
+        rows = np.arange(len(self.categories))
+        if categories is not None:
+            rows = rows[np.isin(self.categories, list(categories))]
+        expected = self.expected[rows, lo:hi]
+        completed = self.completed[rows, lo:hi]
+
+        row, col = np.nonzero(expected)
+        done, count = completed[row, col], expected[row, col]
+        return pd.DataFrame({
+            'date': (dh.EPOCH_DAY + self.first_day + lo + col).astype(str),
+            'category': self.categories[rows[row]],
+            'completed': done.astype(np.int64),
+            'expected': count.astype(np.int64),
+            'rate': done / count * 100
+        })
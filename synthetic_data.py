@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from data_handler import HABIT_COLUMNS, LOG_COLUMNS, LOG_VALUE_COLUMN
+
+# Reproducible fake habit data for benchmarks and manual testing
+
+CATEGORIES = ['Health', 'Productivity', 'Self-care', 'Relationships', 'Other']
+FREQUENCIES = ['Daily', 'Weekly', 'Monthly']
+
+
+def generate_habits(habits=10, seed=0):
+    """
+    Generate a habits DataFrame with ids h0..h{habits-1}
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id': [f'h{i}' for i in range(habits)],
+        'name': [f'Habit {i}' for i in range(habits)],
+        'category': rng.choice(CATEGORIES, size=habits),
+        'frequency': rng.choice(FREQUENCIES, size=habits, p=[0.8, 0.15, 0.05]),
+        'created_at': ['2000-01-01'] * habits
+    }, columns=HABIT_COLUMNS)
+
+
+def generate_logs(habits=10, years=1, completion=0.7, gap_rate=0.02, mean_gap=5, end_date=None, seed=0):
+    """
+    Generate logs for habits h0..h{habits-1} over `years` years ending on end_date (default today)
+    Each habit has a log for every day except during gaps, completed with probability
+    `completion`. A gap (days with no log at all, e.g. a holiday) starts on any day with
+    probability gap_rate and lasts mean_gap days on average
+    Returns a DataFrame of logs sorted by habit and date
+    """
+    rng = np.random.default_rng(seed)
+    end_date = pd.Timestamp(end_date or datetime.now().date())
+    days = int(round(years * 365))
+    dates = pd.date_range(end=end_date, periods=days).strftime('%Y-%m-%d').to_numpy(dtype=object)
+
+    # Gap coverage: the furthest day reached by any gap started so far, per habit
+    day_index = np.arange(days)
+    gap_starts = rng.random((habits, days)) < gap_rate
+    gap_lengths = rng.geometric(1 / mean_gap, size=(habits, days)) if mean_gap > 1 else np.ones((habits, days), dtype=int)
+    gap_ends = np.maximum.accumulate(np.where(gap_starts, day_index + gap_lengths, 0), axis=1)
+    logged = gap_ends <= day_index
+
+    habit_codes, day_codes = np.nonzero(logged)
+    return pd.DataFrame({
+        'habit_id': np.array([f'h{i}' for i in range(habits)], dtype=object)[habit_codes],
+        'date': dates[day_codes],
+        'completed': rng.random(len(habit_codes)) < completion
+    }, columns=LOG_COLUMNS)
+
+
+def generate_dataset(habits=10, years=1, completion=0.7, gap_rate=0.02, mean_gap=5, end_date=None, seed=0):
+    """
+    Generate matching habits and logs DataFrames; returns (habits_df, logs_df)
+    """
+    habits_df = generate_habits(habits, seed)
+    logs_df = generate_logs(habits, years, completion, gap_rate, mean_gap, end_date, seed)
+
+    # Habits were created on their first logged day
+    first_dates = logs_df.groupby('habit_id')['date'].min()
+    last_date = pd.Timestamp(end_date or datetime.now().date()).strftime('%Y-%m-%d')
+    habits_df['created_at'] = habits_df['id'].map(first_dates).fillna(last_date)
+    return habits_df, logs_df
+
+
+def add_values(habits_df, logs_df, target=30.0, seed=0):
+    """
+    Turn a dataset into measured habits: every habit gets `target` (in minutes) and every log
+    a float32 value, at or above the target when completed and below it otherwise
+    Returns new (habits_df, logs_df)
+    """
+    rng = np.random.default_rng(seed)
+    completed = logs_df['completed'].to_numpy(dtype=bool)
+    values = np.where(completed, target * (1 + rng.random(len(logs_df))), target * rng.random(len(logs_df)))
+    return (
+        habits_df.assign(target=np.float32(target), measure='minutes'),
+        logs_df.assign(**{LOG_VALUE_COLUMN: values.astype(np.float32)})
+    )
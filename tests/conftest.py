@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import data_store
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """
+    Run each test in its own empty data directory, without stores cached by earlier tests
+    """
+    monkeypatch.chdir(tmp_path)
+    data_store._stores.clear()
+    yield tmp_path
+    data_store._stores.clear()
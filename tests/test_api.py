@@ -0,0 +1,40 @@
+import asyncio
+import json
+from datetime import date
+
+import pandas as pd
+
+import api
+import data_handler as dh
+import data_store
+
+
+def save_habit():
+    dh.save_habits(pd.DataFrame({
+        'id': ['h0'], 'name': ['Read'], 'category': ['Health'], 'frequency': ['Daily'],
+        'created_at': ['2026-01-01']
+    }))
+
+
+def test_duplicate_checkins_keep_one_row_per_day():
+    save_habit()
+    today = date.today().isoformat()
+
+    async def post_all():
+        habit_api = api.HabitApi()
+        # The first write holds the batcher, so the rest arrive in one batch
+        checkins = [{'habit': 'Read', 'date': today, 'completed': i % 2 == 0} for i in range(20)]
+        return await asyncio.gather(*(
+            habit_api.dispatch('POST', '/checkins', json.dumps(checkin).encode()) for checkin in checkins
+        ))
+
+    results = asyncio.run(post_all())
+    assert all(status == 200 for status, _ in results)
+
+    logs = data_store.acquire().store.logs
+    day_logs = logs[(logs['habit_id'] == 'h0') & (logs['date'] == today)]
+    assert len(day_logs) == 1
+    # The check-in that won on disk won in memory too
+    saved = dh.load_logs()
+    assert len(logs) == len(saved)
+    assert day_logs['completed'].iloc[0] == saved.loc[saved['habit_id'] == 'h0', 'completed'].iloc[0]
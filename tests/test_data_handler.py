@@ -0,0 +1,307 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_handler as dh
+import periods
+
+
+def save_measured_habits():
+    dh.save_habits(pd.DataFrame({
+        'id': ['h0', 'h1'], 'name': ['Water', 'Read'], 'category': ['Health', 'Learning'],
+        'frequency': ['Daily', 'Daily'], 'created_at': ['2026-01-01', '2026-01-01'],
+        'target': [8.0, np.nan], 'measure': ['glasses', '']
+    }))
+    dh.save_logs(pd.DataFrame({
+        'habit_id': ['h0'], 'date': ['2026-03-01'], 'completed': [True], 'value': [9.0]
+    }))
+
+
+def write_old_backup(path):
+    # Backups made before targets existed have no target or measure fields
+    with open(path, 'w') as f:
+        json.dump({
+            'habits': [
+                {'id': 'h0', 'name': 'Drink water', 'category': 'Health', 'frequency': 'Daily',
+                 'created_at': '2026-01-01'},
+                {'id': 'h2', 'name': 'Walk', 'category': 'Health', 'frequency': 'Weekly',
+                 'created_at': '2026-02-01'}
+            ],
+            'logs': [{'habit_id': 'h2', 'date': '2026-03-02', 'completed': True}]
+        }, f)
+
+
+def test_merging_old_backup_keeps_targets(tmp_path):
+    save_measured_habits()
+    backup = tmp_path / 'old_backup.json'
+    write_old_backup(backup)
+
+    assert dh.import_data(str(backup), merge=True, on_conflict='incoming')
+
+    habits = dh.load_habits().set_index('id')
+    assert habits.at['h0', 'name'] == 'Drink water'
+    assert habits.at['h0', 'target'] == 8.0
+    assert habits.at['h0', 'measure'] == 'glasses'
+    assert np.isnan(habits.at['h1', 'target'])
+    assert np.isnan(habits.at['h2', 'target'])
+    assert habits.at['h2', 'measure'] == ''
+    assert len(dh.load_logs()) == 2
+
+
+def test_merge_clears_target_removed_in_backup(tmp_path):
+    save_measured_habits()
+    backup = tmp_path / 'backup.json'
+    with open(backup, 'w') as f:
+        json.dump({'habits': [{'id': 'h0', 'name': 'Water', 'category': 'Health', 'frequency': 'Daily',
+                               'created_at': '2026-01-01', 'target': None, 'measure': None}],
+                   'logs': []}, f)
+
+    assert dh.import_data(str(backup), merge=True, on_conflict='incoming')
+
+    habits = dh.load_habits().set_index('id')
+    assert np.isnan(habits.at['h0', 'target'])
+    assert habits.at['h0', 'measure'] == ''
+
+
+def test_replacing_with_old_backup_fills_defaults(tmp_path):
+    save_measured_habits()
+    backup = tmp_path / 'old_backup.json'
+    write_old_backup(backup)
+
+    assert dh.import_data(str(backup))
+
+    habits = dh.load_habits()
+    assert list(habits['id']) == ['h0', 'h2']
+    assert habits['target'].isna().all()
+    assert (habits['measure'] == '').all()
+
+
+def save_three_months():
+    dh.save_logs(pd.DataFrame({
+        'habit_id': ['h0', 'h0', 'h1', 'h0'],
+        'date': ['2026-01-05', '2026-02-05', '2026-02-06', '2026-03-05'],
+        'completed': [True, False, True, True]
+    }))
+
+
+def records(logs_df):
+    return logs_df.astype({'habit_id': str}).to_dict('records')
+
+
+def snapshot_is_current():
+    return dh._snapshot_current(dh._open_snapshot(''), dh._load_manifest(''))
+
+
+def test_load_rebuilds_missing_snapshot(data_dir):
+    save_three_months()
+    expected = dh.load_logs()
+    shutil.rmtree(data_dir / dh.SNAPSHOT_DIR)
+
+    # The first load falls back to JSON and leaves a snapshot behind for the next ones
+    assert records(dh.load_logs('2026-02-01', '2026-02-28')) == records(expected.iloc[1:3])
+    assert snapshot_is_current()
+    assert records(dh.load_logs()) == records(expected)
+
+
+def test_write_rebuilds_missing_snapshot(data_dir):
+    save_three_months()
+    shutil.rmtree(data_dir / dh.SNAPSHOT_DIR)
+
+    dh.upsert_logs(pd.DataFrame({'habit_id': ['h1'], 'date': ['2026-03-06'], 'completed': [True]}))
+    assert snapshot_is_current()
+    assert len(dh.load_logs()) == 5
+
+
+def test_load_rebuilds_snapshot_without_values(data_dir):
+    save_measured_habits()
+    value_file = data_dir / dh.SNAPSHOT_DIR / 'value.npy'
+    # Snapshots written before values were logged have no value column
+    value_file.unlink()
+    assert dh._open_snapshot('') is None
+
+    logs_df = dh.load_logs()
+    assert logs_df[dh.LOG_VALUE_COLUMN].tolist() == [9.0]
+    assert value_file.exists()
+    assert snapshot_is_current()
+    assert dh.load_logs()[dh.LOG_VALUE_COLUMN].tolist() == [9.0]
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_export_changes_at_watermark_boundaries():
+    save_measured_habits()
+    dh.upsert_logs(pd.DataFrame({'habit_id': ['h1'], 'date': ['2026-03-02'], 'completed': [True]}))
+    last = dh.get_change_seq()
+    assert last == 3
+
+    everything = read_json(dh.export_changes(0))
+    assert everything['seq'] == last
+    assert sorted(h['id'] for h in everything['habits']) == ['h0', 'h1']
+    assert sorted(log['date'] for log in everything['logs']) == ['2026-03-01', '2026-03-02']
+
+    latest = read_json(dh.export_changes(last - 1))
+    assert latest['habits'] == [] and [log['habit_id'] for log in latest['logs']] == ['h1']
+
+    for since in (last, last + 10):
+        nothing = read_json(dh.export_changes(since))
+        assert nothing['seq'] == since
+        assert nothing['habits'] == nothing['logs'] == nothing['deleted_logs'] == []
+
+
+def test_apply_changes_round_trip(tmp_path):
+    save_measured_habits()
+    snapshot = tmp_path / 'snapshot.json'
+    shutil.copy(dh.export_data(), snapshot)
+    since = read_json(snapshot)['seq']
+
+    dh.upsert_logs(pd.DataFrame({'habit_id': ['h0', 'h1'], 'date': ['2026-03-01', '2026-03-03'],
+                                 'completed': [False, True]}))
+    dh.delete_habit('h0')
+    changes = dh.export_changes(since)
+
+    restored = read_json(dh.apply_changes(str(snapshot), changes, str(tmp_path / 'restored.json')))
+    current = read_json(dh.export_data())
+    assert restored['seq'] == current['seq']
+    assert sorted(h['id'] for h in restored['habits']) == ['h1']
+    assert restored['logs'] == current['logs'] == [{'habit_id': 'h1', 'date': '2026-03-03', 'completed': True}]
+
+    # A delta that starts after the snapshot's watermark cannot be applied
+    assert dh.apply_changes(str(snapshot), dh.export_changes(current['seq'] + 1)) is None
+
+
+def test_compacting_keeps_the_sequence_going(data_dir):
+    save_measured_habits()
+    dh.upsert_logs(pd.DataFrame({'habit_id': ['h1'], 'date': ['2026-03-02'], 'completed': [True]}))
+    backup = read_json(dh.export_data(compact=True))
+    assert backup['seq'] == dh.get_change_seq() == 3
+    assert (data_dir / 'changes.jsonl').read_text().count('\n') == 1
+
+    dh.upsert_logs(pd.DataFrame({'habit_id': ['h1'], 'date': ['2026-03-03'], 'completed': [True]}))
+    assert dh.get_change_seq() == 4
+    assert dh.export_changes(2) is None
+    assert [log['date'] for log in read_json(dh.export_changes(3))['logs']] == ['2026-03-03']
+    assert dh.compact_changes(4) == 1
+    assert dh.compact_changes(4) == 0
+    assert read_json(dh.export_changes(4))['logs'] == []
+
+
+def write_backup(path, logs):
+    with open(path, 'w') as f:
+        json.dump({'habits': [], 'logs': logs}, f)
+
+
+@pytest.mark.parametrize('on_conflict, expected', [
+    ('incoming', {'2026-03-01': False, '2026-03-02': True, '2026-03-04': True}),
+    ('local', {'2026-03-01': True, '2026-03-02': False, '2026-03-04': True}),
+    ('completed', {'2026-03-01': True, '2026-03-02': True, '2026-03-04': True})
+])
+def test_merge_resolves_conflicts(tmp_path, on_conflict, expected):
+    dh.save_logs(pd.DataFrame({
+        'habit_id': ['h0', 'h0', 'h1'], 'date': ['2026-03-01', '2026-03-02', '2026-03-01'],
+        'completed': [True, False, True]
+    }))
+    backup = tmp_path / 'backup.json'
+    write_backup(backup, [
+        {'habit_id': 'h0', 'date': '2026-03-01', 'completed': False},
+        {'habit_id': 'h0', 'date': '2026-03-02', 'completed': True},
+        {'habit_id': 'h0', 'date': '2026-03-04', 'completed': True}
+    ])
+
+    assert dh.import_data(str(backup), merge=True, on_conflict=on_conflict)
+
+    logs_df = dh.load_logs().astype({'habit_id': str})
+    h0 = logs_df[logs_df['habit_id'] == 'h0']
+    assert dict(zip(h0['date'], h0['completed'])) == expected
+    assert logs_df[logs_df['habit_id'] == 'h1']['completed'].tolist() == [True]
+
+
+def test_merge_skips_unchanged_months(tmp_path, data_dir):
+    dh.save_logs(pd.DataFrame({
+        'habit_id': ['h0', 'h0'], 'date': ['2026-02-01', '2026-03-01'], 'completed': [True, True]
+    }))
+    february = data_dir / dh.LOGS_DIR / '2026-02.json'
+    before = dh._load_manifest('')['partitions']
+    written = february.stat().st_mtime_ns
+
+    backup = tmp_path / 'backup.json'
+    write_backup(backup, [
+        {'habit_id': 'h0', 'date': '2026-02-01', 'completed': True},
+        {'habit_id': 'h0', 'date': '2026-03-02', 'completed': True}
+    ])
+    assert dh.import_data(str(backup), merge=True, on_conflict='incoming')
+
+    after = dh._load_manifest('')['partitions']
+    assert after['2026-02'] == before['2026-02']
+    assert february.stat().st_mtime_ns == written
+    assert after['2026-03']['rows'] == 2
+
+    # A backup the data already holds writes nothing at all
+    seq = dh.get_change_seq()
+    assert dh.import_data(str(backup), merge=True, on_conflict='incoming')
+    assert dh.get_change_seq() == seq
+    assert dh._load_manifest('')['partitions'] == after
+
+
+def test_merge_rejects_unknown_policy(tmp_path):
+    backup = tmp_path / 'backup.json'
+    write_backup(backup, [])
+    with pytest.raises(ValueError):
+        dh.import_data(str(backup), merge=True, on_conflict='newest')
+
+
+def daily_history():
+    habits = pd.DataFrame({
+        'id': [f'h{i}' for i in range(6)], 'frequency': 'Daily', 'created_at': '2026-01-01'
+    })
+    rng = np.random.default_rng(0)
+    days = pd.date_range('2026-01-01', '2026-04-30').strftime('%Y-%m-%d')
+    logs = pd.DataFrame({
+        'habit_id': np.repeat(habits['id'].to_numpy(), len(days)),
+        'date': np.tile(days, len(habits)),
+        'completed': rng.random(len(habits) * len(days)) < np.repeat([0.5, 0.8, 0.9, 0.95, 1.0, 0.0], len(days))
+    })
+    # Runs cross month ends, fill whole months and skip days without a log
+    return habits, logs[rng.random(len(logs)) < 0.97].reset_index(drop=True)
+
+
+def written_in_batches(logs_df):
+    dh.save_logs(logs_df.iloc[::2])
+    rest = logs_df.iloc[1::2].sample(frac=1, random_state=0)
+    for start in range(0, len(rest), 100):
+        dh.upsert_logs(rest.iloc[start:start + 100])
+    # Unchecking days splits runs in months already summarized
+    dh.upsert_logs(logs_df[logs_df['completed']].iloc[::40].assign(completed=False))
+    return dh.load_logs()
+
+
+def test_manifest_longest_streaks_match_periods():
+    habits, logs = daily_history()
+    saved = written_in_batches(logs)
+
+    longest = dh.load_longest_streaks()
+    expected = periods.streaks(habits, saved, '2026-04-30')['longest_streak']
+    assert {h: longest.get(h, 0) for h in habits['id']} == expected.to_dict()
+    assert longest['h4'] > 31
+
+
+def test_streak_index_matches_current_streaks():
+    habits, logs = daily_history()
+    saved = written_in_batches(logs)
+
+    index = dh.load_streak_index()
+    current = {
+        habit_id: run if last_day >= '2026-04-29' else 0 for habit_id, (last_day, run) in index.items()
+    }
+    expected = periods.streaks(habits, saved, '2026-04-30')['current_streak']
+    assert {h: current.get(h, 0) for h in habits['id']} == expected.to_dict()
+
+    # A missing index is rebuilt from the manifest alone
+    os.remove(dh.STREAK_INDEX_FILE)
+    assert dh.load_streak_index() == index
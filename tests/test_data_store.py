@@ -0,0 +1,117 @@
+import gc
+import os
+import subprocess
+import sys
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+import data_files
+import data_handler as dh
+import data_store
+
+BAD_USER_KEYS = ['', '.', '..', '../other', 'a/../../etc', '/etc/passwd', 'a/b', 'a\\b', '.hidden', '-rf',
+                 'a\x00b', 'x' * 129]
+
+
+@pytest.mark.parametrize('key', BAD_USER_KEYS)
+def test_unsafe_user_keys_are_rejected(data_dir, key):
+    with pytest.raises(ValueError):
+        data_files.user_dir(key)
+    with pytest.raises(ValueError):
+        data_store.acquire(key)
+    with pytest.raises(ValueError):
+        dh.upsert_logs(pd.DataFrame({'habit_id': ['h'], 'date': ['2026-03-01'], 'completed': [True]}), user=key)
+    assert os.listdir(data_dir) == []
+
+
+def test_users_are_sharded():
+    root = data_files.user_dir('alice@example.com')
+    users_dir, shard, user = root.split(os.sep)
+    assert (users_dir, user) == (data_files.USERS_DIR, 'alice@example.com')
+    assert int(shard, 16) < data_files.USER_SHARDS
+    assert data_files.user_dir('alice@example.com') == root
+
+    keys = [f'user{i}' for i in range(20)]
+    for key in keys:
+        data_files.queue_logs([{'habit_id': 'h', 'date': '2026-03-01', 'completed': True}], key)
+    assert data_files.list_users() == sorted(keys)
+    assert len({data_files.user_dir(key).split(os.sep)[1] for key in keys}) > 1
+
+
+def test_released_stores_are_evicted_least_recently_used_first(monkeypatch):
+    monkeypatch.setattr(data_store, 'MAX_IDLE_STORES', 2)
+    held = data_store.acquire('held')
+
+    for key in ('u1', 'u2', 'u3'):
+        handle = data_store.acquire(key)
+        assert data_store.open_stores()[key] == 1
+        del handle
+        gc.collect()
+    assert data_store.open_stores() == {'held': 1, 'u2': 0, 'u3': 0}
+
+    # Using an idle store again makes it the most recently used, so u3 goes first
+    reused = data_store.acquire('u2')
+    del reused
+    handle = data_store.acquire('u4')
+    gc.collect()
+    assert data_store.open_stores() == {'held': 1, 'u3': 0, 'u2': 0, 'u4': 1}
+    del handle
+    gc.collect()
+    assert data_store.open_stores() == {'held': 1, 'u2': 0, 'u4': 0}
+
+    # A store is only evicted once its last handle is released
+    del held
+    gc.collect()
+    assert data_store.open_stores() == {'u2': 0, 'u4': 0}
+
+
+def check_ins(prefix, count, day):
+    return [pd.DataFrame({'habit_id': [f'{prefix}{i}'], 'date': [day], 'completed': [True]}) for i in range(count)]
+
+
+def test_concurrent_upserts_from_threads_keep_every_row():
+    day = datetime.now().strftime('%Y-%m-01')
+    store = data_store.acquire().store
+    barrier = threading.Barrier(2)
+
+    # One session writes through the shared store, the other straight to disk
+    def write(prefix, upsert):
+        barrier.wait()
+        for logs_df in check_ins(prefix, 40, day):
+            upsert(logs_df)
+
+    threads = [
+        threading.Thread(target=write, args=('a', store.upsert_logs)),
+        threading.Thread(target=write, args=('b', dh.upsert_logs))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(dh.load_logs()) == 80
+    assert dh.get_change_seq() == 80
+    store.refresh()
+    assert len(store.logs) == 80
+
+
+def test_concurrent_upserts_from_processes_keep_every_row(data_dir):
+    script = (
+        "import sys; sys.path.insert(0, {root!r})\n"
+        "import pandas as pd, data_handler as dh\n"
+        "for i in range(30):\n"
+        "    dh.upsert_logs(pd.DataFrame({{'habit_id': ['{prefix}%d' % i], 'date': ['2026-03-01'], 'completed': [True]}}))\n"
+    )
+    processes = [
+        subprocess.Popen([sys.executable, '-c', script.format(root=ROOT, prefix=prefix)], cwd=data_dir)
+        for prefix in ('a', 'b')
+    ]
+    assert [process.wait() for process in processes] == [0, 0]
+
+    logs_df = dh.load_logs()
+    assert sorted(logs_df['habit_id'].astype(str)) == sorted(f'{p}{i}' for p in 'ab' for i in range(30))
+    assert dh.get_change_seq() == 60
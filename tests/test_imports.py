@@ -0,0 +1,79 @@
+import ast
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Startup import budget for app.py, measured with -X importtime. The whole list, streamlit
+# and pandas included, takes about 1 s; the budget leaves room for slower machines while
+# still catching a chart library or a heavy module creeping back into startup
+IMPORT_BUDGET_SECONDS = 2.5
+
+
+def startup_modules():
+    """
+    Modules app.py imports at the top level, i.e. on every run
+    """
+    with open(os.path.join(ROOT, 'app.py')) as f:
+        tree = ast.parse(f.read())
+
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+    return modules
+
+
+def import_times(modules):
+    """
+    Import modules in a fresh interpreter; returns {module: self seconds} from -X importtime
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(self_us) / 1e6
+    return times
+
+
+def test_app_modules_do_not_import_plotly():
+    # Streamlit loads plotly for its own chart element; the app's modules must not
+    modules = [module for module in startup_modules() if module.split('.')[0] != 'streamlit']
+    times = import_times(modules)
+    assert not [name for name in times if name.split('.')[0] == 'plotly']
+
+
+def test_startup_imports_stay_within_budget():
+    times = import_times(startup_modules())
+    assert 'visualizations' not in times
+    assert 'plotly.express' not in times
+    assert sum(times.values()) < IMPORT_BUDGET_SECONDS
+
+
+def test_charts_are_imported_when_first_drawn(data_dir):
+    # Runs without a chart (no habits yet) skip visualizations; the first chart loads it
+    script = (
+        "import sys; sys.path.insert(0, {root!r})\n"
+        "import pandas as pd, data_handler as dh\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        "at = AppTest.from_file({app!r}, default_timeout=60).run()\n"
+        "assert not at.exception, at.exception\n"
+        "print('visualizations' in sys.modules)\n"
+        "dh.save_habits(pd.DataFrame({{'id': ['h'], 'name': ['Run'], 'category': ['Health'], 'frequency': ['Daily'],\n"
+        "                             'created_at': ['2026-01-01']}}))\n"
+        "dh.save_logs(pd.DataFrame({{'habit_id': ['h'], 'date': [pd.Timestamp.now().strftime('%Y-%m-%d')],\n"
+        "                           'completed': [True]}}))\n"
+        "at.run()\n"
+        "assert not at.exception, at.exception\n"
+        "print('visualizations' in sys.modules)\n"
+    ).format(root=ROOT, app=os.path.join(ROOT, 'app.py'))
+    result = subprocess.run([sys.executable, '-c', script], cwd=data_dir, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False', 'True']
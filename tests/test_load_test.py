@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def test_load_test_drives_sessions_without_errors(data_dir):
+    # A subprocess: the harness installs an audit hook, which cannot be removed again
+    output = data_dir / 'report.json'
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'load_test.py'), '--sessions', '2', '--iterations', '1',
+         '--users', '2', '--habits', '3', '--output', str(output)],
+        cwd=data_dir, capture_output=True, check=True
+    )
+
+    with open(output) as f:
+        report = json.load(f)
+    assert report['errors'] == {}
+    # Each session opens the app, then toggles, opens Analytics, changes dates and goes back
+    assert report['reruns'] == 10
+    assert set(report['latency_by_action']) == {
+        'open_app', 'toggle_checkbox', 'open_analytics', 'change_date_range', 'open_dashboard'
+    }
+    assert report['latency']['p99_ms'] > 0
+    assert report['file_writes_by_kind']['changes.jsonl'] >= 2
+    # The harness cleans up its data directory
+    assert os.listdir(data_dir) == ['report.json']
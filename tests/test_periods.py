@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+import periods
+
+FIRST_DAY = '2026-01-01'
+LAST_DAY = '2026-06-30'
+
+
+def habits_and_logs():
+    habits = pd.DataFrame({
+        'id': ['d', 'w', 'm', 'c'], 'name': ['Daily', 'Weekly', 'Monthly', 'Cycle'],
+        'frequency': ['Daily', 'Weekly', 'Monthly', 'Every 3 days'],
+        'created_at': ['2025-12-20', '2026-01-07', '2025-11-01', '2026-01-02']
+    })
+    rng = np.random.default_rng(0)
+    days = pd.date_range(FIRST_DAY, LAST_DAY).strftime('%Y-%m-%d')
+    logs = pd.DataFrame({
+        'habit_id': np.repeat(habits['id'].to_numpy(), len(days)),
+        'date': np.tile(days, len(habits)),
+        'completed': rng.random(len(habits) * len(days)) < 0.6
+    })
+    # Gaps of a few days break daily runs but not every weekly or monthly one
+    return habits, logs[rng.random(len(logs)) < 0.7].reset_index(drop=True)
+
+
+def test_history_index_matches_streaks_on_truncated_logs():
+    habits, logs = habits_and_logs()
+    index = periods.HistoryIndex(habits, logs)
+    columns = ['current_streak', 'longest_streak', 'done_current', 'unit']
+
+    # Every day of the range, plus days before the first log and after the last
+    for day in pd.date_range('2025-12-25', '2026-07-05').strftime('%Y-%m-%d'):
+        as_of = index.streaks(day)[columns]
+        replayed = periods.streaks(habits, logs[logs['date'] <= day], day)[columns]
+        assert as_of.equals(replayed), day
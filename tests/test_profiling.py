@@ -0,0 +1,42 @@
+import threading
+import tracemalloc
+
+import profiling
+
+
+def test_memory_tracing_stops_after_last_rerun():
+    first, second = profiling.Profiler(memory=True), profiling.Profiler(memory=True)
+    first.activate()
+    second.activate()
+    assert tracemalloc.is_tracing()
+
+    first.finish()
+    assert tracemalloc.is_tracing()
+    second.finish()
+    assert not tracemalloc.is_tracing()
+    assert first.history[-1].allocated is not None
+
+
+def test_memory_tracing_stops_for_abandoned_reruns():
+    profiler = profiling.Profiler(memory=True)
+    # A rerun left open in another thread is dropped when the session's next rerun starts
+    thread = threading.Thread(target=profiler.activate)
+    thread.start()
+    thread.join()
+    profiler.activate()
+    profiler.finish()
+    assert not tracemalloc.is_tracing()
+
+    # A session dropped with a rerun open releases it too
+    profiler = profiling.Profiler(memory=True)
+    profiler.activate()
+    profiling._local.rerun = None
+    del profiler
+    assert not tracemalloc.is_tracing()
+
+
+def test_timing_only_does_not_trace():
+    profiler = profiling.Profiler()
+    profiler.activate()
+    assert not tracemalloc.is_tracing()
+    profiler.finish()
@@ -0,0 +1,46 @@
+from datetime import date
+
+import pandas as pd
+
+import data_handler as dh
+import reminders
+
+TODAY = date(2026, 3, 10)
+
+
+def save_habits_and_logs():
+    dh.save_habits(pd.DataFrame({
+        'id': ['run', 'read', 'done', 'broken', 'weekly'],
+        'name': ['Run', 'Read', 'Stretch', 'Journal', 'Clean'],
+        'category': 'Health', 'created_at': '2026-01-01',
+        'frequency': ['Daily', 'Daily', 'Daily', 'Daily', 'Weekly']
+    }))
+    completed = {
+        'run': ['2026-03-07', '2026-03-08', '2026-03-09'],
+        'read': ['2026-03-09'],
+        'done': ['2026-03-08', '2026-03-09', '2026-03-10'],
+        'broken': ['2026-03-06', '2026-03-07', '2026-03-08'],
+        'weekly': ['2026-02-23', '2026-03-02', '2026-03-09']
+    }
+    dh.save_logs(pd.DataFrame(
+        [{'habit_id': habit_id, 'date': day, 'completed': True} for habit_id, days in completed.items() for day in days]
+        # An unchecked day ends a streak like a missing one
+        + [{'habit_id': 'read', 'date': '2026-03-08', 'completed': False}]
+    ))
+
+
+def test_reminds_about_daily_streaks_ending_yesterday():
+    save_habits_and_logs()
+
+    at_risk = reminders.find_at_risk([None], TODAY)
+    assert at_risk == [{'user': None, 'habit_id': 'run', 'habit': 'Run', 'streak': 3, 'date': '2026-03-10'}]
+
+    sent = []
+    assert reminders.dispatch(sent.extend, [None], TODAY) == 1
+    assert sent == at_risk
+
+
+def test_check_in_today_clears_the_reminder():
+    save_habits_and_logs()
+    dh.upsert_logs(pd.DataFrame({'habit_id': ['run'], 'date': ['2026-03-10'], 'completed': [True]}))
+    assert reminders.find_at_risk([None], TODAY) == []
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+import periods
+import rollups
+
+TODAY = '2026-03-31'
+SINCE = '2026-01-01'
+
+
+def habits_and_logs():
+    habits = pd.DataFrame({
+        'id': ['d', 'w', 'm', 'c'], 'name': ['Daily', 'Weekly', 'Monthly', 'Cycle'],
+        'category': ['Health', 'Health', 'Work', 'Work'],
+        'frequency': ['Daily', 'Weekly', 'Monthly', 'Every 3 days'],
+        'created_at': ['2025-12-01', '2026-01-10', '2025-11-01', '2026-02-01']
+    })
+    rng = np.random.default_rng(0)
+    days = pd.date_range(SINCE, TODAY).strftime('%Y-%m-%d')
+    logs = pd.DataFrame({
+        'habit_id': np.repeat(habits['id'].to_numpy(), len(days)),
+        'date': np.tile(days, len(habits)),
+        'completed': rng.random(len(habits) * len(days)) < 0.3
+    })
+    # Only some days have a log at all: the rest must still count as due
+    return habits, logs[rng.random(len(logs)) < 0.5].reset_index(drop=True)
+
+
+def category_totals(rollup_df):
+    return rollup_df.groupby('category')[['completed', 'expected']].sum()
+
+
+def expected_totals(habits, logs):
+    completion = periods.completion(habits, logs, SINCE, TODAY, TODAY)
+    completion['category'] = habits['category'].to_numpy()
+    return completion.groupby('category')[['completed', 'expected']].sum()
+
+
+def test_cube_counts_expected_occurrences():
+    habits, logs = habits_and_logs()
+    cube = rollups.CategoryCube(habits, logs, SINCE, TODAY)
+    assert category_totals(cube.frame(SINCE, TODAY)).equals(expected_totals(habits, logs))
+
+
+def test_cube_updates_match_a_rebuild():
+    habits, logs = habits_and_logs()
+    cube = rollups.CategoryCube(habits, logs, SINCE, TODAY)
+
+    written = pd.DataFrame({
+        'habit_id': ['d', 'w', 'w', 'm', 'c'],
+        'date': ['2026-03-02', '2026-03-04', TODAY, '2026-02-10', '2026-03-30'],
+        'completed': [True, True, True, False, True]
+    })
+    keys = ['habit_id', 'date']
+    after = pd.concat([logs, written]).drop_duplicates(keys, keep='last').reset_index(drop=True)
+    cube.update(logs, after, written)
+
+    rebuilt = rollups.CategoryCube(habits, after, SINCE, TODAY)
+    assert cube.frame(SINCE, TODAY).equals(rebuilt.frame(SINCE, TODAY))
+    assert category_totals(cube.frame(SINCE, TODAY)).equals(expected_totals(habits, after))
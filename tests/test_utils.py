@@ -0,0 +1,28 @@
+import pandas as pd
+
+import periods
+import utils
+
+LOGS = pd.DataFrame({
+    'habit_id': ['h', 'h', 'h', 'h', 'h', 'x'],
+    'date': ['2026-03-01', '2026-03-02', '2026-03-03', '2026-03-05', '2026-03-06', '2026-03-04'],
+    'completed': [True, True, True, True, False, True]
+})
+
+
+def test_current_streak_as_of_past_days():
+    assert utils.get_current_streak('h', LOGS, '2026-03-03') == 3
+    # Today may still be open: yesterday's run counts
+    assert utils.get_current_streak('h', LOGS, '2026-03-04') == 3
+    assert utils.get_current_streak('h', LOGS, '2026-03-05') == 1
+    assert utils.get_current_streak('h', LOGS, '2026-03-06') == 1
+    assert utils.get_current_streak('h', LOGS, '2026-03-07') == 0
+    assert utils.get_current_streak('h', LOGS, '2026-02-28') == 0
+    assert utils.get_current_streak('missing', LOGS, '2026-03-03') == 0
+
+
+def test_current_streak_uses_history_index():
+    habits = pd.DataFrame({'id': ['h', 'x'], 'frequency': ['Daily', 'Daily'], 'created_at': ['2026-03-01'] * 2})
+    index = periods.HistoryIndex(habits, LOGS)
+    for day in pd.date_range('2026-02-28', '2026-03-08').strftime('%Y-%m-%d'):
+        assert utils.get_current_streak('h', LOGS.iloc[:0], day, index) == utils.get_current_streak('h', LOGS, day)
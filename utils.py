@@ -1,80 +1,52 @@
 import uuid
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
+import periods
+import profiling
 
+
+@profiling.timed
 def generate_id():
     """Generate a unique ID for a habit or log entry"""
     return str(uuid.uuid4())
 
 
-def get_current_streak(habit_id, logs_df):
+def _habit_logs(logs_df, habit_id):
     """
-    Calculate current streak for a specific habit
-    Returns the number of consecutive days the habit has been completed
+    One habit's logs as a new frame of datetime 'date' and 'completed', without copying
+    the other columns first
     """
-    if logs_df.empty:
-        return 0
-
-    # Filter logs for this habit
-    habit_logs = logs_df[logs_df['habit_id'] == habit_id].copy()
-
-    if habit_logs.empty:
-        return 0
-
-    # Convert dates to datetime
-    habit_logs['date'] = pd.to_datetime(habit_logs['date'])
+    is_habit = logs_df['habit_id'] == habit_id
+    return pd.DataFrame({
+        'date': pd.to_datetime(logs_df['date'][is_habit]),
+        'completed': logs_df['completed'][is_habit]
+    })
 
-    # Sort by date in descending order (most recent first)
-    habit_logs = habit_logs.sort_values('date', ascending=False)
 
-    # Get today and yesterday
-    today = datetime.now().date()
-
-    # Check if there's a log for today
-    today_log = habit_logs[habit_logs['date'].dt.date == today]
-    if today_log.empty or not today_log.iloc[0]['completed']:
-        # If no log for today or today is incomplete, check yesterday
-        yesterday = today - timedelta(days=1)
-        yesterday_log = habit_logs[habit_logs['date'].dt.date == yesterday]
-
-        if yesterday_log.empty or not yesterday_log.iloc[0]['completed']:
-            # If no log for yesterday or yesterday is incomplete, streak is 0
+@profiling.timed
+def get_current_streak(habit_id, logs_df, as_of=None, index=None):
+    """
+    Calculate current streak for a specific habit, as of a day (default today)
+    Returns the number of consecutive days the habit has been completed; see periods.streaks
+    for streaks that follow each habit's frequency
+    index, a periods.HistoryIndex holding the habit, answers without reading the logs (its
+    streak is then counted in the habit's own periods); without one the habit's logs are
+    indexed by day once
+    """
+    if index is None:
+        if logs_df.empty:
             return 0
+        # The habit alone, counted in days whatever its frequency
+        habit_df = pd.DataFrame({'id': [habit_id], 'frequency': ['Daily'], 'created_at': ['1970-01-01']})
+        index = periods.HistoryIndex(habit_df, logs_df[logs_df['habit_id'] == habit_id])
 
-    # Calculate the streak
-    streak = 0
-    current_date = today
-
-    while True:
-        # Check if there's a log for current_date
-        current_log = habit_logs[habit_logs['date'].dt.date == current_date]
-
-        if current_log.empty:
-            # If there's a gap and it's not today (today can be incomplete and still count), break
-            if current_date != today:
-                break
-        elif not current_log.iloc[0]['completed']:
-            # If the habit was not completed on this date, break
-            if current_date != today:
-                break
-        else:
-            # If completed, increment streak
-            streak += 1
-
-        # Move to previous day
-        current_date -= timedelta(days=1)
-
-        # Check logs for the current date
-        current_date_logs = habit_logs[habit_logs['date'].dt.date == current_date]
-
-        if current_date_logs.empty or not current_date_logs.iloc[0]['completed']:
-            # If no log or not completed for this date, streak ends
-            break
-
-    return streak
+    streaks = index.streaks(as_of)['current_streak']
+    return int(streaks.get(habit_id, 0))
 
 
+@profiling.timed
 def get_longest_streak(habits_df, logs_df):
     """
     Find the habit with the longest streak and return (habit_name, streak_length)
@@ -87,14 +59,11 @@ def get_longest_streak(habits_df, logs_df):
 
     for _, habit in habits_df.iterrows():
         habit_id = habit['id']
-        habit_logs = logs_df[logs_df['habit_id'] == habit_id].copy()
+        habit_logs = _habit_logs(logs_df, habit_id)
 
         if habit_logs.empty:
             continue
 
-        # Convert dates to datetime
-        habit_logs['date'] = pd.to_datetime(habit_logs['date'])
-
         # Sort by date
         habit_logs = habit_logs.sort_values('date')
 
@@ -126,28 +95,280 @@ def get_longest_streak(habits_df, logs_df):
     return (max_streak_habit, max_streak)
 
 
-def get_habits_needing_attention(habits_df, logs_df):
+@profiling.timed
+def get_longest_streak_from_summary(habits_df, longest_streaks):
+    """
+    Find the habit with the longest streak from precomputed {habit_id: streak_length}
+    Returns (habit_name, streak_length) like get_longest_streak
+    """
+    if habits_df.empty or not longest_streaks:
+        return ("", 0)
+
+    max_streak = 0
+    max_streak_habit = ""
+
+    for habit_id, habit_name in zip(habits_df['id'], habits_df['name']):
+        streak = longest_streaks.get(habit_id, 0)
+        if streak > max_streak:
+            max_streak = streak
+            max_streak_habit = habit_name
+
+    return (max_streak_habit, max_streak)
+
+
+@profiling.timed
+def get_streaks(habits_df, logs_df, as_of=None, index=None):
+    """
+    Streaks of every habit as they stood at the end of as_of (default today), in its periods
+    index, a periods.HistoryIndex of the same habits and logs, answers without reading the
+    logs again; without one the logs are replayed once
+    Returns a DataFrame indexed by habit id with current_streak, longest_streak (up to
+    as_of) and done_current
+    """
+    if index is None:
+        index = periods.HistoryIndex(habits_df, logs_df)
+    return index.streaks(as_of)
+
+
+@profiling.timed
+def get_habit_stats(habits_df, logs_df, longest_streaks=None, days=30, current_streaks=None, as_of=None,
+                    index=None):
     """
-    Identify habits that are at risk of breaking streaks (no check-in today for habits with streaks)
+    Summarize every habit: current and longest streak and completions in the `days` days up
+    to as_of (default today), all counted in the habit's periods (see periods)
+    longest_streaks is {habit_id: streak_length}, e.g. from periods.longest_streaks;
+    current_streaks, if given, is {habit_id: current streak} (see DataStore.current_streaks).
+    Either left out is taken from the streaks as of as_of (see get_streaks, which index is for)
+    Returns a list of dicts with id, name, unit, current_streak, longest_streak, completed,
+    expected (periods in the window) and rate (%)
+    """
+    end_date = pd.Timestamp(as_of or datetime.now()).date()
+    rates = periods.completion(habits_df, logs_df, end_date - timedelta(days=days - 1), end_date, today=end_date)
+    if longest_streaks is None or current_streaks is None:
+        table = (get_streaks(habits_df, logs_df, end_date, index) if as_of is not None or index is not None
+                 else periods.streaks(habits_df, logs_df))
+        if longest_streaks is None:
+            longest_streaks = table['longest_streak']
+        if current_streaks is None:
+            current_streaks = table['current_streak']
+
+    stats = []
+    for habit_id, habit_name, frequency, completed, expected, rate in zip(
+            habits_df['id'], habits_df['name'], habits_df['frequency'],
+            rates['completed'], rates['expected'], rates['rate']):
+        stats.append({
+            'id': habit_id,
+            'name': habit_name,
+            'unit': periods.streak_unit(frequency),
+            'current_streak': int(current_streaks.get(habit_id, 0)),
+            'longest_streak': int(longest_streaks.get(habit_id, 0)),
+            'completed': int(completed),
+            'expected': int(expected),
+            'rate': float(rate)
+        })
+
+    return stats
+
+
+@profiling.timed
+def get_habits_needing_attention(habits_df, logs_df, as_of=None, index=None):
+    """
+    Identify habits that are at risk of breaking streaks: a streak of at least 2 periods
+    (days, weeks, ... see periods) and no completion yet in the current period, as of a
+    day (default today; see get_streaks for index)
     """
     if habits_df.empty or logs_df.empty:
         return []
 
-    habits_at_risk = []
-    today = datetime.now().date().strftime('%Y-%m-%d')
+    # Streaks and current-period completion of every habit in one pass
+    table = (get_streaks(habits_df, logs_df, as_of, index) if as_of is not None or index is not None
+             else periods.streaks(habits_df, logs_df))
+    at_risk = (table['current_streak'] >= 2) & ~table['done_current']
+    return list(habits_df['name'][at_risk.to_numpy()])
+
+
+# Risk scoring: the chance a habit is completed in its current period is estimated from its
+# completion rate over the last RISK_HISTORY_DAYS, on today's weekday for daily habits,
+# shifted by how the last RISK_RECENT_DAYS compare with that. Rates are smoothed towards
+# the longer-run rate with RISK_PRIOR_WEIGHT pseudo-observations, so short histories
+# don't swing to 0 or 1. Everything is measured up to yesterday, so it holds for the day
+RISK_HISTORY_DAYS = 84
+RISK_RECENT_DAYS = 14
+RISK_PRIOR_WEIGHT = 4
+
+# Risk from which the app flags a habit
+RISK_ALERT = 0.5
+
+
+@profiling.timed
+def get_completion_likelihood(habits_df, logs_df, today=None):
+    """
+    Estimated chance (0-1) each habit is completed in its current period, from its history
+    up to yesterday
+    Returns a DataFrame indexed by habit id with baseline, weekday, trend and likelihood
+    """
+    today = pd.Timestamp(today or datetime.now()).normalize()
+    yesterday = today - timedelta(days=1)
+    history_start = today - timedelta(days=RISK_HISTORY_DAYS)
+    recent_start = today - timedelta(days=RISK_RECENT_DAYS)
+    logs_df = logs_df[logs_df['date'] >= history_start.strftime('%Y-%m-%d')]
+
+    # Longer-run rate in each habit's own periods, with a uniform prior for new habits
+    history = periods.completion(habits_df, logs_df, history_start, yesterday, today=yesterday)
+    baseline = (history['completed'] + 1) / (history['expected'] + 2)
+
+    def smoothed(completed, expected):
+        return (completed + RISK_PRIOR_WEIGHT * baseline) / (expected + RISK_PRIOR_WEIGHT)
+
+    # Daily habits: the rate on today's weekday; other frequencies are not tied to weekdays
+    done, active = periods.day_patterns(habits_df, logs_df, history_start, yesterday, today=yesterday)
+    weekday_name = periods.WEEKDAYS[today.weekday()]
+    is_daily = pd.Series((habits_df['frequency'].map(periods.streak_unit) == 'day').to_numpy(), index=baseline.index)
+    weekday = smoothed(done[weekday_name], active[weekday_name]).where(is_daily, baseline)
+
+    recent = periods.completion(habits_df, logs_df, recent_start, yesterday, today=yesterday)
+    trend = smoothed(recent['completed'], recent['expected']) - baseline
+
+    return pd.DataFrame({
+        'baseline': baseline,
+        'weekday': weekday,
+        'trend': trend,
+        'likelihood': (weekday + trend).clip(0, 1)
+    })
+
+
+@profiling.timed
+def get_risk_scores(habits_df, logs_df, likelihood=None, current_streaks=None, today=None):
+    """
+    Risk (0-1) of each habit being missed in its current period: 0 once it is completed,
+    otherwise 1 - its completion likelihood
+    likelihood is a get_completion_likelihood frame (computed if None); current_streaks,
+    if given, is {habit_id: current streak}
+    Returns a DataFrame indexed by habit id with name, risk and current_streak, riskiest first
+    """
+    if likelihood is None:
+        likelihood = get_completion_likelihood(habits_df, logs_df, today)
+    if current_streaks is None:
+        current_streaks = periods.streaks(habits_df, logs_df, today)['current_streak']
+
+    ids = pd.Index(habits_df['id'], name='id')
+    done = periods.done_current(habits_df, logs_df, today).to_numpy()
+    chance = likelihood['likelihood'].reindex(ids).fillna(0.5).to_numpy()
+
+    scores = pd.DataFrame({
+        'name': habits_df['name'].to_numpy(),
+        'risk': np.where(done, 0.0, 1 - chance),
+        'current_streak': pd.Series(current_streaks, dtype=np.int64).reindex(ids, fill_value=0).to_numpy()
+    }, index=ids)
+    return scores.sort_values(['risk', 'current_streak'], ascending=False, kind='stable')
 
-    for _, habit in habits_df.iterrows():
-        habit_id = habit['id']
 
-        # Check if there's a streak for this habit
-        current_streak = get_current_streak(habit_id, logs_df)
+@profiling.timed
+def get_co_completion(habits_df, logs_df, start_date, end_date):
+    """
+    How much each pair of habits is completed on the same days, over the days both existed
+    Computed with matrix products over the habit x day completion array, for all pairs at once
+    Returns (correlation, lift, together) habit x habit DataFrames indexed by habit id:
+    the phi coefficient (-1 traded off .. 1 always together), P(both) / (P(a) P(b)) and
+    the number of days both were completed
+    """
+    done, active = periods.completion_matrix(habits_df, logs_df, start_date, end_date)
+    done, active = done.astype(np.float32), active.astype(np.float32)
+
+    # Per pair: days both existed, days both were done and days each was done while both existed
+    # (float32 products count exactly; the formulas below run in float64 to avoid cancellation)
+    days = (active @ active.T).astype(np.float64)
+    together = (done @ done.T).astype(np.float64)
+    done_a = (done @ active.T).astype(np.float64)
+    done_b = done_a.T
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = np.sqrt(done_a * (days - done_a) * done_b * (days - done_b))
+        correlation = np.where(spread > 0, (days * together - done_a * done_b) / spread, np.nan)
+        lift = np.where(done_a * done_b > 0, together * days / (done_a * done_b), np.nan)
+
+    ids = pd.Index(habits_df['id'], name='id')
+    return (
+        pd.DataFrame(correlation, index=ids, columns=ids),
+        pd.DataFrame(lift, index=ids, columns=ids),
+        pd.DataFrame(together.astype(np.int64), index=ids, columns=ids)
+    )
+
+
+@profiling.timed
+def get_completion_patterns(habits_df, logs_df, start_date, end_date, by='name'):
+    """
+    Completion rate (%) by weekday and by month of the year, for each habit (by='name') or
+    each category (by='category'), from the days completed out of the days active
+    (see periods.day_patterns)
+    Returns (weekday_rates, month_rates) DataFrames indexed by `by`, NaN where nothing was active
+    """
+    done, active = periods.day_patterns(habits_df, logs_df, start_date, end_date)
 
-        if current_streak >= 2:  # Only consider habits with established streaks
-            # Check if there's a log for today
-            today_log = logs_df[(logs_df['habit_id'] == habit_id) & (logs_df['date'] == today)]
+    # Categories add up their habits' days before dividing
+    groups = habits_df[by].to_numpy()
+    done = done.groupby(groups, sort=False).sum()
+    active = active.groupby(groups, sort=False).sum()
 
-            if today_log.empty or not today_log.iloc[0]['completed']:
-                # This habit has a streak but no completion for today
-                habits_at_risk.append(habit['name'])
+    rates = (done / active.where(active > 0)) * 100
+    rates.index.name = by
+    return rates[list(periods.WEEKDAYS)], rates[list(periods.MONTHS)]
+
+
+def habit_targets(habits_df):
+    """
+    Each habit's target as a float32 array, NaN for habits without one
+    """
+    if 'target' not in habits_df.columns:
+        return np.full(len(habits_df), np.nan, dtype=np.float32)
+    return pd.to_numeric(habits_df['target'], errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
 
-    return habits_at_risk
+
+def target_met(values, targets):
+    """
+    Whether each measured value reaches its target, elementwise
+    Without a target (NaN) any positive value counts; a missing value never does
+    """
+    values = np.asarray(values, dtype=np.float32)
+    targets = np.asarray(targets, dtype=np.float32)
+    return np.where(np.isnan(targets), values > 0, values >= targets)
+
+
+@profiling.timed
+def get_value_stats(habits_df, logs_df, start_date, end_date):
+    """
+    Totals of the values logged for each habit between two dates, inclusive
+    Only logs with a value count: yes/no logs are skipped without being parsed
+    Returns a DataFrame indexed by habit id with days (logs with a value), total, mean, best,
+    target and hits (days the target was reached) and hit_rate (%, NaN without values)
+    """
+    count = len(habits_df)
+    targets = habit_targets(habits_df)
+    days_logged = np.zeros(count, dtype=np.int64)
+    total = np.zeros(count)
+    best = np.full(count, -np.inf)
+    hits = np.zeros(count, dtype=np.int64)
+
+    if 'value' in logs_df.columns:
+        measured = logs_df[logs_df['value'].notna()]
+        codes, days, _ = periods.log_arrays(habits_df, measured)
+        values = measured['value'].to_numpy(dtype=np.float32)
+        keep = (codes >= 0) & (days >= periods.day_of(start_date)) & (days <= periods.day_of(end_date))
+        codes, values = codes[keep], values[keep]
+
+        # One pass per statistic over all habits at once; sums run in float64
+        days_logged = np.bincount(codes, minlength=count)
+        total = np.bincount(codes, weights=values.astype(np.float64), minlength=count)
+        np.maximum.at(best, codes, values)
+        hits = np.bincount(codes[target_met(values, targets[codes])], minlength=count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.DataFrame({
+            'days': days_logged,
+            'total': total,
+            'mean': np.where(days_logged > 0, total / days_logged, np.nan),
+            'best': np.where(days_logged > 0, best, np.nan),
+            'target': targets,
+            'hits': hits,
+            'hit_rate': np.where(days_logged > 0, hits / days_logged * 100, np.nan)
+        }, index=pd.Index(habits_df['id'], name='id'))
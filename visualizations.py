@@ -1,10 +1,16 @@
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import pandas as pd
 from datetime import datetime, timedelta
 import numpy as np
 
+import periods
+import profiling
+import utils
 
+
+@profiling.timed
 def create_calendar_heatmap(habits_df, logs_df):
     """
     Create a calendar heatmap visualization of habit completion
@@ -30,35 +36,21 @@ def create_calendar_heatmap(habits_df, logs_df):
     all_dates_df = pd.DataFrame({'date': date_range})
     all_dates_df['date_str'] = all_dates_df['date'].dt.strftime('%Y-%m-%d')
 
-    # Convert logs dates to datetime
-    logs_df = logs_df.copy()
-    logs_df['date'] = pd.to_datetime(logs_df['date'])
+    # The day of each log as 'YYYY-MM-DD', computed once and without copying the logs
+    log_dates = pd.to_datetime(logs_df['date']).dt.strftime('%Y-%m-%d').rename('date_str')
 
     # Group by date and count completed habits
     if 'habit_id' in logs_df.columns and 'completed' in logs_df.columns:
         completion_by_date = logs_df[logs_df['completed'] == True].groupby(
-            logs_df['date'].dt.strftime('%Y-%m-%d')
+            log_dates
         ).size().reset_index(name='completed_count')
 
         # Get total habits by date
-        total_by_date = logs_df.groupby(
-            logs_df['date'].dt.strftime('%Y-%m-%d')
-        ).size().reset_index(name='total_count')
-
-        # Merge with date range
-        completion_df = all_dates_df.merge(
-            completion_by_date,
-            left_on='date_str',
-            right_on='date',
-            how='left'
-        )
+        total_by_date = logs_df.groupby(log_dates).size().reset_index(name='total_count')
 
-        completion_df = completion_df.merge(
-            total_by_date,
-            left_on='date_str',
-            right_on='date',
-            how='left'
-        )
+        # Merge with date range on the date strings, keeping the datetime 'date' column
+        completion_df = all_dates_df.merge(completion_by_date, on='date_str', how='left')
+        completion_df = completion_df.merge(total_by_date, on='date_str', how='left')
 
         # Fill NaN values with 0
         completion_df['completed_count'] = completion_df['completed_count'].fillna(0)
@@ -108,9 +100,12 @@ def create_calendar_heatmap(habits_df, logs_df):
     return fig
 
 
-def create_completion_chart(habits_df, logs_df):
+@profiling.timed
+def create_completion_chart(habits_df, logs_df, start_date=None, end_date=None):
     """
     Create a bar chart showing completion rates for each habit
+    Rates are completed periods out of the periods expected between start_date and end_date
+    (default: the range of the logs), counted from each habit's creation (see periods)
     """
     if habits_df.empty or logs_df.empty:
         # Create an empty figure if no data
@@ -122,28 +117,23 @@ def create_completion_chart(habits_df, logs_df):
         )
         return fig
 
-    # Calculate completion rate for each habit
-    completion_data = []
-
-    for _, habit in habits_df.iterrows():
-        habit_id = habit['id']
-        habit_name = habit['name']
-
-        # Filter logs for this habit
-        habit_logs = logs_df[logs_df['habit_id'] == habit_id]
-
-        if not habit_logs.empty:
-            # Calculate completion rate
-            completed_count = habit_logs[habit_logs['completed'] == True].shape[0]
-            total_count = habit_logs.shape[0]
-            completion_rate = (completed_count / total_count) * 100 if total_count > 0 else 0
-
-            completion_data.append({
-                'habit': habit_name,
-                'completion_rate': completion_rate,
-                'completed_count': completed_count,
-                'total_count': total_count
-            })
+    if start_date is None or end_date is None:
+        start_date, end_date = logs_df['date'].min(), logs_df['date'].max()
+
+    # Completed out of expected periods for every habit at once
+    rates = periods.completion(habits_df, logs_df, start_date, end_date)
+    due = (rates['expected'] > 0).to_numpy()
+    completion_data = [
+        {
+            'habit': habit_name,
+            'completion_rate': rate,
+            'completed_count': int(completed),
+            'total_count': int(expected)
+        }
+        for habit_name, rate, completed, expected in zip(
+            habits_df['name'][due], rates['rate'][due], rates['completed'][due], rates['expected'][due]
+        )
+    ]
 
     if not completion_data:
         # Create an empty figure if no completion data
@@ -187,11 +177,14 @@ def create_completion_chart(habits_df, logs_df):
     return fig
 
 
-def create_completion_trend(logs_df, start_date, end_date):
+@profiling.timed
+def create_completion_trend(habits_df, logs_df, start_date, end_date):
     """
     Create a line chart showing habit completion trend over time
+    Each day's rate is the share of the occurrences due that day that were completed: every
+    habit is due each day, week, month or cycle from its creation on (see periods)
     """
-    if logs_df.empty:
+    if habits_df.empty or logs_df.empty:
         # Create an empty figure if no data
         fig = go.Figure()
         fig.update_layout(
@@ -201,40 +194,10 @@ def create_completion_trend(logs_df, start_date, end_date):
         )
         return fig
 
-    # Convert dates to datetime
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
-
-    # Create a date range
-    date_range = pd.date_range(start=start_date, end=end_date)
-
-    # Create a dataframe with all dates
-    all_dates_df = pd.DataFrame({'date': date_range})
-    all_dates_df['date_str'] = all_dates_df['date'].dt.strftime('%Y-%m-%d')
-
-    # Convert logs dates to datetime
-    logs_df = logs_df.copy()
-    logs_df['date'] = pd.to_datetime(logs_df['date'])
-
-    # Group by date and calculate completion rate
-    daily_completion = logs_df.groupby(logs_df['date'].dt.strftime('%Y-%m-%d')).agg(
-        completed_count=('completed', lambda x: sum(x == True)),
-        total_count=('completed', 'count')
-    ).reset_index()
-
-    # Calculate completion rate
-    daily_completion['completion_rate'] = (daily_completion['completed_count'] / daily_completion['total_count']) * 100
-
-    # Merge with all dates to ensure all dates are included
-    trend_df = all_dates_df.merge(
-        daily_completion,
-        left_on='date_str',
-        right_on='date',
-        how='left'
-    )
-
-    # Fill NaN values
-    trend_df['completion_rate'] = trend_df['completion_rate'].fillna(0)
+    # Occurrences completed and due on each day of the range
+    trend_df = periods.daily_completion(habits_df, logs_df, start_date, end_date)
+    trend_df['date'] = pd.to_datetime(trend_df['date'])
+    trend_df['completion_rate'] = trend_df['rate'].fillna(0)
 
     # Format dates for display
     trend_df['date_display'] = trend_df['date'].dt.strftime('%b %d')
@@ -279,6 +242,7 @@ def create_completion_trend(logs_df, start_date, end_date):
     return fig
 
 
+@profiling.timed
 def create_streak_chart(habits_df, logs_df):
     """
     Create a bar chart showing current streaks for each habit
@@ -293,50 +257,13 @@ def create_streak_chart(habits_df, logs_df):
         )
         return fig
 
-    # Calculate current streak for each habit
-    streak_data = []
-
-    for _, habit in habits_df.iterrows():
-        habit_id = habit['id']
-        habit_name = habit['name']
-
-        # Filter logs for this habit
-        habit_logs = logs_df[logs_df['habit_id'] == habit_id]
-
-        if not habit_logs.empty:
-            # Calculate current streak
-            # This is a simplified calculation; the actual streak logic is in utils.py
-            current_streak = 0
-
-            # Convert logs dates to datetime
-            habit_logs = habit_logs.copy()
-            habit_logs['date'] = pd.to_datetime(habit_logs['date'])
-
-            # Sort by date in descending order
-            habit_logs = habit_logs.sort_values('date', ascending=False)
-
-            # Go through logs to calculate streak
-            for i, row in habit_logs.iterrows():
-                if row['completed']:
-                    current_date = row['date'].date()
-
-                    if i == 0:
-                        current_streak = 1
-                    else:
-                        prev_date = habit_logs.iloc[i - 1]['date'].date()
-                        day_diff = (prev_date - current_date).days
-
-                        if day_diff == 1 and habit_logs.iloc[i - 1]['completed']:
-                            current_streak += 1
-                        else:
-                            break
-                else:
-                    break
-
-            streak_data.append({
-                'habit': habit_name,
-                'current_streak': current_streak
-            })
+    # Current streaks of the habits with logs, each in its own periods (see periods)
+    has_logs = habits_df['id'].isin(logs_df['habit_id'].astype(str).unique()).to_numpy()
+    table = periods.streaks(habits_df[has_logs], logs_df)
+    streak_data = [
+        {'habit': habit_name, 'current_streak': int(streak), 'unit': unit}
+        for habit_name, streak, unit in zip(habits_df['name'][has_logs], table['current_streak'], table['unit'])
+    ]
 
     if not streak_data:
         # Create an empty figure if no streak data
@@ -361,13 +288,14 @@ def create_streak_chart(habits_df, logs_df):
         y='current_streak',
         color='current_streak',
         color_continuous_scale=[(0, "lightblue"), (1, "darkblue")],
-        labels={'current_streak': 'Current Streak (Days)', 'habit': 'Habit'},
-        title="Current Habit Streaks"
+        labels={'current_streak': 'Current Streak (Periods)', 'habit': 'Habit'},
+        title="Current Habit Streaks",
+        custom_data=['unit']
     )
 
     # Add hover information
     fig.update_traces(
-        hovertemplate='<b>Habit:</b> %{x}<br><b>Current Streak:</b> %{y} days'
+        hovertemplate='<b>Habit:</b> %{x}<br><b>Current Streak:</b> %{y} %{customdata[0]}(s)'
     )
 
     # Update layout
@@ -376,3 +304,236 @@ def create_streak_chart(habits_df, logs_df):
     )
 
     return fig
+
+
+@profiling.timed
+def create_correlation_heatmap(habits_df, logs_df, start_date, end_date):
+    """
+    Create a heatmap of how often each pair of habits is completed on the same days
+    Blue pairs tend to be completed together, red ones are traded off against each other
+    """
+    if len(habits_df) < 2 or logs_df.empty:
+        # Create an empty figure if there is nothing to compare
+        fig = go.Figure()
+        fig.update_layout(
+            title="Add at least two habits to compare them",
+            xaxis_title="Habit",
+            yaxis_title="Habit"
+        )
+        return fig
+
+    correlation, lift, together = utils.get_co_completion(habits_df, logs_df, start_date, end_date)
+    names = habits_df['name'].tolist()
+
+    fig = go.Figure(go.Heatmap(
+        z=correlation.to_numpy(),
+        x=names,
+        y=names,
+        zmin=-1,
+        zmax=1,
+        zmid=0,
+        colorscale='RdBu',
+        colorbar={'title': 'Correlation'},
+        customdata=np.dstack([lift.to_numpy(), together.to_numpy()]),
+        hovertemplate='<b>%{y}</b> and <b>%{x}</b><br>Correlation: %{z:.2f}<br>'
+                      'Lift: %{customdata[0]:.2f}<br>Completed together: %{customdata[1]} days<extra></extra>'
+    ))
+
+    # Keep cells readable as the number of habits grows
+    fig.update_layout(
+        title="Habits Completed Together",
+        xaxis={'type': 'category', 'tickangle': -45},
+        yaxis={'type': 'category', 'autorange': 'reversed'},
+        height=min(max(400, 22 * len(names) + 150), 1600)
+    )
+
+    return fig
+
+
+@profiling.timed
+def create_pattern_heatmap(habits_df, logs_df, start_date, end_date, by='name'):
+    """
+    Create side-by-side heatmaps of completion rate by weekday and by month of the year,
+    one row per habit (by='name') or per category (by='category')
+    """
+    if habits_df.empty or logs_df.empty:
+        # Create an empty figure if no data
+        fig = go.Figure()
+        fig.update_layout(
+            title="No data available for completion patterns",
+            xaxis_title="Day",
+            yaxis_title="Habit"
+        )
+        return fig
+
+    weekday_rates, month_rates = utils.get_completion_patterns(habits_df, logs_df, start_date, end_date, by)
+    rows = [str(label) for label in weekday_rates.index]
+
+    fig = make_subplots(rows=1, cols=2, column_widths=[7, 12], shared_yaxes=True, horizontal_spacing=0.03,
+                        subplot_titles=("By Weekday", "By Month"))
+    for col, rates in enumerate([weekday_rates, month_rates], start=1):
+        fig.add_trace(go.Heatmap(
+            z=rates.to_numpy(),
+            x=list(rates.columns),
+            y=rows,
+            zmin=0,
+            zmax=100,
+            colorscale='Viridis',
+            showscale=col == 2,
+            colorbar={'title': 'Completion %'},
+            hovertemplate='<b>%{y}</b><br>%{x}: %{z:.1f}%<extra></extra>'
+        ), row=1, col=col)
+
+    fig.update_xaxes(type='category')
+    fig.update_yaxes(type='category', autorange='reversed')
+    fig.update_layout(
+        title="Completion Patterns",
+        height=min(max(300, 22 * len(rows) + 150), 1600)
+    )
+
+    return fig
+
+
+def _category_rates(rollup_df, keys):
+    """
+    Sum a category rollup (see DataStore.category_rollup) over keys and add the rate (%):
+    occurrences completed out of those due, as in the other completion views
+    """
+    totals = rollup_df.groupby(keys, as_index=False)[['completed', 'expected']].sum()
+    totals['rate'] = totals['completed'] / totals['expected'] * 100
+    return totals
+
+
+@profiling.timed
+def create_category_trend(rollup_df):
+    """
+    Create a line chart of each category's completion rate over time from a category rollup
+    Ranges longer than three months are shown by week
+    """
+    if rollup_df.empty:
+        # Create an empty figure if no data
+        fig = go.Figure()
+        fig.update_layout(
+            title="No data available for category trends",
+            xaxis_title="Date",
+            yaxis_title="Completion Rate (%)"
+        )
+        return fig
+
+    dates = pd.to_datetime(rollup_df['date'])
+    if (dates.max() - dates.min()).days > 90:
+        # Monday of each week
+        dates = dates - pd.to_timedelta(dates.dt.weekday, unit='D')
+    trend_df = _category_rates(rollup_df.assign(date=dates), ['category', 'date'])
+
+    fig = px.line(
+        trend_df,
+        x='date',
+        y='rate',
+        color='category',
+        markers=True,
+        custom_data=['completed', 'expected'],
+        labels={'date': 'Date', 'rate': 'Completion Rate (%)', 'category': 'Category'},
+        title="Completion Rate by Category"
+    )
+    fig.update_traces(hovertemplate='%{x|%b %d, %Y}<br>%{y:.1f}% (%{customdata[0]}/%{customdata[1]} due)')
+    fig.update_layout(yaxis_range=[0, 105])
+
+    return fig
+
+
+@profiling.timed
+def create_category_comparison(rollup_df):
+    """
+    Create a bar chart comparing the completion rate of each category over a category rollup
+    """
+    if rollup_df.empty:
+        # Create an empty figure if no data
+        fig = go.Figure()
+        fig.update_layout(
+            title="No data available for category comparison",
+            xaxis_title="Category",
+            yaxis_title="Completion Rate (%)"
+        )
+        return fig
+
+    comparison_df = _category_rates(rollup_df, ['category'])
+
+    fig = px.bar(
+        comparison_df,
+        x='category',
+        y='rate',
+        color='rate',
+        color_continuous_scale='Viridis',
+        custom_data=['completed', 'expected'],
+        labels={'category': 'Category', 'rate': 'Completion Rate (%)'},
+        title="Category Comparison"
+    )
+    fig.update_traces(hovertemplate='<b>%{x}</b><br>%{y:.1f}% (%{customdata[0]}/%{customdata[1]} due)')
+    fig.update_layout(
+        xaxis={'categoryorder': 'total descending'},
+        yaxis_range=[0, 105]
+    )
+
+    return fig
+
+
+@profiling.timed
+def create_value_trend(habits_df, logs_df, start_date, end_date):
+    """
+    Create a line chart of the values logged for measured habits, one line per habit, with
+    each habit's target as a dashed line in the same color
+    """
+    start = pd.Timestamp(start_date).strftime('%Y-%m-%d')
+    end = pd.Timestamp(end_date).strftime('%Y-%m-%d')
+    measured = logs_df.iloc[:0]
+    if 'value' in logs_df.columns:
+        measured = logs_df[logs_df['value'].notna()]
+        measured = measured[(measured['date'] >= start) & (measured['date'] <= end)]
+
+    habits = habits_df.assign(target=utils.habit_targets(habits_df))
+    habits = habits[habits['id'].isin(measured['habit_id'].astype(str).unique())]
+    if habits.empty:
+        # Create an empty figure if no data
+        fig = go.Figure()
+        fig.update_layout(
+            title="No measured values logged in this range",
+            xaxis_title="Date",
+            yaxis_title="Value"
+        )
+        return fig
+
+    measures = habits['measure'] if 'measure' in habits.columns else pd.Series('', index=habits.index)
+    by_habit = dict(tuple(measured.sort_values('date').groupby(measured['habit_id'].astype(str), sort=False)))
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for i, (habit_id, name, target, measure) in enumerate(
+            zip(habits['id'], habits['name'], habits['target'], measures.fillna(''))):
+        habit_logs = by_habit[habit_id]
+        color = colors[i % len(colors)]
+        fig.add_trace(go.Scatter(
+            x=pd.to_datetime(habit_logs['date']),
+            y=habit_logs['value'],
+            mode='lines+markers',
+            name=name,
+            line={'color': color},
+            hovertemplate=f'<b>{name}</b><br>%{{x|%b %d}}: %{{y:g}} {measure}<extra></extra>'
+        ))
+        if not np.isnan(target):
+            fig.add_trace(go.Scatter(
+                x=pd.to_datetime([start, end]),
+                y=[target, target],
+                mode='lines',
+                name=f"{name} target",
+                line={'color': color, 'dash': 'dash', 'width': 1},
+                hovertemplate=f'<b>{name}</b> target: {target:g} {measure}<extra></extra>'
+            ))
+
+    fig.update_layout(
+        title="Measured Values",
+        xaxis_title="Date",
+        yaxis_title="Value",
+        height=400
+    )
+
+    return fig